@@ -18,13 +18,17 @@ __version__ = "1.13.0.dev0"
 
 from .agent_types import *  # noqa: I001
 from .agents import *  # Above noqa avoids a circular dependency due to cli.py
+from .cache import *
 from .default_tools import *
 from .gradio_ui import *
+from .http_client import *
 from .local_python_executor import *
 from .memory import *
 from .models import *
 from .monitoring import *
+from .process_pool_executor import *
 from .remote_executors import *
+from .tool_supervisor import *
 from .tools import *
 from .utils import *
 from .cli import *
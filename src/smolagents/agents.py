@@ -14,6 +14,7 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import importlib
 import inspect
 import json
@@ -21,11 +22,29 @@ import os
 import re
 import tempfile
 import textwrap
+import threading
 import time
+import warnings
 from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait
+from contextlib import nullcontext
+from functools import partial
 from logging import getLogger
 from pathlib import Path
-from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, List, Optional, Set, Tuple, TypedDict, Union
+from typing import (
+    TYPE_CHECKING,
+    Any,
+    AsyncGenerator,
+    Callable,
+    Dict,
+    Generator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    TypedDict,
+    Union,
+)
 
 import jinja2
 import yaml
@@ -42,12 +61,20 @@ if TYPE_CHECKING:
 
 from .agent_types import AgentAudio, AgentImage, AgentType, handle_agent_output_types
 from .default_tools import TOOL_MAPPING, FinalAnswerTool
-from .local_python_executor import BASE_BUILTIN_MODULES, LocalPythonExecutor, PythonExecutor, fix_final_answer_code
+from .local_python_executor import (
+    BASE_BUILTIN_MODULES,
+    LocalPythonExecutor,
+    PythonExecutor,
+    SpeculativeExecution,
+    fix_final_answer_code,
+)
 from .memory import ActionStep, AgentMemory, FinalAnswerStep, PlanningStep, SystemPromptStep, TaskStep, ToolCall
 from .models import (
     ChatMessage,
+    ChatMessageStreamDelta,
     MessageRole,
     Model,
+    agglomerate_stream_deltas,
 )
 from .monitoring import (
     YELLOW_HEX,
@@ -55,7 +82,9 @@ from .monitoring import (
     LogLevel,
     Monitor,
 )
+from .process_pool_executor import ProcessPoolPythonExecutor
 from .remote_executors import DockerExecutor, E2BExecutor
+from .tool_supervisor import ToolSupervisor
 from .tools import Tool
 from .utils import (
     AgentError,
@@ -188,6 +217,11 @@ class MultiStepAgent:
         description (`str`, *optional*): Necessary for a managed agent only - the description of this agent.
         provide_run_summary (`bool`, *optional*): Whether to provide a run summary when called as a managed agent.
         final_answer_checks (`list`, *optional*): List of Callables to run before returning a final answer for checking validity.
+        stream_outputs (`bool`, default `False`): Whether to stream the model outputs token by token with
+            `Model.generate_stream`: when running with `run(stream=True)`, the [`ChatMessageStreamDelta`] of each step
+            are yielded as they are generated, before the step itself.
+        tool_supervisor ([`ToolSupervisor`], *optional*): Supervisor of the tool calls, which enforces their timeouts
+            and the circuit breakers of the tools. Its decisions are recorded in the `tool_call_records` of each step.
     """
 
     def __init__(
@@ -206,7 +240,11 @@ class MultiStepAgent:
         description: Optional[str] = None,
         provide_run_summary: bool = False,
         final_answer_checks: Optional[List[Callable]] = None,
+        stream_outputs: bool = False,
+        tool_supervisor: Optional[ToolSupervisor] = None,
     ):
+        if stream_outputs and not hasattr(model, "generate_stream"):
+            raise ValueError("`stream_outputs` is set, but the model does not implement `generate_stream`.")
         self.agent_name = self.__class__.__name__
         self.model = model
         self.prompt_templates = prompt_templates or EMPTY_PROMPT_TEMPLATES
@@ -219,6 +257,8 @@ class MultiStepAgent:
         self.description = description
         self.provide_run_summary = provide_run_summary
         self.final_answer_checks = final_answer_checks
+        self.stream_outputs = stream_outputs
+        self.tool_supervisor = tool_supervisor
 
         self._setup_managed_agents(managed_agents)
         self._setup_tools(tools, add_base_tools)
@@ -229,7 +269,7 @@ class MultiStepAgent:
         self.task = None
         self.memory = AgentMemory(self.system_prompt)
         self.logger = AgentLogger(level=verbosity_level)
-        self.monitor = Monitor(self.model, self.logger)
+        self.monitor = Monitor(self.model, self.logger, tracked_tools=self.tools)
         self.step_callbacks = step_callbacks if step_callbacks is not None else []
         self.step_callbacks.append(self.monitor.update_metrics)
 
@@ -285,7 +325,8 @@ class MultiStepAgent:
 
         Args:
             task (`str`): Task to perform.
-            stream (`bool`): Whether to run in a streaming way.
+            stream (`bool`): Whether to run in a streaming way: the steps are yielded as they are executed, preceded by
+                the deltas of the model outputs if the agent was created with `stream_outputs=True`.
             reset (`bool`): Whether to reset the conversation or keep it going from previous run.
             images (`list[PIL.Image.Image]`, *optional*): Image(s) objects.
             additional_args (`dict`, *optional*): Any other variables that you want to pass to the agent run, for instance images or dataframes. Give them clear names!
@@ -299,6 +340,66 @@ class MultiStepAgent:
         ```
         """
         max_steps = max_steps or self.max_steps
+        self._setup_run(task, reset=reset, images=images, additional_args=additional_args)
+        if stream:
+            # The steps are returned as they are executed through a generator to iterate on.
+            return self._run(task=self.task, max_steps=max_steps, images=images)
+        # Outputs are returned only at the end. We only look at the last step.
+        return deque(self._run(task=self.task, max_steps=max_steps, images=images), maxlen=1)[0].final_answer
+
+    def arun(
+        self,
+        task: str,
+        stream: bool = False,
+        reset: bool = True,
+        images: Optional[List["PIL.Image.Image"]] = None,
+        additional_args: Optional[Dict] = None,
+        max_steps: Optional[int] = None,
+    ):
+        """
+        Run the agent for the given task in an asyncio event loop.
+
+        The model is awaited through `Model.acall`, tools with an async `forward` method are awaited directly and other
+        tools run in the bounded thread pool of the event loop, so that many agents can run concurrently in one loop.
+
+        Args:
+            task (`str`): Task to perform.
+            stream (`bool`): Whether to run in a streaming way.
+            reset (`bool`): Whether to reset the conversation or keep it going from previous run.
+            images (`list[PIL.Image.Image]`, *optional*): Image(s) objects.
+            additional_args (`dict`, *optional*): Any other variables that you want to pass to the agent run, for instance images or dataframes. Give them clear names!
+            max_steps (`int`, *optional*): Maximum number of steps the agent can take to solve the task. if not provided, will use the agent's default value.
+
+        Returns:
+            An async generator of the steps if `stream` is `True`, else an awaitable of the final answer.
+
+        Example:
+        ```py
+        from smolagents import CodeAgent
+        agent = CodeAgent(tools=[])
+        await agent.arun("What is the result of 2 power 3.7384?")
+        ```
+        """
+        max_steps = max_steps or self.max_steps
+        self._setup_run(task, reset=reset, images=images, additional_args=additional_args)
+        steps = self._arun(task=self.task, max_steps=max_steps, images=images)
+        if stream:
+            return steps
+
+        async def get_final_answer():
+            async for step in steps:
+                final_step = step
+            return final_step.final_answer
+
+        return get_final_answer()
+
+    def _setup_run(
+        self,
+        task: str,
+        reset: bool,
+        images: Optional[List["PIL.Image.Image"]],
+        additional_args: Optional[Dict],
+    ):
         self.task = task
         if additional_args is not None:
             self.state.update(additional_args)
@@ -311,6 +412,8 @@ You have been provided with these additional arguments, that you can access usin
         if reset:
             self.memory.reset()
             self.monitor.reset()
+            if isinstance(self.model, Model):
+                self.model.reset()
 
         self.logger.log_task(
             content=self.task.strip(),
@@ -322,17 +425,20 @@ You have been provided with these additional arguments, that you can access usin
 
         if getattr(self, "python_executor", None):
             self.python_executor.send_variables(variables=self.state)
-            self.python_executor.send_tools({**self.tools, **self.managed_agents})
-
-        if stream:
-            # The steps are returned as they are executed through a generator to iterate on.
-            return self._run(task=self.task, max_steps=max_steps, images=images)
-        # Outputs are returned only at the end. We only look at the last step.
-        return deque(self._run(task=self.task, max_steps=max_steps, images=images), maxlen=1)[0].final_answer
+            self.python_executor.send_tools(self._supervise_tools({**self.tools, **self.managed_agents}))
+
+    def _supervise_tools(self, tools: Dict[str, Any]) -> Dict[str, Any]:
+        """Wraps the tools and managed agents, except `final_answer`, so that their calls are supervised."""
+        if self.tool_supervisor is None:
+            return tools
+        return {
+            name: tool if name == "final_answer" else self.tool_supervisor.wrap(name, tool)
+            for name, tool in tools.items()
+        }
 
     def _run(
         self, task: str, max_steps: int, images: List["PIL.Image.Image"] | None = None
-    ) -> Generator[ActionStep | AgentType, None, None]:
+    ) -> Generator[ActionStep | ChatMessageStreamDelta | AgentType, None, None]:
         final_answer = None
         self.step_number = 1
         while final_answer is None and self.step_number <= max_steps:
@@ -345,7 +451,7 @@ You have been provided with these additional arguments, that you can access usin
                 yield planning_step
             action_step = self._create_action_step(step_start_time, images)
             try:
-                final_answer = self._execute_step(task, action_step)
+                final_answer = yield from self._execute_step(task, action_step)
             except AgentGenerationError as e:
                 # Agent generation errors are not caused by a Model error but an implementation error: so we should raise them and exit.
                 raise e
@@ -362,12 +468,54 @@ You have been provided with these additional arguments, that you can access usin
             yield action_step
         yield FinalAnswerStep(handle_agent_output_types(final_answer))
 
+    async def _arun(
+        self, task: str, max_steps: int, images: List["PIL.Image.Image"] | None = None
+    ) -> AsyncGenerator[ActionStep | AgentType, None]:
+        """Asynchronous version of `_run`."""
+        final_answer = None
+        self.step_number = 1
+        while final_answer is None and self.step_number <= max_steps:
+            step_start_time = time.time()
+            if self.planning_interval is not None and self.step_number % self.planning_interval == 1:
+                planning_step = await self._acreate_planning_step(
+                    task, is_first_step=(self.step_number == 1), step=self.step_number
+                )
+                self.memory.steps.append(planning_step)
+                yield planning_step
+            action_step = self._create_action_step(step_start_time, images)
+            try:
+                final_answer = await self._aexecute_step(task, action_step)
+            except AgentGenerationError as e:
+                raise e
+            except AgentError as e:
+                action_step.error = e
+            finally:
+                self._finalize_step(action_step, step_start_time)
+                yield action_step
+                self.step_number += 1
+
+        if final_answer is None and self.step_number == max_steps + 1:
+            final_answer = await self.aprovide_final_answer(task, images)
+            self._record_max_steps_reached(final_answer, step_start_time)
+            yield action_step
+        yield FinalAnswerStep(handle_agent_output_types(final_answer))
+
     def _create_action_step(self, step_start_time: float, images: List["PIL.Image.Image"] | None) -> ActionStep:
         return ActionStep(step_number=self.step_number, start_time=step_start_time, observations_images=images)
 
-    def _execute_step(self, task: str, memory_step: ActionStep) -> Union[None, Any]:
+    def _execute_step(self, task: str, memory_step: ActionStep) -> Generator[ChatMessageStreamDelta, None, Any]:
         self.logger.log_rule(f"Step {self.step_number}", level=LogLevel.INFO)
-        final_answer = self.step(memory_step)
+        if self.stream_outputs:
+            final_answer = yield from self._step_stream(memory_step)
+        else:
+            final_answer = self.step(memory_step)
+        if final_answer is not None and self.final_answer_checks:
+            self._validate_final_answer(final_answer)
+        return final_answer
+
+    async def _aexecute_step(self, task: str, memory_step: ActionStep) -> Union[None, Any]:
+        self.logger.log_rule(f"Step {self.step_number}", level=LogLevel.INFO)
+        final_answer = await self.astep(memory_step)
         if final_answer is not None and self.final_answer_checks:
             self._validate_final_answer(final_answer)
         return final_answer
@@ -382,6 +530,8 @@ You have been provided with these additional arguments, that you can access usin
     def _finalize_step(self, memory_step: ActionStep, step_start_time: float):
         memory_step.end_time = time.time()
         memory_step.duration = memory_step.end_time - step_start_time
+        if self.tool_supervisor is not None:
+            memory_step.tool_call_records = self.tool_supervisor.pop_records()
         self.memory.steps.append(memory_step)
         for callback in self.step_callbacks:
             # For compatibility with old callbacks that don't take the agent as an argument
@@ -391,6 +541,10 @@ You have been provided with these additional arguments, that you can access usin
 
     def _handle_max_steps_reached(self, task: str, images: List["PIL.Image.Image"], step_start_time: float) -> Any:
         final_answer = self.provide_final_answer(task, images)
+        self._record_max_steps_reached(final_answer, step_start_time)
+        return final_answer
+
+    def _record_max_steps_reached(self, final_answer: Any, step_start_time: float):
         final_memory_step = ActionStep(
             step_number=self.step_number, error=AgentMaxStepsError("Reached max steps.", self.logger)
         )
@@ -402,9 +556,18 @@ You have been provided with these additional arguments, that you can access usin
             callback(final_memory_step) if len(inspect.signature(callback).parameters) == 1 else callback(
                 final_memory_step, agent=self
             )
-        return final_answer
 
     def _create_planning_step(self, task, is_first_step: bool, step: int) -> PlanningStep:
+        input_messages = self._get_planning_messages(task, is_first_step, step)
+        plan_message = self.model(input_messages, stop_sequences=["<end_plan>"])
+        return self._make_planning_step(input_messages, plan_message, is_first_step)
+
+    async def _acreate_planning_step(self, task, is_first_step: bool, step: int) -> PlanningStep:
+        input_messages = self._get_planning_messages(task, is_first_step, step)
+        plan_message = await self._acall_model(input_messages, stop_sequences=["<end_plan>"])
+        return self._make_planning_step(input_messages, plan_message, is_first_step)
+
+    def _get_planning_messages(self, task, is_first_step: bool, step: int) -> List[Dict[str, Any]]:
         if is_first_step:
             input_messages = [
                 {
@@ -420,10 +583,6 @@ You have been provided with these additional arguments, that you can access usin
                     ],
                 }
             ]
-            plan_message = self.model(input_messages, stop_sequences=["<end_plan>"])
-            plan = textwrap.dedent(
-                f"""Here are the facts I know and the plan of action that I will follow to solve the task:\n```\n{plan_message.content}\n```"""
-            )
         else:
             # Summary mode removes the system prompt and previous planning messages output by the model.
             # Removing previous planning messages avoids influencing too much the new plan.
@@ -457,7 +616,16 @@ You have been provided with these additional arguments, that you can access usin
                 ],
             }
             input_messages = [plan_update_pre] + memory_messages + [plan_update_post]
-            plan_message = self.model(input_messages, stop_sequences=["<end_plan>"])
+        return input_messages
+
+    def _make_planning_step(
+        self, input_messages: List[Dict[str, Any]], plan_message: ChatMessage, is_first_step: bool
+    ) -> PlanningStep:
+        if is_first_step:
+            plan = textwrap.dedent(
+                f"""Here are the facts I know and the plan of action that I will follow to solve the task:\n```\n{plan_message.content}\n```"""
+            )
+        else:
             plan = textwrap.dedent(
                 f"""I still need to solve the task I was given:\n```\n{self.task}\n```\n\nHere are the facts I know and my new/updated plan of action to solve the task:\n```\n{plan_message.content}\n```"""
             )
@@ -488,11 +656,10 @@ You have been provided with these additional arguments, that you can access usin
         Reads past llm_outputs, actions, and observations or errors from the memory into a series of messages
         that can be used as input to the LLM. Adds a number of keywords (such as PLAN, error, etc) to help
         the LLM.
+        The messages of each step are cached in memory, so only new or modified steps are rendered again. The
+        returned list is new, but the messages in it are shared with the cache and should not be modified in place.
         """
-        messages = self.memory.system_prompt.to_messages(summary_mode=summary_mode)
-        for memory_step in self.memory.steps:
-            messages.extend(memory_step.to_messages(summary_mode=summary_mode))
-        return messages
+        return self.memory.get_messages(summary_mode=bool(summary_mode))
 
     def visualize(self):
         """Creates a rich tree visualization of the agent's structure."""
@@ -530,6 +697,23 @@ You have been provided with these additional arguments, that you can access usin
         Returns:
             `str`: Final answer to the task.
         """
+        messages = self._get_final_answer_messages(task, images)
+        try:
+            chat_message: ChatMessage = self.model(messages)
+            return chat_message.content
+        except Exception as e:
+            return f"Error in generating final LLM output:\n{e}"
+
+    async def aprovide_final_answer(self, task: str, images: Optional[list["PIL.Image.Image"]]) -> str:
+        """Asynchronous version of `provide_final_answer`."""
+        messages = self._get_final_answer_messages(task, images)
+        try:
+            chat_message: ChatMessage = await self._acall_model(messages)
+            return chat_message.content
+        except Exception as e:
+            return f"Error in generating final LLM output:\n{e}"
+
+    def _get_final_answer_messages(self, task: str, images: Optional[list["PIL.Image.Image"]]) -> List[Dict[str, Any]]:
         messages = [
             {
                 "role": MessageRole.SYSTEM,
@@ -557,16 +741,44 @@ You have been provided with these additional arguments, that you can access usin
                 ],
             }
         ]
-        try:
-            chat_message: ChatMessage = self.model(messages)
-            return chat_message.content
-        except Exception as e:
-            return f"Error in generating final LLM output:\n{e}"
+        return messages
 
     def step(self, memory_step: ActionStep) -> Union[None, Any]:
         """To be implemented in children classes. Should return either None if the step is not final."""
         pass
 
+    async def astep(self, memory_step: ActionStep) -> Union[None, Any]:
+        """
+        Asynchronous version of `step`. Children classes should override it to await the model and the tools:
+        by default, `step` is run in a separate thread.
+        """
+        return await asyncio.to_thread(self.step, memory_step)
+
+    def _step_stream(self, memory_step: ActionStep) -> Generator[ChatMessageStreamDelta, None, Any]:
+        """
+        Streaming version of `step`: yields the deltas of the model output as they are generated, then returns what
+        `step` returns. Children classes should override it to stream the model: by default, `step` is run as is.
+        """
+        final_answer = self.step(memory_step)
+        yield from ()  # Makes this method a generator
+        return final_answer
+
+    def _stream_model(
+        self, messages: List[Dict[str, Any]], tools_to_call_from: Optional[List[Tool]] = None, **kwargs
+    ) -> Generator[ChatMessageStreamDelta, None, ChatMessage]:
+        """Yields the deltas streamed by the model with `Model.generate_stream`, then returns the complete message."""
+        deltas = []
+        for delta in self.model.generate_stream(messages, tools_to_call_from=tools_to_call_from, **kwargs):
+            deltas.append(delta)
+            yield delta
+        return self.model.postprocess_message(agglomerate_stream_deltas(deltas), tools_to_call_from)
+
+    async def _acall_model(self, messages: List[Dict[str, Any]], **kwargs) -> ChatMessage:
+        """Awaits the model with `Model.acall`, or calls it in a separate thread if it is a plain callable."""
+        if hasattr(self.model, "acall"):
+            return await self.model.acall(messages, **kwargs)
+        return await asyncio.to_thread(self.model, messages, **kwargs)
+
     def replay(self, detailed: bool = False):
         """Prints a pretty replay of the agent's steps.
 
@@ -585,6 +797,18 @@ You have been provided with these additional arguments, that you can access usin
             variables=dict(name=self.name, task=task),
         )
         report = self.run(full_task, **kwargs)
+        return self._format_managed_agent_answer(report)
+
+    async def acall(self, task: str, **kwargs):
+        """Asynchronous version of `__call__`, used when the agent is managed by an agent run with `arun`."""
+        full_task = populate_template(
+            self.prompt_templates["managed_agent"]["task"],
+            variables=dict(name=self.name, task=task),
+        )
+        report = await self.arun(full_task, **kwargs)
+        return self._format_managed_agent_answer(report)
+
+    def _format_managed_agent_answer(self, report: Any) -> str:
         answer = populate_template(
             self.prompt_templates["managed_agent"]["report"], variables=dict(name=self.name, final_answer=report)
         )
@@ -721,7 +945,7 @@ You have been provided with these additional arguments, that you can access usin
             `dict`: Dictionary representation of the agent.
         """
         # TODO: handle serializing step_callbacks and final_answer_checks
-        for attr in ["final_answer_checks", "step_callbacks"]:
+        for attr in ["final_answer_checks", "step_callbacks", "tool_supervisor"]:
             if getattr(self, attr, None):
                 self.logger.log(f"This agent has {attr}: they will be ignored by this method.", LogLevel.INFO)
 
@@ -847,6 +1071,9 @@ You have been provided with these additional arguments, that you can access usin
             verbosity_level=agent_dict["verbosity_level"],
             prompt_templates=agent_dict["prompt_templates"],
         )
+        if cls.__name__ == "ToolCallingAgent":
+            args["max_tool_threads"] = agent_dict.get("max_tool_threads")
+            args["tool_call_timeout"] = agent_dict.get("tool_call_timeout")
         if cls.__name__ == "CodeAgent":
             args["additional_authorized_imports"] = agent_dict["authorized_imports"]
             args["executor_type"] = agent_dict.get("executor_type")
@@ -919,6 +1146,11 @@ class ToolCallingAgent(MultiStepAgent):
         model (`Callable[[list[dict[str, str]]], ChatMessage]`): Model that will generate the agent's actions.
         prompt_templates ([`~agents.PromptTemplates`], *optional*): Prompt templates.
         planning_interval (`int`, *optional*): Interval at which the agent will run a planning step.
+        max_tool_threads (`int`, *optional*): Maximum number of threads used to run the tool calls of a step in
+            parallel, when the model makes several tool calls at once. Defaults to the default number of workers of
+            `concurrent.futures.ThreadPoolExecutor`.
+        tool_call_timeout (`float`, *optional*): Maximum time in seconds to wait for each tool call, counted from the
+            moment the tool calls of the step are submitted. A tool call that exceeds it is reported as an error.
         **kwargs: Additional keyword arguments.
     """
 
@@ -928,11 +1160,15 @@ class ToolCallingAgent(MultiStepAgent):
         model: Callable[[List[Dict[str, str]]], ChatMessage],
         prompt_templates: Optional[PromptTemplates] = None,
         planning_interval: Optional[int] = None,
+        max_tool_threads: Optional[int] = None,
+        tool_call_timeout: Optional[float] = None,
         **kwargs,
     ):
         prompt_templates = prompt_templates or yaml.safe_load(
             importlib.resources.files("smolagents.prompts").joinpath("toolcalling_agent.yaml").read_text()
         )
+        self.max_tool_threads = max_tool_threads
+        self.tool_call_timeout = tool_call_timeout
         super().__init__(
             tools=tools,
             model=model,
@@ -953,15 +1189,43 @@ class ToolCallingAgent(MultiStepAgent):
         Perform one step in the ReAct framework: the agent thinks, acts, and observes the result.
         Returns None if the step is not final.
         """
-        memory_messages = self.write_memory_to_messages()
+        memory_messages = self._prepare_step_messages(memory_step)
+        try:
+            model_message: ChatMessage = self.model(
+                memory_messages,
+                tools_to_call_from=list(self.tools.values()),
+                stop_sequences=["Observation:", "Calling tools:"],
+            )
+            memory_step.model_output_message = model_message
+        except Exception as e:
+            raise AgentGenerationError(f"Error in generating tool call with model:\n{e}", self.logger) from e
 
-        self.input_messages = memory_messages
+        tool_calls = self._parse_tool_calls(memory_step, model_message)
+        outputs = self._execute_tool_calls([tool_call for tool_call in tool_calls if tool_call.name != "final_answer"])
+        return self._process_tool_call_outputs(memory_step, tool_calls, outputs)
 
-        # Add new step in logs
-        memory_step.model_input_messages = memory_messages.copy()
+    def _step_stream(self, memory_step: ActionStep) -> Generator[ChatMessageStreamDelta, None, Any]:
+        """Streaming version of `step`: the model output is yielded as it is generated."""
+        memory_messages = self._prepare_step_messages(memory_step)
+        try:
+            model_message: ChatMessage = yield from self._stream_model(
+                memory_messages,
+                tools_to_call_from=list(self.tools.values()),
+                stop_sequences=["Observation:", "Calling tools:"],
+            )
+            memory_step.model_output_message = model_message
+        except Exception as e:
+            raise AgentGenerationError(f"Error in generating tool call with model:\n{e}", self.logger) from e
 
+        tool_calls = self._parse_tool_calls(memory_step, model_message)
+        outputs = self._execute_tool_calls([tool_call for tool_call in tool_calls if tool_call.name != "final_answer"])
+        return self._process_tool_call_outputs(memory_step, tool_calls, outputs)
+
+    async def astep(self, memory_step: ActionStep) -> Union[None, Any]:
+        """Asynchronous version of `step`, awaiting the model and the tool."""
+        memory_messages = self._prepare_step_messages(memory_step)
         try:
-            model_message: ChatMessage = self.model(
+            model_message: ChatMessage = await self._acall_model(
                 memory_messages,
                 tools_to_call_from=list(self.tools.values()),
                 stop_sequences=["Observation:", "Calling tools:"],
@@ -970,6 +1234,22 @@ class ToolCallingAgent(MultiStepAgent):
         except Exception as e:
             raise AgentGenerationError(f"Error in generating tool call with model:\n{e}", self.logger) from e
 
+        tool_calls = self._parse_tool_calls(memory_step, model_message)
+        outputs = await self._aexecute_tool_calls(
+            [tool_call for tool_call in tool_calls if tool_call.name != "final_answer"]
+        )
+        return self._process_tool_call_outputs(memory_step, tool_calls, outputs)
+
+    def _prepare_step_messages(self, memory_step: ActionStep) -> List[Dict[str, Any]]:
+        memory_messages = self.write_memory_to_messages()
+
+        self.input_messages = memory_messages
+
+        # Add new step in logs
+        memory_step.model_input_messages = memory_messages
+        return memory_messages
+
+    def _parse_tool_calls(self, memory_step: ActionStep, model_message: ChatMessage) -> List[ToolCall]:
         self.logger.log_markdown(
             content=model_message.content if model_message.content else str(model_message.raw),
             title="Output message of the LLM:",
@@ -981,64 +1261,169 @@ class ToolCallingAgent(MultiStepAgent):
                 "Model did not call any tools. Call `final_answer` tool to return a final answer.", self.logger
             )
 
-        tool_call = model_message.tool_calls[0]
-        tool_name, tool_call_id = tool_call.function.name, tool_call.id
-        tool_arguments = tool_call.function.arguments
+        memory_step.tool_calls = [
+            ToolCall(name=tool_call.function.name, arguments=tool_call.function.arguments, id=tool_call.id)
+            for tool_call in model_message.tool_calls
+        ]
+        for tool_call in memory_step.tool_calls:
+            self.logger.log(
+                Panel(Text(f"Calling tool: '{tool_call.name}' with arguments: {tool_call.arguments}")),
+                level=LogLevel.INFO,
+            )
+        return memory_step.tool_calls
 
-        memory_step.tool_calls = [ToolCall(name=tool_name, arguments=tool_arguments, id=tool_call_id)]
+    def _execute_tool_calls(self, tool_calls: List[ToolCall]) -> List[Any]:
+        """
+        Executes the tool calls, in parallel if there are several of them. Returns the output of each call, or the
+        error it raised. Calls to the same managed agent run one after the other, since they share its memory.
+        """
+        if not tool_calls:
+            return []
+        if len(tool_calls) == 1 and self.tool_call_timeout is None:
+            try:
+                return [self.execute_tool_call(tool_calls[0].name, tool_calls[0].arguments or {})]
+            except AgentError as e:
+                return [e]
 
-        # Execute
-        self.logger.log(
-            Panel(Text(f"Calling tool: '{tool_name}' with arguments: {tool_arguments}")),
-            level=LogLevel.INFO,
-        )
-        if tool_name == "final_answer":
-            if isinstance(tool_arguments, dict):
-                if "answer" in tool_arguments:
-                    answer = tool_arguments["answer"]
+        managed_agent_locks = {
+            tool_call.name: threading.Lock() for tool_call in tool_calls if tool_call.name in self.managed_agents
+        }
+
+        def execute_tool_call(tool_call: ToolCall) -> Any:
+            with managed_agent_locks.get(tool_call.name, nullcontext()):
+                return self.execute_tool_call(tool_call.name, tool_call.arguments or {})
+
+        executor = ThreadPoolExecutor(max_workers=self.max_tool_threads)
+        try:
+            futures = [executor.submit(execute_tool_call, tool_call) for tool_call in tool_calls]
+            wait(futures, timeout=self.tool_call_timeout)
+            outputs = []
+            for tool_call, future in zip(tool_calls, futures):
+                if not future.done():
+                    future.cancel()
+                    outputs.append(self._get_tool_timeout_error(tool_call))
+                elif isinstance(future.exception(), AgentError):
+                    outputs.append(future.exception())
                 else:
-                    answer = tool_arguments
-            else:
-                answer = tool_arguments
-            if (
-                isinstance(answer, str) and answer in self.state.keys()
-            ):  # if the answer is a state variable, return the value
-                final_answer = self.state[answer]
-                self.logger.log(
-                    f"[bold {YELLOW_HEX}]Final answer:[/bold {YELLOW_HEX}] Extracting key '{answer}' from state to return value '{final_answer}'.",
-                    level=LogLevel.INFO,
-                )
+                    outputs.append(future.result())
+            return outputs
+        finally:
+            # Do not wait for the tool calls that timed out
+            executor.shutdown(wait=False, cancel_futures=True)
+
+    async def _aexecute_tool_calls(self, tool_calls: List[ToolCall]) -> List[Any]:
+        """Asynchronous version of `_execute_tool_calls`: the tool calls are awaited concurrently."""
+        managed_agent_locks = {
+            tool_call.name: asyncio.Lock() for tool_call in tool_calls if tool_call.name in self.managed_agents
+        }
+
+        async def run_tool_call(tool_call: ToolCall) -> Any:
+            async with managed_agent_locks.get(tool_call.name, nullcontext()):
+                return await self.aexecute_tool_call(tool_call.name, tool_call.arguments or {})
+
+        async def execute_tool_call(tool_call: ToolCall) -> Any:
+            try:
+                return await asyncio.wait_for(run_tool_call(tool_call), timeout=self.tool_call_timeout)
+            except asyncio.TimeoutError:
+                return self._get_tool_timeout_error(tool_call)
+            except AgentError as e:
+                return e
+
+        return await asyncio.gather(*(execute_tool_call(tool_call) for tool_call in tool_calls))
+
+    def _get_tool_timeout_error(self, tool_call: ToolCall) -> AgentToolExecutionError:
+        return AgentToolExecutionError(
+            f"Tool call '{tool_call.name}' with arguments {json.dumps(tool_call.arguments)} timed out after "
+            f"{self.tool_call_timeout} seconds. Please try again or use another tool",
+            self.logger,
+        )
+
+    def _process_tool_call_outputs(
+        self, memory_step: ActionStep, tool_calls: List[ToolCall], outputs: List[Any]
+    ) -> Union[None, Any]:
+        """
+        Records the observations of the executed tool calls in the memory step, then raises their errors if any.
+        Returns the final answer if the model called the `final_answer` tool.
+        """
+        executed_tool_calls = [tool_call for tool_call in tool_calls if tool_call.name != "final_answer"]
+        observations, errors = [], []
+        for tool_call, output in zip(executed_tool_calls, outputs):
+            if isinstance(output, AgentError):
+                errors.append(output)
             else:
-                final_answer = answer
-                self.logger.log(
-                    Text(f"Final answer: {final_answer}", style=f"bold {YELLOW_HEX}"),
-                    level=LogLevel.INFO,
-                )
+                observations.append((tool_call, self._process_observation(output)))
+        if len(tool_calls) == 1 and observations:
+            memory_step.observations = observations[0][1]
+        elif observations:
+            memory_step.observations = "\n\n".join(
+                f"Call id: {tool_call.id}\n{observation}" for tool_call, observation in observations
+            )
 
-            memory_step.action_output = final_answer
-            return final_answer
-        else:
-            if tool_arguments is None:
-                tool_arguments = {}
-            observation = self.execute_tool_call(tool_name, tool_arguments)
-            observation_type = type(observation)
-            if observation_type in [AgentImage, AgentAudio]:
-                if observation_type == AgentImage:
-                    observation_name = "image.png"
-                elif observation_type == AgentAudio:
-                    observation_name = "audio.mp3"
-                # TODO: observation naming could allow for different names of same type
-
-                self.state[observation_name] = observation
-                updated_information = f"Stored '{observation_name}' in memory."
+        if len(errors) == 1:
+            raise errors[0]
+        elif errors:
+            raise AgentToolExecutionError("\n".join(str(error) for error in errors), self.logger)
+
+        for tool_call in tool_calls:
+            if tool_call.name == "final_answer":
+                return self._get_final_answer_from_arguments(memory_step, tool_call.arguments)
+        return None
+
+    def _get_final_answer_from_arguments(self, memory_step: ActionStep, tool_arguments: Any) -> Any:
+        if isinstance(tool_arguments, dict):
+            if "answer" in tool_arguments:
+                answer = tool_arguments["answer"]
             else:
-                updated_information = str(observation).strip()
+                answer = tool_arguments
+        else:
+            answer = tool_arguments
+        if (
+            isinstance(answer, str) and answer in self.state.keys()
+        ):  # if the answer is a state variable, return the value
+            final_answer = self.state[answer]
             self.logger.log(
-                f"Observations: {updated_information.replace('[', '|')}",  # escape potential rich-tag-like components
+                f"[bold {YELLOW_HEX}]Final answer:[/bold {YELLOW_HEX}] Extracting key '{answer}' from state to return value '{final_answer}'.",
                 level=LogLevel.INFO,
             )
-            memory_step.observations = updated_information
-            return None
+        else:
+            final_answer = answer
+            self.logger.log(
+                Text(f"Final answer: {final_answer}", style=f"bold {YELLOW_HEX}"),
+                level=LogLevel.INFO,
+            )
+
+        memory_step.action_output = final_answer
+        return final_answer
+
+    def _process_observation(self, observation: Any) -> str:
+        observation_type = type(observation)
+        if observation_type in [AgentImage, AgentAudio]:
+            if observation_type == AgentImage:
+                observation_name = "image.png"
+            elif observation_type == AgentAudio:
+                observation_name = "audio.mp3"
+            # TODO: observation naming could allow for different names of same type
+
+            self.state[observation_name] = observation
+            updated_information = f"Stored '{observation_name}' in memory."
+        else:
+            updated_information = str(observation).strip()
+        self.logger.log(
+            f"Observations: {updated_information.replace('[', '|')}",  # escape potential rich-tag-like components
+            level=LogLevel.INFO,
+        )
+        return updated_information
+
+    def to_dict(self) -> dict[str, Any]:
+        """Convert the agent to a dictionary representation.
+
+        Returns:
+            `dict`: Dictionary representation of the agent.
+        """
+        agent_dict = super().to_dict()
+        agent_dict["max_tool_threads"] = self.max_tool_threads
+        agent_dict["tool_call_timeout"] = self.tool_call_timeout
+        return agent_dict
 
     def _substitute_state_variables(self, arguments: Union[Dict[str, str], str]) -> Union[Dict[str, Any], str]:
         """Replace string values in arguments with their corresponding state values if they exist."""
@@ -1059,6 +1444,40 @@ class ToolCallingAgent(MultiStepAgent):
             tool_name (`str`): Name of the tool or managed agent to execute.
             arguments (dict[str, str] | str): Arguments passed to the tool call.
         """
+        tool, arguments, is_managed_agent = self._prepare_tool_call(tool_name, arguments)
+        try:
+            if self.tool_supervisor is not None:
+                self._check_tool_arguments(tool_name, tool, arguments)
+                return self.tool_supervisor.call(tool_name, self._call_tool, tool, arguments, is_managed_agent)
+            return self._call_tool(tool, arguments, is_managed_agent)
+        except Exception as e:
+            raise self._get_tool_call_error(e, tool_name, tool, arguments, is_managed_agent) from e
+
+    async def aexecute_tool_call(self, tool_name: str, arguments: Union[Dict[str, str], str]) -> Any:
+        """
+        Asynchronous version of `execute_tool_call`: tools with an async `forward` method and managed agents are
+        awaited, other tools are run in the thread pool of the event loop.
+        """
+        tool, arguments, is_managed_agent = self._prepare_tool_call(tool_name, arguments)
+        try:
+            if is_managed_agent:
+                call = tool.acall
+            else:
+                call = partial(tool.acall, sanitize_inputs_outputs=True)
+            if isinstance(arguments, dict):
+                call = partial(call, **arguments)
+            elif isinstance(arguments, str):
+                call = partial(call, arguments)
+            else:
+                raise TypeError(f"Unsupported arguments type: {type(arguments)}")
+            if self.tool_supervisor is not None:
+                self._check_tool_arguments(tool_name, tool, arguments)
+                return await self.tool_supervisor.acall(tool_name, call)
+            return await call()
+        except Exception as e:
+            raise self._get_tool_call_error(e, tool_name, tool, arguments, is_managed_agent) from e
+
+    def _prepare_tool_call(self, tool_name: str, arguments: Union[Dict[str, str], str]) -> Tuple[Any, Any, bool]:
         # Check if the tool exists
         available_tools = {**self.tools, **self.managed_agents}
         if tool_name not in available_tools:
@@ -1070,48 +1489,60 @@ class ToolCallingAgent(MultiStepAgent):
         tool = available_tools[tool_name]
         arguments = self._substitute_state_variables(arguments)
         is_managed_agent = tool_name in self.managed_agents
+        return tool, arguments, is_managed_agent
 
-        try:
-            # Call tool with appropriate arguments
-            if isinstance(arguments, dict):
-                return tool(**arguments) if is_managed_agent else tool(**arguments, sanitize_inputs_outputs=True)
-            elif isinstance(arguments, str):
-                return tool(arguments) if is_managed_agent else tool(arguments, sanitize_inputs_outputs=True)
-            else:
-                raise TypeError(f"Unsupported arguments type: {type(arguments)}")
+    def _call_tool(self, tool: Any, arguments: Union[Dict[str, Any], str], is_managed_agent: bool) -> Any:
+        # Call tool with appropriate arguments
+        if isinstance(arguments, dict):
+            return tool(**arguments) if is_managed_agent else tool(**arguments, sanitize_inputs_outputs=True)
+        elif isinstance(arguments, str):
+            return tool(arguments) if is_managed_agent else tool(arguments, sanitize_inputs_outputs=True)
+        else:
+            raise TypeError(f"Unsupported arguments type: {type(arguments)}")
 
-        except TypeError as e:
+    def _check_tool_arguments(self, tool_name: str, tool: Any, arguments: Union[Dict[str, Any], str]):
+        # Invalid arguments are a mistake of the model, so they must not open the circuit of the tool
+        if isinstance(arguments, dict):
+            self.tool_supervisor.check_arguments(tool_name, tool, **arguments)
+        elif isinstance(arguments, str):
+            self.tool_supervisor.check_arguments(tool_name, tool, arguments)
+        else:
+            raise TypeError(f"Unsupported arguments type: {type(arguments)}")
+
+    def _get_tool_call_error(
+        self, error: Exception, tool_name: str, tool: Any, arguments: Any, is_managed_agent: bool
+    ) -> AgentError:
+        if isinstance(error, TypeError):
             # Handle invalid arguments
             description = getattr(tool, "description", "No description")
             if is_managed_agent:
                 error_msg = (
-                    f"Invalid request to team member '{tool_name}' with arguments {json.dumps(arguments)}: {e}\n"
+                    f"Invalid request to team member '{tool_name}' with arguments {json.dumps(arguments)}: {error}\n"
                     "You should call this team member with a valid request.\n"
                     f"Team member description: {description}"
                 )
             else:
                 error_msg = (
-                    f"Invalid call to tool '{tool_name}' with arguments {json.dumps(arguments)}: {e}\n"
+                    f"Invalid call to tool '{tool_name}' with arguments {json.dumps(arguments)}: {error}\n"
                     "You should call this tool with correct input arguments.\n"
                     f"Expected inputs: {json.dumps(tool.inputs)}\n"
                     f"Returns output type: {tool.output_type}\n"
                     f"Tool description: '{description}'"
                 )
-            raise AgentToolCallError(error_msg, self.logger) from e
+            return AgentToolCallError(error_msg, self.logger)
 
-        except Exception as e:
-            # Handle execution errors
-            if is_managed_agent:
-                error_msg = (
-                    f"Error executing request to team member '{tool_name}' with arguments {json.dumps(arguments)}: {e}\n"
-                    "Please try again or request to another team member"
-                )
-            else:
-                error_msg = (
-                    f"Error executing tool '{tool_name}' with arguments {json.dumps(arguments)}: {type(e).__name__}: {e}\n"
-                    "Please try again or use another tool"
-                )
-            raise AgentToolExecutionError(error_msg, self.logger) from e
+        # Handle execution errors
+        if is_managed_agent:
+            error_msg = (
+                f"Error executing request to team member '{tool_name}' with arguments {json.dumps(arguments)}: {error}\n"
+                "Please try again or request to another team member"
+            )
+        else:
+            error_msg = (
+                f"Error executing tool '{tool_name}' with arguments {json.dumps(arguments)}: {type(error).__name__}: {error}\n"
+                "Please try again or use another tool"
+            )
+        return AgentToolExecutionError(error_msg, self.logger)
 
 
 class CodeAgent(MultiStepAgent):
@@ -1125,9 +1556,15 @@ class CodeAgent(MultiStepAgent):
         grammar (`dict[str, str]`, *optional*): Grammar used to parse the LLM output.
         additional_authorized_imports (`list[str]`, *optional*): Additional authorized imports for the agent.
         planning_interval (`int`, *optional*): Interval at which the agent will run a planning step.
-        executor_type (`str`, default `"local"`): Which executor type to use between `"local"`, `"e2b"`, or `"docker"`.
+        executor_type (`str`, default `"local"`): Which executor type to use between `"local"`, `"process_pool"`, `"e2b"`, or
+            `"docker"`.
         executor_kwargs (`dict`, *optional*): Additional arguments to pass to initialize the executor.
         max_print_outputs_length (`int`, *optional*): Maximum length of the print outputs.
+        speculative_execution (`bool`, default `False`): Whether to start running the complete top-level statements of
+            the code while the model is still generating the rest of it, to hide the latency of tools behind the
+            generation. Requires `stream_outputs=True` and the `"local"` executor. If the final code differs from the
+            statements already run, the variables they assigned are restored and the whole code is run again, but the
+            effects of the tools they called cannot be undone.
         **kwargs: Additional keyword arguments.
 
     """
@@ -1143,6 +1580,7 @@ class CodeAgent(MultiStepAgent):
         executor_type: str | None = "local",
         executor_kwargs: Optional[Dict[str, Any]] = None,
         max_print_outputs_length: Optional[int] = None,
+        speculative_execution: bool = False,
         **kwargs,
     ):
         self.additional_authorized_imports = additional_authorized_imports if additional_authorized_imports else []
@@ -1166,7 +1604,16 @@ class CodeAgent(MultiStepAgent):
             )
         self.executor_type = executor_type or "local"
         self.executor_kwargs = executor_kwargs or {}
+        if self.tool_supervisor is not None and self.executor_type not in ["local", "process_pool"]:
+            raise ValueError(
+                "`tool_supervisor` requires the local or process pool executor: remote executors run tools remotely."
+            )
         self.python_executor = self.create_python_executor()
+        if speculative_execution and not (
+            self.stream_outputs and isinstance(self.python_executor, LocalPythonExecutor)
+        ):
+            raise ValueError("`speculative_execution` requires `stream_outputs=True` and the local executor.")
+        self.speculative_execution = speculative_execution
 
     def create_python_executor(self) -> PythonExecutor:
         match self.executor_type:
@@ -1178,9 +1625,24 @@ class CodeAgent(MultiStepAgent):
                 else:
                     return DockerExecutor(self.additional_authorized_imports, self.logger, **self.executor_kwargs)
             case "local":
+                # The local executor used to ignore `executor_kwargs`, so the arguments it does not take are dropped
+                accepted_kwargs = inspect.signature(LocalPythonExecutor.__init__).parameters
+                unknown_kwargs = [key for key in self.executor_kwargs if key not in accepted_kwargs]
+                if unknown_kwargs:
+                    warnings.warn(
+                        f"The local executor does not take the executor_kwargs {unknown_kwargs}: they are ignored.",
+                        UserWarning,
+                    )
                 return LocalPythonExecutor(
                     self.additional_authorized_imports,
                     max_print_outputs_length=self.max_print_outputs_length,
+                    **{key: value for key, value in self.executor_kwargs.items() if key not in unknown_kwargs},
+                )
+            case "process_pool":
+                return ProcessPoolPythonExecutor(
+                    self.additional_authorized_imports,
+                    max_print_outputs_length=self.max_print_outputs_length,
+                    **self.executor_kwargs,
                 )
             case _:  # if applicable
                 raise ValueError(f"Unsupported executor type: {self.executor_type}")
@@ -1207,10 +1669,10 @@ class CodeAgent(MultiStepAgent):
         """
         memory_messages = self.write_memory_to_messages()
 
-        self.input_messages = memory_messages.copy()
+        self.input_messages = memory_messages
 
         # Add new step in logs
-        memory_step.model_input_messages = memory_messages.copy()
+        memory_step.model_input_messages = memory_messages
         try:
             additional_args = {"grammar": self.grammar} if self.grammar is not None else {}
             chat_message: ChatMessage = self.model(
@@ -1218,19 +1680,110 @@ class CodeAgent(MultiStepAgent):
                 stop_sequences=["<end_code>", "Observation:", "Calling tools:"],
                 **additional_args,
             )
-            memory_step.model_output_message = chat_message
-            model_output = chat_message.content
+            self._record_model_output(memory_step, chat_message)
+        except Exception as e:
+            raise AgentGenerationError(f"Error in generating model output:\n{e}", self.logger) from e
+        return self._execute_code_action(memory_step)
+
+    def _step_stream(self, memory_step: ActionStep) -> Generator[ChatMessageStreamDelta, None, Any]:
+        """Streaming version of `step`: the model output is yielded as it is generated."""
+        memory_messages = self.write_memory_to_messages()
+
+        self.input_messages = memory_messages
+
+        # Add new step in logs
+        memory_step.model_input_messages = memory_messages
+        speculative_execution = SpeculativeExecution(self.python_executor) if self.speculative_execution else None
+        try:
+            additional_args = {"grammar": self.grammar} if self.grammar is not None else {}
+            model_stream = self._stream_model(
+                self.input_messages,
+                stop_sequences=["<end_code>", "Observation:", "Calling tools:"],
+                **additional_args,
+            )
+            if speculative_execution is not None:
+                model_stream = self._execute_speculatively(model_stream, speculative_execution)
+            chat_message: ChatMessage = yield from model_stream
+            self._record_model_output(memory_step, chat_message)
+        except Exception as e:
+            if speculative_execution is not None:
+                speculative_execution.rollback()
+            raise AgentGenerationError(f"Error in generating model output:\n{e}", self.logger) from e
+        return self._execute_code_action(memory_step, speculative_execution)
 
-            # This adds <end_code> sequence to the history.
-            # This will nudge ulterior LLM calls to finish with <end_code>, thus efficiently stopping generation.
-            if model_output and model_output.strip().endswith("```"):
-                model_output += "<end_code>"
-                memory_step.model_output_message.content = model_output
+    def _execute_speculatively(
+        self,
+        model_stream: Generator[ChatMessageStreamDelta, None, ChatMessage],
+        speculative_execution: SpeculativeExecution,
+    ) -> Generator[ChatMessageStreamDelta, None, ChatMessage]:
+        """Passes the deltas of the model stream through, while running the code statements they complete."""
+        while True:
+            try:
+                delta = next(model_stream)
+            except StopIteration as e:
+                return e.value
+            if delta.content:
+                speculative_execution.update(delta.content)
+            yield delta
+
+    def _execute_code_action(
+        self, memory_step: ActionStep, speculative_execution: Optional[SpeculativeExecution] = None
+    ) -> Union[None, Any]:
+        try:
+            code_action = self._parse_code_action(memory_step)
+        except AgentParsingError:
+            if speculative_execution is not None:
+                speculative_execution.rollback()
+            raise
+        try:
+            output, execution_logs, is_final_answer = (speculative_execution or self.python_executor)(code_action)
+        except Exception as e:
+            raise self._get_execution_error(memory_step, e)
+        return self._process_execution_output(memory_step, output, execution_logs, is_final_answer)
 
-            memory_step.model_output = model_output
+    async def astep(self, memory_step: ActionStep) -> Union[None, Any]:
+        """
+        Asynchronous version of `step`: the model is awaited and the code runs in a separate thread, so that the event
+        loop is not blocked.
+        """
+        memory_messages = self.write_memory_to_messages()
+
+        self.input_messages = memory_messages
+
+        # Add new step in logs
+        memory_step.model_input_messages = memory_messages
+        try:
+            additional_args = {"grammar": self.grammar} if self.grammar is not None else {}
+            chat_message: ChatMessage = await self._acall_model(
+                self.input_messages,
+                stop_sequences=["<end_code>", "Observation:", "Calling tools:"],
+                **additional_args,
+            )
+            self._record_model_output(memory_step, chat_message)
         except Exception as e:
             raise AgentGenerationError(f"Error in generating model output:\n{e}", self.logger) from e
 
+        code_action = self._parse_code_action(memory_step)
+        try:
+            output, execution_logs, is_final_answer = await asyncio.to_thread(self.python_executor, code_action)
+        except Exception as e:
+            raise self._get_execution_error(memory_step, e)
+        return self._process_execution_output(memory_step, output, execution_logs, is_final_answer)
+
+    def _record_model_output(self, memory_step: ActionStep, chat_message: ChatMessage):
+        memory_step.model_output_message = chat_message
+        model_output = chat_message.content
+
+        # This adds <end_code> sequence to the history.
+        # This will nudge ulterior LLM calls to finish with <end_code>, thus efficiently stopping generation.
+        if model_output and model_output.strip().endswith("```"):
+            model_output += "<end_code>"
+            memory_step.model_output_message.content = model_output
+
+        memory_step.model_output = model_output
+
+    def _parse_code_action(self, memory_step: ActionStep) -> str:
+        model_output = memory_step.model_output
         self.logger.log_markdown(
             content=model_output,
             title="Output message of the LLM:",
@@ -1254,34 +1807,36 @@ class CodeAgent(MultiStepAgent):
 
         # Execute
         self.logger.log_code(title="Executing parsed code:", content=code_action, level=LogLevel.INFO)
-        is_final_answer = False
-        try:
-            output, execution_logs, is_final_answer = self.python_executor(code_action)
-            execution_outputs_console = []
+        return code_action
+
+    def _get_execution_error(self, memory_step: ActionStep, error: Exception) -> AgentExecutionError:
+        if hasattr(self.python_executor, "state") and "_print_outputs" in self.python_executor.state:
+            execution_logs = str(self.python_executor.state["_print_outputs"])
             if len(execution_logs) > 0:
-                execution_outputs_console += [
+                execution_outputs_console = [
                     Text("Execution logs:", style="bold"),
                     Text(execution_logs),
                 ]
-            observation = "Execution logs:\n" + execution_logs
-        except Exception as e:
-            if hasattr(self.python_executor, "state") and "_print_outputs" in self.python_executor.state:
-                execution_logs = str(self.python_executor.state["_print_outputs"])
-                if len(execution_logs) > 0:
-                    execution_outputs_console = [
-                        Text("Execution logs:", style="bold"),
-                        Text(execution_logs),
-                    ]
-                    memory_step.observations = "Execution logs:\n" + execution_logs
-                    self.logger.log(Group(*execution_outputs_console), level=LogLevel.INFO)
-            error_msg = str(e)
-            if "Import of " in error_msg and " is not allowed" in error_msg:
-                self.logger.log(
-                    "[bold red]Warning to user: Code execution failed due to an unauthorized import - Consider passing said import under `additional_authorized_imports` when initializing your CodeAgent.",
-                    level=LogLevel.INFO,
-                )
-            raise AgentExecutionError(error_msg, self.logger)
-
+                memory_step.observations = "Execution logs:\n" + execution_logs
+                self.logger.log(Group(*execution_outputs_console), level=LogLevel.INFO)
+        error_msg = str(error)
+        if "Import of " in error_msg and " is not allowed" in error_msg:
+            self.logger.log(
+                "[bold red]Warning to user: Code execution failed due to an unauthorized import - Consider passing said import under `additional_authorized_imports` when initializing your CodeAgent.",
+                level=LogLevel.INFO,
+            )
+        return AgentExecutionError(error_msg, self.logger)
+
+    def _process_execution_output(
+        self, memory_step: ActionStep, output: Any, execution_logs: str, is_final_answer: bool
+    ) -> Union[None, Any]:
+        execution_outputs_console = []
+        if len(execution_logs) > 0:
+            execution_outputs_console += [
+                Text("Execution logs:", style="bold"),
+                Text(execution_logs),
+            ]
+        observation = "Execution logs:\n" + execution_logs
         truncated_output = truncate_content(str(output))
         observation += "Last output from code snippet:\n" + truncated_output
         memory_step.observations = observation
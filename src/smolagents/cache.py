@@ -0,0 +1,222 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import time
+from collections import OrderedDict
+from pathlib import Path
+from threading import Lock
+from typing import Any, Optional, Tuple, Union
+
+
+__all__ = ["Cache", "MemoryCache", "SQLiteCache", "DirectoryCache", "get_cache_key"]
+
+
+def get_cache_key(data: Any) -> str:
+    """
+    Returns a key identifying JSON-serializable data: equal data, up to the order of dictionary keys, get the same key.
+
+    Args:
+        data (`Any`): JSON-serializable data, for instance the arguments of a call.
+    """
+    canonical_json = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False, default=str)
+    return hashlib.sha256(canonical_json.encode("utf-8")).hexdigest()
+
+
+class Cache:
+    """
+    Base class of the key-value stores used to cache results, such as model responses.
+
+    Values must be JSON-serializable. Subclasses implement `_get`, `_set` and `clear`, storing each value with its
+    expiration time.
+
+    Args:
+        ttl (`float`, *optional*): Time to live of the cached values in seconds. By default, values never expire.
+    """
+
+    def __init__(self, ttl: Optional[float] = None):
+        self.ttl = ttl
+
+    def get(self, key: str) -> Optional[Any]:
+        """Returns the value cached for `key`, or `None` if there is none or if it has expired."""
+        entry = self._get(key)
+        if entry is None:
+            return None
+        value, expires_at = entry
+        if expires_at is not None and expires_at <= time.time():
+            return None
+        return value
+
+    def set(self, key: str, value: Any):
+        """Caches `value` for `key`, replacing any previous value."""
+        self._set(key, value, time.time() + self.ttl if self.ttl is not None else None)
+
+    def _get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        raise NotImplementedError
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        raise NotImplementedError
+
+    def clear(self):
+        """Removes all cached values."""
+        raise NotImplementedError
+
+
+class MemoryCache(Cache):
+    """
+    Cache kept in memory, which evicts the least recently used values beyond `max_size` values.
+
+    Args:
+        max_size (`int`, default `1024`): Maximum number of cached values.
+        ttl (`float`, *optional*): Time to live of the cached values in seconds. By default, values never expire.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: Optional[float] = None):
+        super().__init__(ttl=ttl)
+        self.max_size = max_size
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def _get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock:
+            if key not in self._entries:
+                return None
+            self._entries.move_to_end(key)
+            # Values are stored serialized, so that callers cannot modify the cached values
+            serialized_value, expires_at = self._entries[key]
+        return json.loads(serialized_value), expires_at
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        with self._lock:
+            self._entries[key] = (json.dumps(value), expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class SQLiteCache(Cache):
+    """
+    Cache stored in a SQLite database, which can be shared by several processes.
+
+    Args:
+        path (`str` or `Path`): Path of the database file, created if it does not exist.
+        ttl (`float`, *optional*): Time to live of the cached values in seconds. By default, values never expire.
+        max_bytes (`int`, *optional*): Maximum total size of the cached values in bytes: beyond it, expired values
+            then the least recently used ones are evicted. By default, the size is not bounded.
+    """
+
+    def __init__(self, path: Union[str, Path], ttl: Optional[float] = None, max_bytes: Optional[int] = None):
+        super().__init__(ttl=ttl)
+        self.path = Path(path).expanduser()
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._connection = sqlite3.connect(self.path, timeout=30, check_same_thread=False)
+        self._lock = Lock()
+        with self._lock, self._connection:
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, expires_at REAL, size INTEGER NOT NULL, accessed_at REAL)"
+            )
+
+    def _get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        with self._lock, self._connection:
+            row = self._connection.execute("SELECT value, expires_at FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is not None and self.max_bytes is not None:
+                self._connection.execute("UPDATE cache SET accessed_at = ? WHERE key = ?", (time.time(), key))
+        if row is None:
+            return None
+        return json.loads(row[0]), row[1]
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        serialized_value = json.dumps(value)
+        with self._lock, self._connection:
+            self._connection.execute(
+                "INSERT OR REPLACE INTO cache (key, value, expires_at, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (key, serialized_value, expires_at, len(serialized_value.encode("utf-8")), time.time()),
+            )
+            if self.max_bytes is not None:
+                self._evict()
+
+    def _evict(self):
+        """Evicts expired values, then the least recently used ones, until the cache fits in `max_bytes`."""
+        total_size = self._connection.execute("SELECT COALESCE(SUM(size), 0) FROM cache").fetchone()[0]
+        if total_size <= self.max_bytes:
+            return
+        rows = self._connection.execute(
+            "SELECT key, size FROM cache ORDER BY expires_at IS NULL OR expires_at > ?, accessed_at", (time.time(),)
+        ).fetchall()
+        evicted_keys = []
+        for key, size in rows:
+            if total_size <= self.max_bytes:
+                break
+            evicted_keys.append((key,))
+            total_size -= size
+        self._connection.executemany("DELETE FROM cache WHERE key = ?", evicted_keys)
+
+    def clear(self):
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM cache")
+
+    def close(self):
+        self._connection.close()
+
+
+class DirectoryCache(Cache):
+    """
+    Cache stored as one JSON file per value in a directory, which is easy to inspect and to commit, for instance to
+    replay model responses in tests.
+
+    Args:
+        directory (`str` or `Path`): Path of the directory, created if it does not exist.
+        ttl (`float`, *optional*): Time to live of the cached values in seconds. By default, values never expire.
+    """
+
+    def __init__(self, directory: Union[str, Path], ttl: Optional[float] = None):
+        super().__init__(ttl=ttl)
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def _get_path(self, key: str) -> Path:
+        return self.directory / f"{key}.json"
+
+    def _get(self, key: str) -> Optional[Tuple[Any, Optional[float]]]:
+        try:
+            entry = json.loads(self._get_path(key).read_text(encoding="utf-8"))
+        except FileNotFoundError:
+            return None
+        return entry["value"], entry["expires_at"]
+
+    def _set(self, key: str, value: Any, expires_at: Optional[float]):
+        # The file is written under a temporary name then renamed, so that readers never see a partial file
+        file_descriptor, temporary_path = tempfile.mkstemp(dir=self.directory, suffix=".tmp")
+        with os.fdopen(file_descriptor, "w", encoding="utf-8") as file:
+            json.dump({"value": value, "expires_at": expires_at}, file, ensure_ascii=False, indent=2)
+        os.replace(temporary_path, self._get_path(key))
+
+    def clear(self):
+        for path in self.directory.glob("*.json"):
+            path.unlink(missing_ok=True)
@@ -116,6 +116,18 @@ class DuckDuckGoSearchTool(Tool):
         self.ddgs = DDGS(**kwargs)
 
     def forward(self, query: str) -> str:
+        from functools import partial
+
+        from smolagents.http_client import get_web_cache
+
+        web_cache = get_web_cache()
+        if web_cache is not None:
+            return web_cache.get_search_results(
+                "duckduckgo", {"query": query, "max_results": self.max_results}, partial(self.search, query)
+            )
+        return self.search(query)
+
+    def search(self, query: str) -> str:
         results = self.ddgs.text(query, max_results=self.max_results)
         if len(results) == 0:
             raise Exception("No results found! Try a less restrictive/shorter query.")
@@ -152,7 +164,21 @@ class GoogleSearchTool(Tool):
             raise ValueError(f"Missing API key. Make sure you have '{api_key_env_name}' in your env variables.")
 
     def forward(self, query: str, filter_year: Optional[int] = None) -> str:
-        import requests
+        from functools import partial
+
+        from smolagents.http_client import get_web_cache
+
+        web_cache = get_web_cache()
+        if web_cache is not None:
+            return web_cache.get_search_results(
+                f"google_{self.provider}",
+                {"query": query, "filter_year": filter_year},
+                partial(self.search, query, filter_year),
+            )
+        return self.search(query, filter_year)
+
+    def search(self, query: str, filter_year: Optional[int] = None) -> str:
+        from smolagents.http_client import get_http_client
 
         if self.provider == "serpapi":
             params = {
@@ -171,7 +197,7 @@ class GoogleSearchTool(Tool):
         if filter_year is not None:
             params["tbs"] = f"cdr:1,cd_min:01/01/{filter_year},cd_max:12/31/{filter_year}"
 
-        response = requests.get(base_url, params=params)
+        response = get_http_client().get(base_url, params=params)
 
         if response.status_code == 200:
             results = response.json()
@@ -229,27 +255,25 @@ class VisitWebpageTool(Tool):
 
     def forward(self, url: str) -> str:
         try:
-            import re
-
             import requests
-            from markdownify import markdownify
             from requests.exceptions import RequestException
 
+            from smolagents.http_client import get_http_client, get_web_cache
             from smolagents.utils import truncate_content
         except ImportError as e:
             raise ImportError(
                 "You must install packages `markdownify` and `requests` to run this tool: for instance run `pip install markdownify requests`."
             ) from e
         try:
-            # Send a GET request to the URL with a 20-second timeout
-            response = requests.get(url, timeout=20)
-            response.raise_for_status()  # Raise an exception for bad status codes
-
-            # Convert the HTML content to Markdown
-            markdown_content = markdownify(response.text).strip()
-
-            # Remove multiple line breaks
-            markdown_content = re.sub(r"\n{3,}", "\n\n", markdown_content)
+            web_cache = get_web_cache()
+            if web_cache is not None:
+                # Unchanged pages are neither downloaded nor converted again
+                markdown_content = web_cache.get_webpage(url, self.convert_to_markdown, timeout=20)
+            else:
+                # Send a GET request to the URL with a 20-second timeout, reusing the pooled connections to its host
+                response = get_http_client().get(url, timeout=20)
+                response.raise_for_status()  # Raise an exception for bad status codes
+                markdown_content = self.convert_to_markdown(response.text)
 
             return truncate_content(markdown_content, self.max_output_length)
 
@@ -257,9 +281,24 @@ class VisitWebpageTool(Tool):
             return "The request timed out. Please try again later or check the URL."
         except RequestException as e:
             return f"Error fetching the webpage: {str(e)}"
+        except ImportError:
+            raise
         except Exception as e:
             return f"An unexpected error occurred: {str(e)}"
 
+    def convert_to_markdown(self, html: str) -> str:
+        import re
+
+        try:
+            from markdownify import markdownify
+        except ImportError as e:
+            raise ImportError(
+                "You must install packages `markdownify` and `requests` to run this tool: for instance run `pip install markdownify requests`."
+            ) from e
+
+        # Convert the HTML content to Markdown, then remove multiple line breaks
+        return re.sub(r"\n{3,}", "\n\n", markdownify(html).strip())
+
 
 class WikipediaSearchTool(Tool):
     """
@@ -335,26 +374,39 @@ class WikipediaSearchTool(Tool):
         )
 
     def forward(self, query: str) -> str:
+        from functools import partial
+
+        from smolagents.http_client import get_web_cache
+
         try:
-            page = self.wiki.page(query)
+            web_cache = get_web_cache()
+            if web_cache is not None:
+                return web_cache.get_search_results(
+                    "wikipedia",
+                    {"query": query, "language": self.language, "content_type": self.content_type},
+                    partial(self.search, query),
+                )
+            return self.search(query)
+        except Exception as e:
+            return f"Error fetching Wikipedia summary: {str(e)}"
 
-            if not page.exists():
-                return f"No Wikipedia page found for '{query}'. Try a different query."
+    def search(self, query: str) -> str:
+        page = self.wiki.page(query)
 
-            title = page.title
-            url = page.fullurl
+        if not page.exists():
+            return f"No Wikipedia page found for '{query}'. Try a different query."
 
-            if self.content_type == "summary":
-                text = page.summary
-            elif self.content_type == "text":
-                text = page.text
-            else:
-                return "⚠️ Invalid `content_type`. Use either 'summary' or 'text'."
+        title = page.title
+        url = page.fullurl
 
-            return f"✅ **Wikipedia Page:** {title}\n\n**Content:** {text}\n\n🔗 **Read more:** {url}"
+        if self.content_type == "summary":
+            text = page.summary
+        elif self.content_type == "text":
+            text = page.text
+        else:
+            return "⚠️ Invalid `content_type`. Use either 'summary' or 'text'."
 
-        except Exception as e:
-            return f"Error fetching Wikipedia summary: {str(e)}"
+        return f"✅ **Wikipedia Page:** {title}\n\n**Content:** {text}\n\n🔗 **Read more:** {url}"
 
 
 class SpeechToTextTool(PipelineTool):
@@ -21,9 +21,13 @@ from typing import Optional
 from smolagents.agent_types import AgentAudio, AgentImage, AgentText
 from smolagents.agents import MultiStepAgent, PlanningStep
 from smolagents.memory import ActionStep, FinalAnswerStep, MemoryStep
+from smolagents.models import ChatMessageStreamDelta
 from smolagents.utils import _is_package_available
 
 
+STREAMED_OUTPUT_ID = "streamed_model_output"
+
+
 def get_step_footnote_content(step_log: MemoryStep, step_name: str) -> str:
     """Get a footnote string for a step log with duration and token information"""
     step_footnote = f"**{step_name}**"
@@ -163,11 +167,26 @@ def stream_to_gradio(
     reset_agent_memory: bool = False,
     additional_args: Optional[dict] = None,
 ):
-    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages."""
+    """Runs an agent with the given task and streams the messages from the agent as gradio ChatMessages.
+
+    If the agent streams its model outputs, the output of the current step is yielded as it is generated, in messages
+    with the `STREAMED_OUTPUT_ID` id: each of these messages replaces the previous one, until the step is complete.
+    """
+    import gradio as gr
+
     total_input_tokens = 0
     total_output_tokens = 0
+    streamed_text = ""
 
     for step_log in agent.run(task, stream=True, reset=reset_agent_memory, additional_args=additional_args):
+        if isinstance(step_log, ChatMessageStreamDelta):
+            if step_log.content:
+                streamed_text += step_log.content
+                yield gr.ChatMessage(
+                    role="assistant", content=streamed_text, metadata={"id": STREAMED_OUTPUT_ID, "status": "pending"}
+                )
+            continue
+        streamed_text = ""
         # Track tokens if model provides them
         if getattr(agent.model, "last_input_token_count", None) is not None:
             total_input_tokens += agent.model.last_input_token_count
@@ -210,6 +229,9 @@ class GradioUI:
             yield messages
 
             for msg in stream_to_gradio(session_state["agent"], task=prompt, reset_agent_memory=False):
+                # Streamed model outputs replace each other, then are replaced by the messages of the complete step
+                if messages and (messages[-1].metadata or {}).get("id") == STREAMED_OUTPUT_ID:
+                    messages.pop()
                 messages.append(msg)
                 yield messages
 
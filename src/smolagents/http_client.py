@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import time
+from threading import BoundedSemaphore, Lock
+from typing import Any, Callable, Dict, Optional
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from .cache import Cache, get_cache_key
+from .tool_supervisor import ToolTimeoutError, is_tool_call_cancelled
+
+
+__all__ = ["HttpClient", "get_http_client", "set_http_client", "WebCache", "get_web_cache", "set_web_cache"]
+
+
+class HttpClient:
+    """
+    HTTP client shared by the tools that access the web, such as [`GoogleSearchTool`] and [`VisitWebpageTool`].
+
+    Connections are pooled and kept alive across calls, so that repeated requests to a host skip the DNS, TCP and TLS
+    setup. Failed connections and responses with a transient error status are retried with an exponential backoff.
+
+    Args:
+        timeout (`float`, default `20`): Default timeout of the requests in seconds.
+        max_retries (`int`, default `3`): Number of retries of failed connections and of responses with status 429,
+            500, 502, 503 or 504.
+        backoff_factor (`float`, default `0.5`): The n-th retry waits `backoff_factor * 2 ** (n - 1)` seconds, unless
+            the response has a `Retry-After` header.
+        pool_maxsize (`int`, default `10`): Number of connections kept alive per host.
+        max_connections_per_host (`int`, default `4`): Maximum number of concurrent requests to a host: other requests
+            wait for one of them to finish.
+        headers (`dict[str, str]`, *optional*): Headers sent with every request, for instance a `User-Agent`.
+    """
+
+    retry_statuses = (429, 500, 502, 503, 504)
+
+    def __init__(
+        self,
+        timeout: float = 20,
+        max_retries: int = 3,
+        backoff_factor: float = 0.5,
+        pool_maxsize: int = 10,
+        max_connections_per_host: int = 4,
+        headers: Optional[Dict[str, str]] = None,
+    ):
+        self.timeout = timeout
+        self.max_connections_per_host = max_connections_per_host
+        retry = Retry(
+            total=max_retries,
+            backoff_factor=backoff_factor,
+            status_forcelist=self.retry_statuses,
+            allowed_methods=["HEAD", "GET", "OPTIONS"],
+            # The last response is returned instead of raising, so that callers handle error statuses as usual
+            raise_on_status=False,
+        )
+        adapter = HTTPAdapter(pool_maxsize=pool_maxsize, max_retries=retry)
+        self.session = requests.Session()
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        if headers:
+            self.session.headers.update(headers)
+        self._host_semaphores: Dict[str, BoundedSemaphore] = {}
+        self._host_semaphores_lock = Lock()
+
+    def _get_host_semaphore(self, url: str) -> BoundedSemaphore:
+        host = urlsplit(url).netloc
+        with self._host_semaphores_lock:
+            if host not in self._host_semaphores:
+                self._host_semaphores[host] = BoundedSemaphore(self.max_connections_per_host)
+            return self._host_semaphores[host]
+
+    def request(self, method: str, url: str, **kwargs) -> requests.Response:
+        """Sends a request, taking the same arguments as `requests.request`."""
+        if is_tool_call_cancelled():
+            # The tool call sending this request timed out: stop it before it holds a connection again
+            raise ToolTimeoutError(f"Request to {url} cancelled, since the tool call sending it timed out.")
+        kwargs.setdefault("timeout", self.timeout)
+        with self._get_host_semaphore(url):
+            return self.session.request(method, url, **kwargs)
+
+    def get(self, url: str, **kwargs) -> requests.Response:
+        """Sends a GET request, taking the same arguments as `requests.get`."""
+        return self.request("GET", url, **kwargs)
+
+    def close(self):
+        self.session.close()
+
+
+_http_client: Optional[HttpClient] = None
+_http_client_lock = Lock()
+
+
+def get_http_client() -> HttpClient:
+    """Returns the HTTP client shared by the default tools, created with the default settings on first use."""
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = HttpClient()
+        return _http_client
+
+
+def set_http_client(http_client: HttpClient):
+    """
+    Replaces the HTTP client shared by the default tools, for instance to change its timeout, retries or headers.
+
+    Args:
+        http_client (`HttpClient`): The new client.
+    """
+    global _http_client
+    with _http_client_lock:
+        _http_client = http_client
+
+
+class WebCache:
+    """
+    Cache of the web content fetched by the default tools: webpages converted to markdown by [`VisitWebpageTool`], and
+    results of [`DuckDuckGoSearchTool`], [`GoogleSearchTool`] and [`WikipediaSearchTool`].
+
+    Content cached for less than `max_age` seconds is returned without any request. Older webpages are revalidated
+    with a conditional request using their `ETag` and `Last-Modified` headers: if the page has not changed, the
+    cached markdown is returned without downloading and converting the page again. Older search results are fetched
+    again.
+
+    Args:
+        cache ([`Cache`]): Where to store the content. Use a [`SQLiteCache`] with `max_bytes` to keep a size-bounded
+            cache on disk, shared by several processes.
+        max_age (`float`, default `600`): Time in seconds during which cached content is used without any request.
+
+    Example:
+    ```python
+    >>> set_web_cache(WebCache(SQLiteCache("~/.cache/smolagents/web.db", max_bytes=500_000_000)))
+    ```
+    """
+
+    def __init__(self, cache: Cache, max_age: float = 600):
+        self.cache = cache
+        self.max_age = max_age
+
+    def _is_fresh(self, entry: Dict[str, Any]) -> bool:
+        return time.time() - entry["fetched_at"] < self.max_age
+
+    def get_webpage(self, url: str, convert: Callable[[str], str], timeout: float = 20) -> str:
+        """
+        Returns the content of a webpage converted by `convert`, from the cache if the page has not changed.
+
+        Args:
+            url (`str`): The url of the webpage.
+            convert (`Callable[[str], str]`): Function converting the text of the page, for instance to markdown.
+            timeout (`float`, default `20`): Timeout of the request in seconds.
+        """
+        cache_key = get_cache_key({"webpage": url})
+        entry = self.cache.get(cache_key)
+        if entry is not None and self._is_fresh(entry):
+            return entry["content"]
+
+        headers = {}
+        if entry is not None and entry.get("etag"):
+            headers["If-None-Match"] = entry["etag"]
+        if entry is not None and entry.get("last_modified"):
+            headers["If-Modified-Since"] = entry["last_modified"]
+        response = get_http_client().get(url, headers=headers, timeout=timeout)
+        if entry is not None and headers and response.status_code == 304:
+            content = entry["content"]
+        else:
+            response.raise_for_status()
+            content = convert(response.text)
+        self.cache.set(
+            cache_key,
+            {
+                "content": content,
+                "etag": response.headers.get("ETag") or (entry or {}).get("etag"),
+                "last_modified": response.headers.get("Last-Modified") or (entry or {}).get("last_modified"),
+                "fetched_at": time.time(),
+            },
+        )
+        return content
+
+    def get_search_results(self, source: str, arguments: Dict[str, Any], search: Callable[[], str]) -> str:
+        """
+        Returns the results of a search, from the cache if the same search was run less than `max_age` seconds ago.
+
+        Args:
+            source (`str`): Name of the search engine, which is part of the cache key with the arguments.
+            arguments (`dict[str, Any]`): The arguments of the search, for instance the query.
+            search (`Callable[[], str]`): Function running the search. Results are only cached if it does not raise.
+        """
+        cache_key = get_cache_key({"search": source, "arguments": arguments})
+        entry = self.cache.get(cache_key)
+        if entry is not None and self._is_fresh(entry):
+            return entry["content"]
+        content = search()
+        self.cache.set(cache_key, {"content": content, "fetched_at": time.time()})
+        return content
+
+
+_web_cache: Optional[WebCache] = None
+
+
+def get_web_cache() -> Optional[WebCache]:
+    """Returns the cache of the web content fetched by the default tools, or `None` if caching is disabled."""
+    return _web_cache
+
+
+def set_web_cache(web_cache: Optional[WebCache]):
+    """
+    Sets the cache of the web content fetched by the default tools. Caching is disabled by default.
+
+    Args:
+        web_cache ([`WebCache`], *optional*): The cache, or `None` to disable caching.
+    """
+    global _web_cache
+    _web_cache = web_cache
@@ -17,18 +17,33 @@
 import ast
 import builtins
 import difflib
+import hashlib
 import inspect
 import logging
 import math
+import operator
+import os
 import re
+import sys
+import threading
+import time
+from collections import OrderedDict, deque
 from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
 from functools import wraps
 from importlib import import_module
 from types import BuiltinFunctionType, FunctionType, ModuleType
-from typing import Any, Callable, Dict, List, Optional, Set, Tuple
+from typing import Any, Callable, Dict, Generator, List, Optional, Set, Tuple
 
 from .tools import Tool
-from .utils import BASE_BUILTIN_MODULES, truncate_content
+from .utils import BASE_BUILTIN_MODULES, get_complete_code_statements
+
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
 
 
 logger = logging.getLogger(__name__)
@@ -43,6 +58,25 @@ class InterpreterError(ValueError):
     pass
 
 
+class BudgetExceededError(InterpreterError):
+    """
+    An error raised when the code exhausts one of the budgets of its [`ResourceGovernor`]. It cannot be caught by the
+    code being evaluated.
+
+    Args:
+        message (`str`): The error message.
+        budget (`str`): The exhausted budget: `"operations"`, `"while_iterations"`, `"time"` or `"memory"`.
+        limit (`float`): The limit of the budget, in operations, iterations, seconds or megabytes.
+        usage (`float`): The usage that exceeded the limit, in the same unit.
+    """
+
+    def __init__(self, message: str, budget: str, limit: float, usage: float):
+        super().__init__(message)
+        self.budget = budget
+        self.limit = limit
+        self.usage = usage
+
+
 ERRORS = {
     name: getattr(builtins, name)
     for name in dir(builtins)
@@ -50,14 +84,141 @@ ERRORS = {
 }
 
 DEFAULT_MAX_LEN_OUTPUT = 50000
+DEFAULT_CODE_CACHE_SIZE = 256
 MAX_OPERATIONS = 10000000
 MAX_WHILE_ITERATIONS = 1000000
+# Number of operations between two checks of the time and memory budgets, which are more costly to measure
+RESOURCE_CHECK_INTERVAL = 1024
+
+
+def get_memory_usage() -> Optional[int]:
+    """
+    Returns the resident memory of the current process in bytes, or None if it cannot be measured. Where the current
+    resident memory is not available, the peak resident memory is returned instead.
+    """
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        pass
+    if resource is None:
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Expressed in bytes on macOS, in kilobytes elsewhere
+    return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+@dataclass
+class ResourceGovernor:
+    """
+    Budgets of the evaluation of a code action: each evaluation step counts one operation, and every
+    `RESOURCE_CHECK_INTERVAL` operations the elapsed time and the memory growth are checked, so that the counters stay
+    cheap. Once a budget is exhausted, a [`BudgetExceededError`] reports which one.
+
+    The memory is measured as the growth of the resident memory of the whole process since the governor was created,
+    so it is approximate when several codes run concurrently in the process. Similarly, the time is only checked
+    between operations, so a single long call, for instance to a tool, is not interrupted.
+
+    Args:
+        max_operations (`int`, *optional*): Maximum number of operations. Defaults to `MAX_OPERATIONS`.
+        max_while_iterations (`int`, *optional*): Maximum number of iterations of each while loop. Defaults to
+            `MAX_WHILE_ITERATIONS`.
+        timeout (`float`, *optional*): Maximum time of the evaluation in seconds. By default, the time is not limited.
+        max_memory_mb (`float`, *optional*): Maximum growth of the memory during the evaluation in megabytes. By default,
+            the memory is not limited.
+        operations (`int`, default `0`): Number of operations counted so far.
+    """
+
+    max_operations: Optional[int] = None
+    max_while_iterations: Optional[int] = None
+    timeout: Optional[float] = None
+    max_memory_mb: Optional[float] = None
+    operations: int = 0
+    start_time: float = field(default_factory=time.monotonic, compare=False, repr=False)
+    initial_memory: Optional[int] = field(default=None, compare=False, repr=False)
+
+    def __post_init__(self):
+        # Defaults are read when the governor is created, so that the module constants can be changed
+        if self.max_operations is None:
+            self.max_operations = MAX_OPERATIONS
+        if self.max_while_iterations is None:
+            self.max_while_iterations = MAX_WHILE_ITERATIONS
+        if self.max_memory_mb is not None and self.initial_memory is None:
+            self.initial_memory = get_memory_usage()
+        self.checks_resources = self.timeout is not None or self.initial_memory is not None
+
+    def count_operation(self) -> None:
+        if self.operations >= self.max_operations:
+            raise BudgetExceededError(
+                f"Reached the max number of operations of {self.max_operations}. Maybe there is an infinite loop somewhere in the code, or you're just asking too many calculations.",
+                "operations",
+                self.max_operations,
+                self.operations,
+            )
+        self.operations += 1
+        if self.checks_resources and self.operations % RESOURCE_CHECK_INTERVAL == 0:
+            self.check_resources()
+
+    def check_while_iterations(self, iterations: int) -> None:
+        if iterations > self.max_while_iterations:
+            raise BudgetExceededError(
+                f"Maximum number of {self.max_while_iterations} iterations in While loop exceeded",
+                "while_iterations",
+                self.max_while_iterations,
+                iterations,
+            )
+
+    def check_resources(self) -> None:
+        """Raises a [`BudgetExceededError`] if the time or memory budget is exhausted."""
+        if self.timeout is not None:
+            elapsed_time = time.monotonic() - self.start_time
+            if elapsed_time > self.timeout:
+                raise BudgetExceededError(
+                    f"Reached the max execution time of {self.timeout} seconds after {self.operations} operations.",
+                    "time",
+                    self.timeout,
+                    elapsed_time,
+                )
+        if self.initial_memory is not None:
+            memory_growth_mb = (get_memory_usage() - self.initial_memory) / (1024 * 1024)
+            if memory_growth_mb > self.max_memory_mb:
+                raise BudgetExceededError(
+                    f"Reached the max memory of {self.max_memory_mb} MB: the memory grew by {memory_growth_mb:.1f} MB.",
+                    "memory",
+                    self.max_memory_mb,
+                    memory_growth_mb,
+                )
 
 
 def custom_print(*args):
     return None
 
 
+def check_attribute_name(name: Any) -> None:
+    """Raises an error for the attribute names that the code cannot access, whether by `obj.name` or `getattr`."""
+    if not isinstance(name, str):
+        return
+    if name.startswith("__") and name.endswith("__"):
+        raise InterpreterError(f"Forbidden access to dunder attribute: {name}")
+    if name in FORBIDDEN_ATTRIBUTES:
+        raise InterpreterError(f"Forbidden access to attribute: {name}")
+
+
+def safer_getattr(obj: Any, name: str, *default: Any) -> Any:
+    check_attribute_name(name)
+    return getattr(obj, name, *default)
+
+
+def safer_hasattr(obj: Any, name: str) -> bool:
+    check_attribute_name(name)
+    return hasattr(obj, name)
+
+
+def safer_setattr(obj: Any, name: str, value: Any) -> None:
+    check_attribute_name(name)
+    setattr(obj, name, value)
+
+
 BASE_PYTHON_TOOLS = {
     "print": custom_print,
     "isinstance": isinstance,
@@ -105,9 +266,9 @@ BASE_PYTHON_TOOLS = {
     "iter": iter,
     "divmod": divmod,
     "callable": callable,
-    "getattr": getattr,
-    "hasattr": hasattr,
-    "setattr": setattr,
+    "getattr": safer_getattr,
+    "hasattr": safer_hasattr,
+    "setattr": safer_setattr,
     "issubclass": issubclass,
     "type": type,
     "complex": complex,
@@ -126,18 +287,89 @@ DANGEROUS_FUNCTIONS = [
 ]
 
 
+# Attributes exposing the interpreter's own execution frames, e.g. through generators returned by interpreted code
+FORBIDDEN_ATTRIBUTES = {"gi_frame", "gi_code", "cr_frame", "cr_code", "ag_frame", "ag_code", "tb_frame", "f_back"}
+
+
 class PrintContainer:
-    def __init__(self):
-        self.value = ""
+    """
+    Buffer of the print outputs of the code.
+
+    Outputs are stored as a list of chunks, so that printing in a loop takes linear time. With a `max_length`, the
+    buffer never holds more than `max_length` characters: it keeps the first `max_length // 2` characters and the last
+    ones, like `truncate_content`, and drops the others as they are printed, counting them in `dropped_length`.
+
+    Args:
+        max_length (`int`, *optional*): Maximum number of characters kept. By default, all outputs are kept.
+    """
+
+    def __init__(self, max_length: Optional[int] = None):
+        self.max_length = max_length
+        self.dropped_length = 0
+        self._head_chunks = []
+        self._head_length = 0
+        self._tail_chunks = deque()
+        self._tail_length = 0
+        self._value = ""
+
+    @property
+    def value(self) -> str:
+        if self._value is None:
+            self._value = "".join(self._head_chunks)
+            if self.dropped_length:
+                self._value += (
+                    f"\n..._This content has been truncated to stay below {self.max_length} characters_...\n"
+                )
+            self._value += "".join(self._tail_chunks)
+        return self._value
+
+    @value.setter
+    def value(self, text: str):
+        self.dropped_length = 0
+        self._head_chunks, self._head_length = [], 0
+        self._tail_chunks, self._tail_length = deque(), 0
+        self._value = ""
+        self.append(text)
 
     def append(self, text):
-        self.value += text
+        if not text:
+            return self
+        self._value = None
+        if self.max_length is None:
+            self._tail_chunks.append(text)
+            self._tail_length += len(text)
+            return self
+
+        head_space = self.max_length // 2 - self._head_length
+        if head_space > 0:
+            self._head_chunks.append(text[:head_space])
+            self._head_length += len(self._head_chunks[-1])
+            text = text[head_space:]
+        if not text:
+            return self
+
+        # The tail keeps the last characters, dropping the oldest ones beyond its window
+        tail_max_length = self.max_length - self.max_length // 2
+        if len(text) >= tail_max_length:
+            self.dropped_length += self._tail_length + len(text) - tail_max_length
+            self._tail_chunks, self._tail_length = deque([text[len(text) - tail_max_length :]]), tail_max_length
+            return self
+        self._tail_chunks.append(text)
+        self._tail_length += len(text)
+        while self._tail_length > tail_max_length:
+            excess_length = self._tail_length - tail_max_length
+            if len(self._tail_chunks[0]) <= excess_length:
+                dropped_chunk_length = len(self._tail_chunks.popleft())
+            else:
+                self._tail_chunks[0] = self._tail_chunks[0][excess_length:]
+                dropped_chunk_length = excess_length
+            self._tail_length -= dropped_chunk_length
+            self.dropped_length += dropped_chunk_length
         return self
 
     def __iadd__(self, other):
         """Implements the += operator"""
-        self.value += str(other)
-        return self
+        return self.append(str(other))
 
     def __str__(self):
         """String representation"""
@@ -152,6 +384,51 @@ class PrintContainer:
         return len(self.value)
 
 
+class Frame(dict):
+    """
+    Local variables of a function call or of a comprehension.
+
+    Names that are not defined locally are looked up in the enclosing frame, and so on up to the global state, so
+    that calling a function or iterating in a comprehension never copies the enclosing state. Assignments always
+    write to the local frame.
+
+    Iterating over a frame, or calling `len` or `items` on it, only covers its local variables.
+
+    Args:
+        parent (`Dict[str, Any]`): Enclosing frame or global state.
+    """
+
+    __slots__ = ("parent", "global_state")
+
+    def __init__(self, parent: Dict[str, Any]):
+        super().__init__()
+        self.parent = parent
+        # The resource governor, read at every evaluation step, is looked up directly in the global state. It is not
+        # copied in the frame: generators and closures can be run by later code actions, which have their own governor
+        self.global_state = parent.global_state if type(parent) is Frame else parent
+
+    def __missing__(self, key):
+        return self.parent[key]
+
+    def __contains__(self, key):
+        return dict.__contains__(self, key) or key in self.parent
+
+    def get(self, key, default=None):
+        if dict.__contains__(self, key):
+            return dict.__getitem__(self, key)
+        return self.parent.get(key, default)
+
+    def setdefault(self, key, default=None):
+        if key in self:
+            return self[key]
+        self[key] = default
+        return default
+
+    def keys(self):
+        """Returns the names visible from this frame."""
+        return self.parent.keys() | dict.keys(self)
+
+
 class BreakException(Exception):
     pass
 
@@ -202,6 +479,29 @@ def fix_final_answer_code(code: str) -> str:
     return code
 
 
+def check_safer_result(result: Any, static_tools: Dict[str, Callable], authorized_imports: List[str]) -> None:
+    """
+    Checks that an evaluated value does not leak a forbidden module or a dangerous function.
+
+    Callers are expected to skip this check when `"*"` is in `authorized_imports`.
+
+    Args:
+        result: Value to check.
+        static_tools: Tools available to the code: dangerous functions explicitly added as tools are allowed.
+        authorized_imports: Modules that the code is allowed to access.
+    """
+    if isinstance(result, ModuleType):
+        if result.__name__ not in authorized_imports:
+            raise InterpreterError(f"Forbidden access to module: {result.__name__}")
+    elif isinstance(result, dict) and result.get("__spec__"):
+        if result["__name__"] not in authorized_imports:
+            raise InterpreterError(f"Forbidden access to module: {result['__name__']}")
+    elif isinstance(result, (FunctionType, BuiltinFunctionType)):
+        function_name = result.__name__
+        if f"{result.__module__}.{function_name}" in DANGEROUS_FUNCTIONS and function_name not in static_tools:
+            raise InterpreterError(f"Forbidden access to function: {function_name}")
+
+
 def safer_eval(func: Callable):
     """
     Decorator to make the evaluation of a function safer by checking its return value.
@@ -223,21 +523,7 @@ def safer_eval(func: Callable):
     ):
         result = func(expression, state, static_tools, custom_tools, authorized_imports=authorized_imports)
         if "*" not in authorized_imports:
-            if isinstance(result, ModuleType):
-                if result.__name__ not in authorized_imports:
-                    raise InterpreterError(f"Forbidden access to module: {result.__name__}")
-            elif isinstance(result, dict) and result.get("__spec__"):
-                if result["__name__"] not in authorized_imports:
-                    raise InterpreterError(f"Forbidden access to module: {result['__name__']}")
-            elif isinstance(result, (FunctionType, BuiltinFunctionType)):
-                for qualified_function_name in DANGEROUS_FUNCTIONS:
-                    module_name, function_name = qualified_function_name.rsplit(".", 1)
-                    if (
-                        function_name not in static_tools
-                        and result.__name__ == function_name
-                        and result.__module__ == module_name
-                    ):
-                        raise InterpreterError(f"Forbidden access to function: {function_name}")
+            check_safer_result(result, static_tools, authorized_imports)
         return result
 
     return _check_return
@@ -253,6 +539,8 @@ def evaluate_attribute(
     if expression.attr.startswith("__") and expression.attr.endswith("__"):
         raise InterpreterError(f"Forbidden access to dunder attribute: {expression.attr}")
     value = evaluate_ast(expression.value, state, static_tools, custom_tools, authorized_imports)
+    if expression.attr in FORBIDDEN_ATTRIBUTES:
+        raise InterpreterError(f"Forbidden access to attribute: {expression.attr}")
     return getattr(value, expression.attr)
 
 
@@ -286,7 +574,7 @@ def evaluate_lambda(
     args = [arg.arg for arg in lambda_expression.args.args]
 
     def lambda_func(*values: Any) -> Any:
-        new_state = state.copy()
+        new_state = Frame(state)
         for arg, value in zip(args, values):
             new_state[arg] = value
         return evaluate_ast(
@@ -317,8 +605,7 @@ def evaluate_while(
             except ContinueException:
                 break
         iterations += 1
-        if iterations > MAX_WHILE_ITERATIONS:
-            raise InterpreterError(f"Maximum number of {MAX_WHILE_ITERATIONS} iterations in While loop exceeded")
+        state["_resource_governor"].check_while_iterations(iterations)
     return None
 
 
@@ -330,9 +617,15 @@ def create_function(
     authorized_imports: List[str],
 ) -> Callable:
     source_code = ast.unparse(func_def)
+    # The tree-walking interpreter cannot suspend its evaluation: generator functions always run compiled
+    generator_body = (
+        compile_generator_body(func_def.body, authorized_imports)
+        if any(contains_yield(stmt) for stmt in func_def.body)
+        else None
+    )
 
     def new_func(*args: Any, **kwargs: Any) -> Any:
-        func_state = state.copy()
+        func_state = Frame(state)
         arg_names = [arg.arg for arg in func_def.args.args]
         default_values = [
             evaluate_ast(d, state, static_tools, custom_tools, authorized_imports) for d in func_def.args.defaults
@@ -369,6 +662,9 @@ def create_function(
                 func_state["self"] = args[0]
                 func_state["__class__"] = args[0].__class__
 
+        if generator_body is not None:
+            return run_generator_function(generator_body, func_state, static_tools, custom_tools)
+
         result = None
         try:
             for stmt in func_def.body:
@@ -872,8 +1168,8 @@ def evaluate_listcomp(
             authorized_imports,
         )
         result = []
+        new_state = Frame(current_state)
         for value in iter_value:
-            new_state = current_state.copy()
             if isinstance(generator.target, ast.Tuple):
                 for idx, elem in enumerate(generator.target.elts):
                     new_state[elem.id] = value[idx]
@@ -889,6 +1185,39 @@ def evaluate_listcomp(
     return inner_evaluate(listcomp.generators, 0, state)
 
 
+def evaluate_generatorexp(
+    genexp: ast.GeneratorExp,
+    state: Dict[str, Any],
+    static_tools: Dict[str, Callable],
+    custom_tools: Dict[str, Callable],
+    authorized_imports: List[str],
+) -> Generator[Any, None, None]:
+    def generate(index: int, current_state: Dict[str, Any], iter_value: Any) -> Generator[Any, None, None]:
+        generator = genexp.generators[index]
+        new_state = Frame(current_state)
+        for value in iter_value:
+            if isinstance(generator.target, ast.Tuple):
+                for idx, elem in enumerate(generator.target.elts):
+                    new_state[elem.id] = value[idx]
+            else:
+                new_state[generator.target.id] = value
+            if all(
+                evaluate_ast(if_clause, new_state, static_tools, custom_tools, authorized_imports)
+                for if_clause in generator.ifs
+            ):
+                if index + 1 == len(genexp.generators):
+                    yield evaluate_ast(genexp.elt, new_state, static_tools, custom_tools, authorized_imports)
+                else:
+                    next_iter_value = evaluate_ast(
+                        genexp.generators[index + 1].iter, new_state, static_tools, custom_tools, authorized_imports
+                    )
+                    yield from generate(index + 1, new_state, next_iter_value)
+
+    # Like in Python, the outermost iterable is evaluated immediately, and the rest lazily
+    first_iter_value = evaluate_ast(genexp.generators[0].iter, state, static_tools, custom_tools, authorized_imports)
+    return generate(0, state, first_iter_value)
+
+
 def evaluate_setcomp(
     setcomp: ast.SetComp,
     state: Dict[str, Any],
@@ -899,8 +1228,8 @@ def evaluate_setcomp(
     result = set()
     for gen in setcomp.generators:
         iter_value = evaluate_ast(gen.iter, state, static_tools, custom_tools, authorized_imports)
+        new_state = Frame(state)
         for value in iter_value:
-            new_state = state.copy()
             set_value(
                 gen.target,
                 value,
@@ -934,6 +1263,8 @@ def evaluate_try(
     try:
         for stmt in try_node.body:
             evaluate_ast(stmt, state, static_tools, custom_tools, authorized_imports)
+    except BudgetExceededError:
+        raise
     except Exception as e:
         matched = False
         for handler in try_node.handlers:
@@ -1030,41 +1361,83 @@ def evaluate_with(
             context.__exit__(None, None, None)
 
 
-def get_safe_module(raw_module, authorized_imports, visited=None):
-    """Creates a safe copy of a module or returns the original if it's a function"""
-    # If it's a function or non-module object, return it directly
-    if not isinstance(raw_module, ModuleType):
-        return raw_module
-
-    # Handle circular references: Initialize visited set for the first call
-    if visited is None:
-        visited = set()
+class SafeModule(ModuleType):
+    """
+    Read-only proxy of a module imported by the interpreted code.
 
-    module_id = id(raw_module)
-    if module_id in visited:
-        return raw_module  # Return original for circular refs
+    Attributes are looked up lazily on the wrapped module, and submodules are wrapped in their own proxy, so creating
+    a proxy costs nothing whatever the size of the module. Attributes that cannot be loaded are reported as missing.
+    Since proxies are shared by all the executors of the process, the code cannot modify them, nor reach the wrapped
+    module, which is kept out of the proxy in `WRAPPED_MODULES`.
+    """
 
-    visited.add(module_id)
+    def __init__(self, raw_module: ModuleType):
+        super().__init__(raw_module.__name__)
+        # Other module attributes set by ModuleType, like __spec__, are looked up on the wrapped module instead
+        namespace = ModuleType.__getattribute__(self, "__dict__")
+        for name in ["__doc__", "__package__", "__loader__", "__spec__"]:
+            del namespace[name]
 
-    # Create new module for actual modules
-    safe_module = ModuleType(raw_module.__name__)
+    def __getattribute__(self, name: str) -> Any:
+        # The namespace holds the memoized attributes, which are shared by all the executors
+        if name == "__dict__":
+            raise InterpreterError(f"Forbidden access to dunder attribute: {name}")
+        return ModuleType.__getattribute__(self, name)
 
-    # Copy all attributes by reference, recursively checking modules
-    for attr_name in dir(raw_module):
+    def __getattr__(self, name: str) -> Any:
         try:
-            attr_value = getattr(raw_module, attr_name)
-        except (ImportError, AttributeError) as e:
-            # lazy / dynamic loading module -> INFO log and skip
-            logger.info(
-                f"Skipping import error while copying {raw_module.__name__}.{attr_name}: {type(e).__name__} - {e}"
-            )
-            continue
-        # Recursively process nested modules, passing visited set
-        if isinstance(attr_value, ModuleType):
-            attr_value = get_safe_module(attr_value, authorized_imports, visited=visited)
+            value = getattr(WRAPPED_MODULES[self], name)
+        except ImportError as e:
+            # lazy / dynamic loading module -> INFO log and report the attribute as missing
+            logger.info(f"Skipping import error while accessing {self.__name__}.{name}: {type(e).__name__} - {e}")
+            raise AttributeError(f"module '{self.__name__}' has no attribute '{name}'") from e
+        if isinstance(value, ModuleType):
+            value = get_safe_module(value, None)
+        ModuleType.__getattribute__(self, "__dict__")[name] = value
+        return value
+
+    def __dir__(self) -> List[str]:
+        return dir(WRAPPED_MODULES[self])
+
+    def __setattr__(self, name: str, value: Any):
+        raise InterpreterError(
+            f"Cannot set attribute '{name}' of module '{self.__name__}': imported modules are read-only."
+        )
+
+    def __delattr__(self, name: str):
+        raise InterpreterError(
+            f"Cannot delete attribute '{name}' of module '{self.__name__}': imported modules are read-only."
+        )
+
+    def __repr__(self) -> str:
+        return repr(WRAPPED_MODULES[self])
 
-        setattr(safe_module, attr_name, attr_value)
 
+# Proxies of the modules imported by the interpreted code, shared by all the executors of the process
+SAFE_MODULES: Dict[ModuleType, SafeModule] = {}
+# Modules wrapped by the proxies, out of reach of the interpreted code
+WRAPPED_MODULES: Dict[SafeModule, ModuleType] = {}
+SAFE_MODULES_LOCK = threading.Lock()
+
+
+def get_safe_module(raw_module, authorized_imports):
+    """
+    Returns the read-only [`SafeModule`] proxy of a module, or returns the original if it's a function.
+
+    Access to forbidden modules and functions is checked when the code evaluates an attribute, whatever the
+    `authorized_imports`, so a single proxy per module is created and cached for the whole process.
+    """
+    # If it's a function or non-module object, return it directly
+    if not isinstance(raw_module, ModuleType) or isinstance(raw_module, SafeModule):
+        return raw_module
+    safe_module = SAFE_MODULES.get(raw_module)
+    if safe_module is None:
+        with SAFE_MODULES_LOCK:
+            safe_module = SAFE_MODULES.get(raw_module)
+            if safe_module is None:
+                safe_module = SafeModule(raw_module)
+                WRAPPED_MODULES[safe_module] = raw_module
+                SAFE_MODULES[raw_module] = safe_module
     return safe_module
 
 
@@ -1124,8 +1497,8 @@ def evaluate_dictcomp(
     result = {}
     for gen in dictcomp.generators:
         iter_value = evaluate_ast(gen.iter, state, static_tools, custom_tools, authorized_imports)
+        new_state = Frame(state)
         for value in iter_value:
-            new_state = state.copy()
             set_value(
                 gen.target,
                 value,
@@ -1220,11 +1593,10 @@ def evaluate_ast(
             The list of modules that can be imported by the code. By default, only a few safe modules are allowed.
             If it contains "*", it will authorize any import. Use this at your own risk!
     """
-    if state.setdefault("_operations_count", {"counter": 0})["counter"] >= MAX_OPERATIONS:
-        raise InterpreterError(
-            f"Reached the max number of operations of {MAX_OPERATIONS}. Maybe there is an infinite loop somewhere in the code, or you're just asking too many calculations."
-        )
-    state["_operations_count"]["counter"] += 1
+    global_state = state.global_state if type(state) is Frame else state
+    if "_resource_governor" not in global_state:
+        global_state["_resource_governor"] = ResourceGovernor()
+    global_state["_resource_governor"].count_operation()
     common_params = (state, static_tools, custom_tools, authorized_imports)
     if isinstance(expression, ast.Assign):
         # Assignment -> we evaluate the assignment which should update the state
@@ -1240,8 +1612,10 @@ def evaluate_ast(
         return expression.value
     elif isinstance(expression, ast.Tuple):
         return tuple((evaluate_ast(elt, *common_params) for elt in expression.elts))
-    elif isinstance(expression, (ast.ListComp, ast.GeneratorExp)):
+    elif isinstance(expression, ast.ListComp):
         return evaluate_listcomp(expression, *common_params)
+    elif isinstance(expression, ast.GeneratorExp):
+        return evaluate_generatorexp(expression, *common_params)
     elif isinstance(expression, ast.DictComp):
         return evaluate_dictcomp(expression, *common_params)
     elif isinstance(expression, ast.SetComp):
@@ -1344,125 +1718,1708 @@ def evaluate_ast(
         raise InterpreterError(f"{expression.__class__.__name__} is not supported.")
 
 
-class FinalAnswerException(Exception):
-    def __init__(self, value):
-        self.value = value
+CompiledNode = Callable[[Dict[str, Any], Dict[str, Callable], Dict[str, Callable]], Any]
+
+BINARY_OPERATORS = {
+    ast.Add: operator.add,
+    ast.Sub: operator.sub,
+    ast.Mult: operator.mul,
+    ast.Div: operator.truediv,
+    ast.Mod: operator.mod,
+    ast.Pow: operator.pow,
+    ast.FloorDiv: operator.floordiv,
+    ast.BitAnd: operator.and_,
+    ast.BitOr: operator.or_,
+    ast.BitXor: operator.xor,
+    ast.LShift: operator.lshift,
+    ast.RShift: operator.rshift,
+}
 
+INPLACE_OPERATORS = {
+    ast.Add: operator.iadd,
+    ast.Sub: operator.isub,
+    ast.Mult: operator.imul,
+    ast.Div: operator.itruediv,
+    ast.Mod: operator.imod,
+    ast.Pow: operator.ipow,
+    ast.FloorDiv: operator.ifloordiv,
+    ast.BitAnd: operator.iand,
+    ast.BitOr: operator.ior,
+    ast.BitXor: operator.ixor,
+    ast.LShift: operator.ilshift,
+    ast.RShift: operator.irshift,
+}
 
-def evaluate_python_code(
-    code: str,
-    static_tools: Optional[Dict[str, Callable]] = None,
-    custom_tools: Optional[Dict[str, Callable]] = None,
-    state: Optional[Dict[str, Any]] = None,
-    authorized_imports: List[str] = BASE_BUILTIN_MODULES,
-    max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
-):
-    """
-    Evaluate a python expression using the content of the variables stored in a state and only evaluating a given set
-    of functions.
+COMPARISON_OPERATORS = {
+    ast.Eq: operator.eq,
+    ast.NotEq: operator.ne,
+    ast.Lt: operator.lt,
+    ast.LtE: operator.le,
+    ast.Gt: operator.gt,
+    ast.GtE: operator.ge,
+    ast.Is: operator.is_,
+    ast.IsNot: operator.is_not,
+    ast.In: lambda left, right: left in right,
+    ast.NotIn: lambda left, right: left not in right,
+}
 
-    This function will recurse through the nodes of the tree provided.
+UNARY_OPERATORS = {
+    ast.USub: operator.neg,
+    ast.UAdd: lambda operand: operand,
+    ast.Not: operator.not_,
+    ast.Invert: operator.invert,
+}
 
-    Args:
-        code (`str`):
-            The code to evaluate.
-        static_tools (`Dict[str, Callable]`):
-            The functions that may be called during the evaluation. These can also be agents in a multiagent setting.
-            These tools cannot be overwritten in the code: any assignment to their name will raise an error.
-        custom_tools (`Dict[str, Callable]`):
-            The functions that may be called during the evaluation.
-            These tools can be overwritten in the code: any assignment to their name will overwrite them.
-        state (`Dict[str, Any]`):
-            A dictionary mapping variable names to values. The `state` should contain the initial inputs but will be
-            updated by this function to contain all variables as they are evaluated.
-            The print outputs will be stored in the state under the key "_print_outputs".
-    """
-    try:
-        expression = ast.parse(code)
-    except SyntaxError as e:
-        raise InterpreterError(
-            f"Code parsing failed on line {e.lineno} due to: {type(e).__name__}\n"
-            f"{e.text}"
-            f"{' ' * (e.offset or 0)}^\n"
-            f"Error: {str(e)}"
-        )
+# Values of these types are checked by `check_safer_result` when they are produced by a name lookup, an attribute
+# access, a subscript or a call: every other node can only pass such values along.
+SAFER_CHECKED_TYPES = (ModuleType, dict, FunctionType, BuiltinFunctionType)
 
-    if state is None:
-        state = {}
-    static_tools = static_tools.copy() if static_tools is not None else {}
-    custom_tools = custom_tools if custom_tools is not None else {}
-    result = None
-    state["_print_outputs"] = PrintContainer()
-    state["_operations_count"] = {"counter": 0}
+# Sentinel for names that are not defined in a state or frame
+UNDEFINED = object()
 
-    if "final_answer" in static_tools:
-        previous_final_answer = static_tools["final_answer"]
 
-        def final_answer(answer):  # Using 'answer' as the argument like in the original function
-            raise FinalAnswerException(previous_final_answer(answer))
+def lookup_name(state: Dict[str, Any], name: str) -> Any:
+    """Looks up a variable through the chain of frames, returning `UNDEFINED` if it is not defined."""
+    value = dict.get(state, name, UNDEFINED)
+    while value is UNDEFINED and type(state) is Frame:
+        state = state.parent
+        value = dict.get(state, name, UNDEFINED)
+    return value
 
-        static_tools["final_answer"] = final_answer
 
-    try:
-        for node in expression.body:
-            result = evaluate_ast(node, state, static_tools, custom_tools, authorized_imports)
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
-        is_final_answer = False
-        return result, is_final_answer
-    except FinalAnswerException as e:
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
-        is_final_answer = True
-        return e.value, is_final_answer
-    except Exception as e:
-        state["_print_outputs"].value = truncate_content(
-            str(state["_print_outputs"]), max_length=max_print_outputs_length
-        )
-        raise InterpreterError(
-            f"Code execution failed at line '{ast.get_source_segment(code, node)}' due to: {type(e).__name__}: {e}"
+def count_operation(state: Dict[str, Any]) -> None:
+    if type(state) is Frame:
+        state = state.global_state
+    state["_resource_governor"].count_operation()
+
+
+def compile_fallback(node: ast.AST, authorized_imports: List[str]) -> CompiledNode:
+    def run(state, static_tools, custom_tools):
+        return evaluate_ast(node, state, static_tools, custom_tools, authorized_imports)
+
+    return run
+
+
+def compile_body(body: List[ast.AST], authorized_imports: List[str]) -> List[CompiledNode]:
+    return [compile_ast(node, authorized_imports) for node in body]
+
+
+def compile_constant(constant: ast.Constant, authorized_imports: List[str]) -> CompiledNode:
+    value = constant.value
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return value
+
+    return run
+
+
+def compile_name(name: ast.Name, authorized_imports: List[str]) -> CompiledNode:
+    name_id = name.id
+    check_result = "*" not in authorized_imports
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = lookup_name(state, name_id)
+        if result is UNDEFINED:
+            if name_id in static_tools:
+                result = static_tools[name_id]
+            elif name_id in custom_tools:
+                result = custom_tools[name_id]
+            elif name_id in ERRORS:
+                result = ERRORS[name_id]
+            else:
+                close_matches = difflib.get_close_matches(name_id, list(state.keys()))
+                if len(close_matches) == 0:
+                    raise InterpreterError(f"The variable `{name_id}` is not defined.")
+                result = state[close_matches[0]]
+        if check_result and isinstance(result, SAFER_CHECKED_TYPES):
+            check_safer_result(result, static_tools, authorized_imports)
+        return result
+
+    return run
+
+
+def compile_attribute(attribute: ast.Attribute, authorized_imports: List[str]) -> CompiledNode:
+    attr = attribute.attr
+    if attr.startswith("__") and attr.endswith("__"):
+
+        def run_forbidden(state, static_tools, custom_tools):
+            count_operation(state)
+            raise InterpreterError(f"Forbidden access to dunder attribute: {attr}")
+
+        return run_forbidden
+    value = compile_ast(attribute.value, authorized_imports)
+    if attr in FORBIDDEN_ATTRIBUTES:
+
+        def run_forbidden_attribute(state, static_tools, custom_tools):
+            count_operation(state)
+            value(state, static_tools, custom_tools)
+            raise InterpreterError(f"Forbidden access to attribute: {attr}")
+
+        return run_forbidden_attribute
+
+    check_result = "*" not in authorized_imports
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = getattr(value(state, static_tools, custom_tools), attr)
+        if check_result and isinstance(result, SAFER_CHECKED_TYPES):
+            check_safer_result(result, static_tools, authorized_imports)
+        return result
+
+    return run
+
+
+def compile_subscript(subscript: ast.Subscript, authorized_imports: List[str]) -> CompiledNode:
+    index_value = compile_ast(subscript.slice, authorized_imports)
+    value_value = compile_ast(subscript.value, authorized_imports)
+    check_result = "*" not in authorized_imports
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        index = index_value(state, static_tools, custom_tools)
+        value = value_value(state, static_tools, custom_tools)
+        try:
+            result = value[index]
+        except (KeyError, IndexError, TypeError) as e:
+            error_message = f"Could not index {value} with '{index}': {type(e).__name__}: {e}"
+            if isinstance(index, str) and isinstance(value, Mapping):
+                close_matches = difflib.get_close_matches(index, list(value.keys()))
+                if len(close_matches) > 0:
+                    error_message += f". Maybe you meant one of these indexes instead: {str(close_matches)}"
+            raise InterpreterError(error_message) from e
+        if check_result and isinstance(result, SAFER_CHECKED_TYPES):
+            check_safer_result(result, static_tools, authorized_imports)
+        return result
+
+    return run
+
+
+def compile_slice(slice_node: ast.Slice, authorized_imports: List[str]) -> CompiledNode:
+    lower = compile_ast(slice_node.lower, authorized_imports) if slice_node.lower is not None else None
+    upper = compile_ast(slice_node.upper, authorized_imports) if slice_node.upper is not None else None
+    step = compile_ast(slice_node.step, authorized_imports) if slice_node.step is not None else None
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return slice(
+            lower(state, static_tools, custom_tools) if lower is not None else None,
+            upper(state, static_tools, custom_tools) if upper is not None else None,
+            step(state, static_tools, custom_tools) if step is not None else None,
         )
 
+    return run
+
+
+def compile_call(call: ast.Call, authorized_imports: List[str]) -> CompiledNode:
+    func_node = call.func
+    func_name = None
+    if isinstance(func_node, (ast.Call, ast.Lambda)):
+        get_func = compile_ast(func_node, authorized_imports)
+    elif isinstance(func_node, ast.Subscript):
+        func_value = compile_ast(func_node, authorized_imports)
+
+        def get_func(state, static_tools, custom_tools):
+            func = func_value(state, static_tools, custom_tools)
+            if not callable(func):
+                raise InterpreterError(f"This is not a correct function: {func_node}).")
+            return func
+
+    elif isinstance(func_node, ast.Attribute):
+        func_name = func_node.attr
+        obj_value = compile_ast(func_node.value, authorized_imports)
+
+        def get_func(state, static_tools, custom_tools):
+            obj = obj_value(state, static_tools, custom_tools)
+            if not hasattr(obj, func_name):
+                raise InterpreterError(f"Object {obj} has no attribute {func_name}")
+            return getattr(obj, func_name)
+
+    elif isinstance(func_node, ast.Name):
+        func_name = func_node.id
+
+        def get_func(state, static_tools, custom_tools):
+            func = lookup_name(state, func_name)
+            if func is not UNDEFINED:
+                return func
+            elif func_name in static_tools:
+                return static_tools[func_name]
+            elif func_name in custom_tools:
+                return custom_tools[func_name]
+            elif func_name in ERRORS:
+                return ERRORS[func_name]
+            raise InterpreterError(
+                f"It is not permitted to evaluate other functions than the provided tools or functions defined/imported in previous code (tried to execute {func_name})."
+            )
 
-class PythonExecutor:
-    pass
+    else:
 
+        def run_incorrect(state, static_tools, custom_tools):
+            count_operation(state)
+            raise InterpreterError(f"This is not a correct function: {func_node}).")
 
-class LocalPythonExecutor(PythonExecutor):
-    def __init__(
-        self,
-        additional_authorized_imports: List[str],
-        max_print_outputs_length: Optional[int] = None,
-    ):
-        self.custom_tools = {}
-        self.state = {}
-        self.max_print_outputs_length = max_print_outputs_length
-        if max_print_outputs_length is None:
-            self.max_print_outputs_length = DEFAULT_MAX_LEN_OUTPUT
-        self.additional_authorized_imports = additional_authorized_imports
-        self.authorized_imports = list(set(BASE_BUILTIN_MODULES) | set(self.additional_authorized_imports))
-        # TODO: assert self.authorized imports are all installed locally
-        self.static_tools = None
+        return run_incorrect
 
-    def __call__(self, code_action: str) -> Tuple[Any, str, bool]:
-        output, is_final_answer = evaluate_python_code(
-            code_action,
-            static_tools=self.static_tools,
-            custom_tools=self.custom_tools,
-            state=self.state,
-            authorized_imports=self.authorized_imports,
-            max_print_outputs_length=self.max_print_outputs_length,
+    positional_args = [
+        (
+            isinstance(arg, ast.Starred),
+            compile_ast(arg.value if isinstance(arg, ast.Starred) else arg, authorized_imports),
         )
-        logs = str(self.state["_print_outputs"])
-        return output, logs, is_final_answer
+        for arg in call.args
+    ]
+    keyword_args = [(keyword.arg, compile_ast(keyword.value, authorized_imports)) for keyword in call.keywords]
+    check_result = "*" not in authorized_imports
+
+    def evaluate_args(state, static_tools, custom_tools):
+        args = []
+        for is_starred, arg_value in positional_args:
+            if is_starred:
+                args.extend(arg_value(state, static_tools, custom_tools))
+            else:
+                args.append(arg_value(state, static_tools, custom_tools))
+        kwargs = {name: kwarg_value(state, static_tools, custom_tools) for name, kwarg_value in keyword_args}
+        return args, kwargs
 
-    def send_variables(self, variables: dict):
-        self.state.update(variables)
+    if func_name == "super":
 
-    def send_tools(self, tools: Dict[str, Tool]):
-        self.static_tools = {**tools, **BASE_PYTHON_TOOLS.copy()}
+        def run_super(state, static_tools, custom_tools):
+            count_operation(state)
+            get_func(state, static_tools, custom_tools)
+            args, _ = evaluate_args(state, static_tools, custom_tools)
+            if not args:
+                if "__class__" in state and "self" in state:
+                    return super(state["__class__"], state["self"])
+                else:
+                    raise InterpreterError("super() needs at least one argument")
+            cls = args[0]
+            if not isinstance(cls, type):
+                raise InterpreterError("super() argument 1 must be type")
+            if len(args) == 1:
+                return super(cls)
+            elif len(args) == 2:
+                instance = args[1]
+                return super(cls, instance)
+            else:
+                raise InterpreterError("super() takes at most 2 arguments")
+
+        return run_super
+
+    if func_name == "print":
+
+        def run_print(state, static_tools, custom_tools):
+            count_operation(state)
+            get_func(state, static_tools, custom_tools)
+            args, _ = evaluate_args(state, static_tools, custom_tools)
+            state["_print_outputs"] += " ".join(map(str, args)) + "\n"
+            return None
+
+        return run_print
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        func = get_func(state, static_tools, custom_tools)
+        args, kwargs = evaluate_args(state, static_tools, custom_tools)
+        if inspect.isbuiltin(func) and (inspect.getmodule(func) == builtins) and (func not in static_tools.values()):
+            raise InterpreterError(
+                f"Invoking a builtin function that has not been explicitly added as a tool is not allowed ({func_name})."
+            )
+        result = func(*args, **kwargs)
+        if check_result and isinstance(result, SAFER_CHECKED_TYPES):
+            check_safer_result(result, static_tools, authorized_imports)
+        return result
+
+    return run
+
+
+def compile_unaryop(expression: ast.UnaryOp, authorized_imports: List[str]) -> CompiledNode:
+    operand_value = compile_ast(expression.operand, authorized_imports)
+    unary_operator = UNARY_OPERATORS[type(expression.op)]
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return unary_operator(operand_value(state, static_tools, custom_tools))
+
+    return run
+
+
+def compile_binop(binop: ast.BinOp, authorized_imports: List[str]) -> CompiledNode:
+    left_value = compile_ast(binop.left, authorized_imports)
+    right_value = compile_ast(binop.right, authorized_imports)
+    binary_operator = BINARY_OPERATORS.get(type(binop.op))
+    operator_name = type(binop.op).__name__
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        left_val = left_value(state, static_tools, custom_tools)
+        right_val = right_value(state, static_tools, custom_tools)
+        if binary_operator is None:
+            raise NotImplementedError(f"Binary operation {operator_name} is not implemented.")
+        return binary_operator(left_val, right_val)
+
+    return run
+
+
+def compile_boolop(node: ast.BoolOp, authorized_imports: List[str]) -> CompiledNode:
+    values = compile_body(node.values, authorized_imports)
+
+    if isinstance(node.op, ast.And):
+
+        def run_and(state, static_tools, custom_tools):
+            count_operation(state)
+            for value in values:
+                if not value(state, static_tools, custom_tools):
+                    return False
+            return True
+
+        return run_and
+
+    def run_or(state, static_tools, custom_tools):
+        count_operation(state)
+        for value in values:
+            if value(state, static_tools, custom_tools):
+                return True
+        return False
+
+    return run_or
+
+
+def compile_compare(condition: ast.Compare, authorized_imports: List[str]) -> CompiledNode:
+    left_value = compile_ast(condition.left, authorized_imports)
+    comparisons = [
+        (COMPARISON_OPERATORS[type(op)], compile_ast(comparator, authorized_imports))
+        for op, comparator in zip(condition.ops, condition.comparators)
+    ]
+
+    if len(comparisons) == 1:
+        comparison_operator, right_value = comparisons[0]
+
+        def run_single(state, static_tools, custom_tools):
+            count_operation(state)
+            left = left_value(state, static_tools, custom_tools)
+            current_result = comparison_operator(left, right_value(state, static_tools, custom_tools))
+            if current_result is False:
+                return False
+            return current_result
+
+        return run_single
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = True
+        left = left_value(state, static_tools, custom_tools)
+        for i, (comparison_operator, right_value) in enumerate(comparisons):
+            right = right_value(state, static_tools, custom_tools)
+            current_result = comparison_operator(left, right)
+            if current_result is False:
+                return False
+            result = current_result if i == 0 else (result and current_result)
+            left = right
+        return result
+
+    return run
+
+
+def compile_ifexp(expression: ast.IfExp, authorized_imports: List[str]) -> CompiledNode:
+    test_value = compile_ast(expression.test, authorized_imports)
+    body_value = compile_ast(expression.body, authorized_imports)
+    orelse_value = compile_ast(expression.orelse, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        if test_value(state, static_tools, custom_tools):
+            return body_value(state, static_tools, custom_tools)
+        else:
+            return orelse_value(state, static_tools, custom_tools)
+
+    return run
+
+
+def compile_tuple(expression: ast.Tuple, authorized_imports: List[str]) -> CompiledNode:
+    elts = compile_body(expression.elts, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return tuple(elt(state, static_tools, custom_tools) for elt in elts)
+
+    return run
+
+
+def compile_list(expression: ast.List, authorized_imports: List[str]) -> CompiledNode:
+    elts = compile_body(expression.elts, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return [elt(state, static_tools, custom_tools) for elt in elts]
+
+    return run
+
+
+def compile_set(expression: ast.Set, authorized_imports: List[str]) -> CompiledNode:
+    elts = compile_body(expression.elts, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return set(elt(state, static_tools, custom_tools) for elt in elts)
+
+    return run
+
+
+def compile_dict(expression: ast.Dict, authorized_imports: List[str]) -> CompiledNode:
+    items = [
+        (compile_ast(key, authorized_imports), compile_ast(value, authorized_imports))
+        for key, value in zip(expression.keys, expression.values)
+    ]
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = {}
+        for key_value, value_value in items:
+            key = key_value(state, static_tools, custom_tools)
+            result[key] = value_value(state, static_tools, custom_tools)
+        return result
+
+    return run
+
+
+def compile_joinedstr(expression: ast.JoinedStr, authorized_imports: List[str]) -> CompiledNode:
+    values = compile_body(expression.values, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return "".join([str(value(state, static_tools, custom_tools)) for value in values])
+
+    return run
+
+
+def compile_formatted_value(expression: ast.FormattedValue, authorized_imports: List[str]) -> CompiledNode:
+    value_value = compile_ast(expression.value, authorized_imports)
+    format_spec_value = compile_ast(expression.format_spec, authorized_imports) if expression.format_spec else None
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        value = value_value(state, static_tools, custom_tools)
+        if format_spec_value is None:
+            return value
+        return format(value, format_spec_value(state, static_tools, custom_tools))
+
+    return run
+
+
+def compile_passthrough(expression: ast.Expr | ast.Starred, authorized_imports: List[str]) -> CompiledNode:
+    value = compile_ast(expression.value, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return value(state, static_tools, custom_tools)
+
+    return run
+
+
+def compile_pass(node: ast.Pass, authorized_imports: List[str]) -> CompiledNode:
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return None
+
+    return run
+
+
+def compile_break(node: ast.Break, authorized_imports: List[str]) -> CompiledNode:
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        raise BreakException()
+
+    return run
+
+
+def compile_continue(node: ast.Continue, authorized_imports: List[str]) -> CompiledNode:
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        raise ContinueException()
+
+    return run
+
+
+def compile_return(node: ast.Return, authorized_imports: List[str]) -> CompiledNode:
+    value = compile_ast(node.value, authorized_imports) if node.value else None
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        raise ReturnException(value(state, static_tools, custom_tools) if value is not None else None)
+
+    return run
+
+
+def compile_target(target: ast.AST, authorized_imports: List[str]) -> Callable:
+    """
+    Compiles an assignment target into a setter `(value, state, static_tools, custom_tools) -> None`, mirroring
+    `set_value`.
+    """
+    if isinstance(target, ast.Name):
+        target_id = target.id
+
+        def set_name(value, state, static_tools, custom_tools):
+            if target_id in static_tools:
+                raise InterpreterError(
+                    f"Cannot assign to name '{target_id}': doing this would erase the existing tool!"
+                )
+            state[target_id] = value
+
+        return set_name
+    elif isinstance(target, ast.Tuple):
+        element_setters = [compile_target(elt, authorized_imports) for elt in target.elts]
+
+        def set_tuple(value, state, static_tools, custom_tools):
+            if not isinstance(value, tuple):
+                if hasattr(value, "__iter__") and not isinstance(value, (str, bytes)):
+                    value = tuple(value)
+                else:
+                    raise InterpreterError("Cannot unpack non-tuple value")
+            if len(element_setters) != len(value):
+                raise InterpreterError("Cannot unpack tuple of wrong size")
+            for i, element_setter in enumerate(element_setters):
+                element_setter(value[i], state, static_tools, custom_tools)
+
+        return set_tuple
+    elif isinstance(target, ast.Subscript):
+        obj_value = compile_ast(target.value, authorized_imports)
+        key_value = compile_ast(target.slice, authorized_imports)
+
+        def set_subscript(value, state, static_tools, custom_tools):
+            obj = obj_value(state, static_tools, custom_tools)
+            key = key_value(state, static_tools, custom_tools)
+            obj[key] = value
+
+        return set_subscript
+    elif isinstance(target, ast.Attribute):
+        obj_value = compile_ast(target.value, authorized_imports)
+        attr = target.attr
+
+        def set_attribute(value, state, static_tools, custom_tools):
+            setattr(obj_value(state, static_tools, custom_tools), attr, value)
+
+        return set_attribute
+
+    def set_nothing(value, state, static_tools, custom_tools):
+        return None
+
+    return set_nothing
+
+
+def compile_assign(assign: ast.Assign, authorized_imports: List[str]) -> CompiledNode:
+    value_value = compile_ast(assign.value, authorized_imports)
+    setters = [compile_target(target, authorized_imports) for target in assign.targets]
+    starred_targets = [isinstance(target, ast.Starred) for target in assign.targets]
+
+    if len(setters) == 1:
+        setter = setters[0]
+
+        def run_single(state, static_tools, custom_tools):
+            count_operation(state)
+            result = value_value(state, static_tools, custom_tools)
+            setter(result, state, static_tools, custom_tools)
+            return result
+
+        return run_single
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = value_value(state, static_tools, custom_tools)
+        expanded_values = []
+        for is_starred in starred_targets:
+            if is_starred:
+                expanded_values.extend(result)
+            else:
+                expanded_values.append(result)
+        for setter, val in zip(setters, expanded_values):
+            setter(val, state, static_tools, custom_tools)
+        return result
+
+    return run
+
+
+def compile_augassign_getter(target: ast.AST, authorized_imports: List[str]) -> Callable:
+    if isinstance(target, ast.Name):
+        target_id = target.id
+
+        def get_name(state, static_tools, custom_tools):
+            value = lookup_name(state, target_id)
+            return 0 if value is UNDEFINED else value
+
+        return get_name
+    elif isinstance(target, ast.Subscript):
+        obj_value = compile_ast(target.value, authorized_imports)
+        key_value = compile_ast(target.slice, authorized_imports)
+
+        def get_subscript(state, static_tools, custom_tools):
+            obj = obj_value(state, static_tools, custom_tools)
+            key = key_value(state, static_tools, custom_tools)
+            return obj[key]
+
+        return get_subscript
+    elif isinstance(target, ast.Attribute):
+        obj_value = compile_ast(target.value, authorized_imports)
+        attr = target.attr
+
+        def get_attribute(state, static_tools, custom_tools):
+            return getattr(obj_value(state, static_tools, custom_tools), attr)
+
+        return get_attribute
+    elif isinstance(target, (ast.Tuple, ast.List)):
+        element_getters = [compile_augassign_getter(elt, authorized_imports) for elt in target.elts]
+        container_type = tuple if isinstance(target, ast.Tuple) else list
+
+        def get_elements(state, static_tools, custom_tools):
+            return container_type(getter(state, static_tools, custom_tools) for getter in element_getters)
+
+        return get_elements
+
+    def get_unsupported(state, static_tools, custom_tools):
+        raise InterpreterError("AugAssign not supported for {type(target)} targets.")
+
+    return get_unsupported
+
+
+def compile_augassign(expression: ast.AugAssign, authorized_imports: List[str]) -> CompiledNode:
+    get_current_value = compile_augassign_getter(expression.target, authorized_imports)
+    value_value = compile_ast(expression.value, authorized_imports)
+    setter = compile_target(expression.target, authorized_imports)
+    inplace_operator = INPLACE_OPERATORS.get(type(expression.op))
+    is_add = isinstance(expression.op, ast.Add)
+    operator_name = type(expression.op).__name__
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        current_value = get_current_value(state, static_tools, custom_tools)
+        value_to_add = value_value(state, static_tools, custom_tools)
+        if inplace_operator is None:
+            raise InterpreterError(f"Operation {operator_name} is not supported.")
+        if is_add and isinstance(current_value, list) and not isinstance(value_to_add, list):
+            raise InterpreterError(f"Cannot add non-list value {value_to_add} to a list.")
+        current_value = inplace_operator(current_value, value_to_add)
+        # Update the state: current_value has been updated in-place
+        setter(current_value, state, static_tools, custom_tools)
+        return current_value
+
+    return run
+
+
+def compile_if(if_statement: ast.If, authorized_imports: List[str]) -> CompiledNode:
+    test_value = compile_ast(if_statement.test, authorized_imports)
+    body = compile_body(if_statement.body, authorized_imports)
+    orelse = compile_body(if_statement.orelse, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = None
+        for line in body if test_value(state, static_tools, custom_tools) else orelse:
+            line_result = line(state, static_tools, custom_tools)
+            if line_result is not None:
+                result = line_result
+        return result
+
+    return run
+
+
+def compile_for(for_loop: ast.For, authorized_imports: List[str]) -> CompiledNode:
+    iter_value = compile_ast(for_loop.iter, authorized_imports)
+    setter = compile_target(for_loop.target, authorized_imports)
+    body = compile_body(for_loop.body, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = None
+        iterator = iter_value(state, static_tools, custom_tools)
+        for counter in iterator:
+            setter(counter, state, static_tools, custom_tools)
+            for node in body:
+                try:
+                    line_result = node(state, static_tools, custom_tools)
+                    if line_result is not None:
+                        result = line_result
+                except BreakException:
+                    break
+                except ContinueException:
+                    continue
+            else:
+                continue
+            break
+        return result
+
+    return run
+
+
+def compile_while(while_loop: ast.While, authorized_imports: List[str]) -> CompiledNode:
+    test_value = compile_ast(while_loop.test, authorized_imports)
+    body = compile_body(while_loop.body, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        resource_governor = state["_resource_governor"]
+        iterations = 0
+        while test_value(state, static_tools, custom_tools):
+            for node in body:
+                try:
+                    node(state, static_tools, custom_tools)
+                except BreakException:
+                    return None
+                except ContinueException:
+                    break
+            iterations += 1
+            resource_governor.check_while_iterations(iterations)
+        return None
+
+    return run
+
+
+def compile_try(try_node: ast.Try, authorized_imports: List[str]) -> CompiledNode:
+    body = compile_body(try_node.body, authorized_imports)
+    handlers = [
+        (
+            compile_ast(handler.type, authorized_imports) if handler.type is not None else None,
+            handler.name,
+            compile_body(handler.body, authorized_imports),
+        )
+        for handler in try_node.handlers
+    ]
+    orelse = compile_body(try_node.orelse, authorized_imports)
+    finalbody = compile_body(try_node.finalbody, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        try:
+            for stmt in body:
+                stmt(state, static_tools, custom_tools)
+        except BudgetExceededError:
+            raise
+        except Exception as e:
+            matched = False
+            for handler_type, handler_name, handler_body in handlers:
+                if handler_type is None or isinstance(e, handler_type(state, static_tools, custom_tools)):
+                    matched = True
+                    if handler_name:
+                        state[handler_name] = e
+                    for stmt in handler_body:
+                        stmt(state, static_tools, custom_tools)
+                    break
+            if not matched:
+                raise e
+        else:
+            for stmt in orelse:
+                stmt(state, static_tools, custom_tools)
+        finally:
+            for stmt in finalbody:
+                stmt(state, static_tools, custom_tools)
+
+    return run
+
+
+def compile_with(with_node: ast.With, authorized_imports: List[str]) -> CompiledNode:
+    items = [(compile_ast(item.context_expr, authorized_imports), item.optional_vars) for item in with_node.items]
+    body = compile_body(with_node.body, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        contexts = []
+        for context_value, optional_vars in items:
+            context_expr = context_value(state, static_tools, custom_tools)
+            if optional_vars:
+                state[optional_vars.id] = context_expr.__enter__()
+                contexts.append(state[optional_vars.id])
+            else:
+                context_var = context_expr.__enter__()
+                contexts.append(context_var)
+
+        try:
+            for stmt in body:
+                stmt(state, static_tools, custom_tools)
+        except Exception as e:
+            for context in reversed(contexts):
+                context.__exit__(type(e), e, e.__traceback__)
+            raise
+        else:
+            for context in reversed(contexts):
+                context.__exit__(None, None, None)
+
+    return run
+
+
+def compile_function_def(func_def: ast.FunctionDef, authorized_imports: List[str]) -> CompiledNode:
+    source_code = ast.unparse(func_def)
+    is_generator = any(contains_yield(stmt) for stmt in func_def.body)
+    if is_generator:
+        generator_body = compile_generator_body(func_def.body, authorized_imports)
+    else:
+        body = compile_body(func_def.body, authorized_imports)
+    default_value_getters = compile_body(func_def.args.defaults, authorized_imports)
+    arg_names = [arg.arg for arg in func_def.args.args]
+    vararg_name = func_def.args.vararg.arg if func_def.args.vararg else None
+    kwarg_name = func_def.args.kwarg.arg if func_def.args.kwarg else None
+    has_self = bool(arg_names) and arg_names[0] == "self"
+    is_init = func_def.name == "__init__"
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+
+        def new_func(*args: Any, **kwargs: Any) -> Any:
+            func_state = Frame(state)
+            default_values = [getter(state, static_tools, custom_tools) for getter in default_value_getters]
+
+            # Apply default values
+            defaults = dict(zip(arg_names[-len(default_values) :], default_values))
+
+            # Set positional arguments
+            for name, value in zip(arg_names, args):
+                func_state[name] = value
+
+            # Set keyword arguments
+            for name, value in kwargs.items():
+                func_state[name] = value
+
+            # Handle variable arguments
+            if vararg_name:
+                func_state[vararg_name] = args
+
+            if kwarg_name:
+                func_state[kwarg_name] = kwargs
+
+            # Set default values for arguments that were not provided
+            for name, value in defaults.items():
+                if name not in func_state:
+                    func_state[name] = value
+
+            # Update function state with self and __class__
+            if has_self and args:
+                func_state["self"] = args[0]
+                func_state["__class__"] = args[0].__class__
+
+            if is_generator:
+                return run_generator_function(generator_body, func_state, static_tools, custom_tools)
+
+            result = None
+            try:
+                for stmt in body:
+                    result = stmt(func_state, static_tools, custom_tools)
+            except ReturnException as e:
+                result = e.value
+
+            if is_init:
+                return None
+
+            return result
+
+        # Store original AST, source code, and name
+        new_func.__ast__ = func_def
+        new_func.__source__ = source_code
+        new_func.__name__ = func_def.name
+
+        custom_tools[func_def.name] = new_func
+        return new_func
+
+    return run
+
+
+def contains_yield(node: ast.AST) -> bool:
+    """Whether `node` contains a `yield`, not counting the bodies of nested functions, lambdas and classes."""
+    if isinstance(node, (ast.Yield, ast.YieldFrom)):
+        return True
+    if isinstance(node, (ast.FunctionDef, ast.AsyncFunctionDef, ast.Lambda, ast.ClassDef)):
+        return False
+    return any(contains_yield(child) for child in ast.iter_child_nodes(node))
+
+
+CompiledGeneratorBody = List[Tuple[bool, Callable]]
+
+
+def compile_yield(node: ast.Yield | ast.YieldFrom, authorized_imports: List[str]) -> Callable:
+    value = compile_ast(node.value, authorized_imports) if node.value is not None else None
+
+    if isinstance(node, ast.YieldFrom):
+
+        def run_yield_from(state, static_tools, custom_tools):
+            count_operation(state)
+            return (yield from value(state, static_tools, custom_tools))
+
+        return run_yield_from
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return (yield value(state, static_tools, custom_tools) if value is not None else None)
+
+    return run
+
+
+def compile_generator_statement(stmt: ast.stmt, authorized_imports: List[str]) -> Optional[Callable]:
+    """
+    Compiles a statement containing a `yield` into a generator function `(state, static_tools, custom_tools)`.
+
+    Yields are supported as expression statements (`yield x`, `yield from xs`), as assigned values (`y = yield x`),
+    and anywhere in the bodies of `if`, `for`, `while`, `try` and `with` statements. Returns `None` for other uses.
+    """
+    if isinstance(stmt, ast.Expr) and isinstance(stmt.value, (ast.Yield, ast.YieldFrom)):
+        yield_value = compile_yield(stmt.value, authorized_imports)
+
+        def run_expr(state, static_tools, custom_tools):
+            count_operation(state)
+            yield from yield_value(state, static_tools, custom_tools)
+
+        return run_expr
+    elif (
+        isinstance(stmt, ast.Assign)
+        and isinstance(stmt.value, (ast.Yield, ast.YieldFrom))
+        and not any(contains_yield(target) for target in stmt.targets)
+    ):
+        yield_value = compile_yield(stmt.value, authorized_imports)
+        setters = [compile_target(target, authorized_imports) for target in stmt.targets]
+
+        def run_assign(state, static_tools, custom_tools):
+            count_operation(state)
+            result = yield from yield_value(state, static_tools, custom_tools)
+            for setter in setters:
+                setter(result, state, static_tools, custom_tools)
+
+        return run_assign
+    elif isinstance(stmt, ast.If) and not contains_yield(stmt.test):
+        test_value = compile_ast(stmt.test, authorized_imports)
+        body = compile_generator_body(stmt.body, authorized_imports)
+        orelse = compile_generator_body(stmt.orelse, authorized_imports)
+
+        def run_if(state, static_tools, custom_tools):
+            count_operation(state)
+            branch = body if test_value(state, static_tools, custom_tools) else orelse
+            yield from run_generator_body(branch, state, static_tools, custom_tools)
+
+        return run_if
+    elif isinstance(stmt, ast.For) and not contains_yield(stmt.iter) and not contains_yield(stmt.target):
+        iter_value = compile_ast(stmt.iter, authorized_imports)
+        setter = compile_target(stmt.target, authorized_imports)
+        body = compile_generator_body(stmt.body, authorized_imports)
+
+        def run_for(state, static_tools, custom_tools):
+            count_operation(state)
+            for counter in iter_value(state, static_tools, custom_tools):
+                setter(counter, state, static_tools, custom_tools)
+                for is_generator, node in body:
+                    try:
+                        if is_generator:
+                            yield from node(state, static_tools, custom_tools)
+                        else:
+                            node(state, static_tools, custom_tools)
+                    except BreakException:
+                        break
+                    except ContinueException:
+                        continue
+                else:
+                    continue
+                break
+
+        return run_for
+    elif isinstance(stmt, ast.While) and not contains_yield(stmt.test):
+        test_value = compile_ast(stmt.test, authorized_imports)
+        body = compile_generator_body(stmt.body, authorized_imports)
+
+        def run_while(state, static_tools, custom_tools):
+            count_operation(state)
+            resource_governor = state["_resource_governor"]
+            iterations = 0
+            while test_value(state, static_tools, custom_tools):
+                for is_generator, node in body:
+                    try:
+                        if is_generator:
+                            yield from node(state, static_tools, custom_tools)
+                        else:
+                            node(state, static_tools, custom_tools)
+                    except BreakException:
+                        return
+                    except ContinueException:
+                        break
+                iterations += 1
+                resource_governor.check_while_iterations(iterations)
+
+        return run_while
+    elif isinstance(stmt, ast.Try) and not any(
+        handler.type is not None and contains_yield(handler.type) for handler in stmt.handlers
+    ):
+        body = compile_generator_body(stmt.body, authorized_imports)
+        handlers = [
+            (
+                compile_ast(handler.type, authorized_imports) if handler.type is not None else None,
+                handler.name,
+                compile_generator_body(handler.body, authorized_imports),
+            )
+            for handler in stmt.handlers
+        ]
+        orelse = compile_generator_body(stmt.orelse, authorized_imports)
+        finalbody = compile_generator_body(stmt.finalbody, authorized_imports)
+
+        def run_try(state, static_tools, custom_tools):
+            count_operation(state)
+            try:
+                yield from run_generator_body(body, state, static_tools, custom_tools)
+            except BudgetExceededError:
+                raise
+            except Exception as e:
+                for handler_type, handler_name, handler_body in handlers:
+                    if handler_type is None or isinstance(e, handler_type(state, static_tools, custom_tools)):
+                        if handler_name:
+                            state[handler_name] = e
+                        yield from run_generator_body(handler_body, state, static_tools, custom_tools)
+                        break
+                else:
+                    raise e
+            else:
+                yield from run_generator_body(orelse, state, static_tools, custom_tools)
+            finally:
+                yield from run_generator_body(finalbody, state, static_tools, custom_tools)
+
+        return run_try
+    elif isinstance(stmt, ast.With) and not any(contains_yield(item) for item in stmt.items):
+        items = [(compile_ast(item.context_expr, authorized_imports), item.optional_vars) for item in stmt.items]
+        body = compile_generator_body(stmt.body, authorized_imports)
+
+        def run_with(state, static_tools, custom_tools):
+            count_operation(state)
+            contexts = []
+            for context_value, optional_vars in items:
+                context_expr = context_value(state, static_tools, custom_tools)
+                if optional_vars:
+                    state[optional_vars.id] = context_expr.__enter__()
+                    contexts.append(state[optional_vars.id])
+                else:
+                    contexts.append(context_expr.__enter__())
+
+            try:
+                yield from run_generator_body(body, state, static_tools, custom_tools)
+            except Exception as e:
+                for context in reversed(contexts):
+                    context.__exit__(type(e), e, e.__traceback__)
+                raise
+            else:
+                for context in reversed(contexts):
+                    context.__exit__(None, None, None)
+
+        return run_with
+    return None
+
+
+def compile_generator_body(body: List[ast.stmt], authorized_imports: List[str]) -> CompiledGeneratorBody:
+    """
+    Compiles the body of a generator function: statements that yield are compiled into generator functions with
+    `compile_generator_statement`, the others with `compile_ast`.
+    """
+    compiled_body = []
+    for stmt in body:
+        if not contains_yield(stmt):
+            compiled_body.append((False, compile_ast(stmt, authorized_imports)))
+            continue
+        compiled_stmt = compile_generator_statement(stmt, authorized_imports)
+        if compiled_stmt is not None:
+            compiled_body.append((True, compiled_stmt))
+            continue
+
+        def run_unsupported(state, static_tools, custom_tools):
+            count_operation(state)
+            raise InterpreterError(
+                "Yield expressions are only supported as statements, like `yield x`, or as assigned values, like `y = yield x`."
+            )
+
+        compiled_body.append((False, run_unsupported))
+    return compiled_body
+
+
+def run_generator_body(
+    body: CompiledGeneratorBody,
+    state: Dict[str, Any],
+    static_tools: Dict[str, Callable],
+    custom_tools: Dict[str, Callable],
+) -> Generator[Any, Any, None]:
+    for is_generator, stmt in body:
+        if is_generator:
+            yield from stmt(state, static_tools, custom_tools)
+        else:
+            stmt(state, static_tools, custom_tools)
+
+
+def run_generator_function(
+    body: CompiledGeneratorBody,
+    state: Dict[str, Any],
+    static_tools: Dict[str, Callable],
+    custom_tools: Dict[str, Callable],
+) -> Generator[Any, Any, Any]:
+    try:
+        yield from run_generator_body(body, state, static_tools, custom_tools)
+    except ReturnException as e:
+        return e.value
+
+
+def compile_lambda(lambda_expression: ast.Lambda, authorized_imports: List[str]) -> CompiledNode:
+    args = [arg.arg for arg in lambda_expression.args.args]
+    body = compile_ast(lambda_expression.body, authorized_imports)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+
+        def lambda_func(*values: Any) -> Any:
+            new_state = Frame(state)
+            for arg, value in zip(args, values):
+                new_state[arg] = value
+            return body(new_state, static_tools, custom_tools)
+
+        return lambda_func
+
+    return run
+
+
+def compile_comprehension_generators(
+    generators: List[ast.comprehension], authorized_imports: List[str]
+) -> List[Tuple[CompiledNode, Callable, List[CompiledNode]]]:
+    compiled_generators = []
+    for generator in generators:
+        target = generator.target
+        if isinstance(target, ast.Tuple):
+
+            def bind(new_state, value, target=target):
+                for idx, elem in enumerate(target.elts):
+                    new_state[elem.id] = value[idx]
+
+        else:
+
+            def bind(new_state, value, target=target):
+                new_state[target.id] = value
+
+        compiled_generators.append(
+            (compile_ast(generator.iter, authorized_imports), bind, compile_body(generator.ifs, authorized_imports))
+        )
+    return compiled_generators
+
+
+def compile_listcomp(listcomp: ast.ListComp, authorized_imports: List[str]) -> CompiledNode:
+    elt = compile_ast(listcomp.elt, authorized_imports)
+    generators = compile_comprehension_generators(listcomp.generators, authorized_imports)
+
+    def inner_evaluate(index, current_state, static_tools, custom_tools):
+        if index >= len(generators):
+            return [elt(current_state, static_tools, custom_tools)]
+        iter_value, bind, if_clauses = generators[index]
+        result = []
+        new_state = Frame(current_state)
+        for value in iter_value(current_state, static_tools, custom_tools):
+            bind(new_state, value)
+            if all(if_clause(new_state, static_tools, custom_tools) for if_clause in if_clauses):
+                result.extend(inner_evaluate(index + 1, new_state, static_tools, custom_tools))
+        return result
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        return inner_evaluate(0, state, static_tools, custom_tools)
+
+    return run
+
+
+def compile_generatorexp(genexp: ast.GeneratorExp, authorized_imports: List[str]) -> CompiledNode:
+    elt = compile_ast(genexp.elt, authorized_imports)
+    generators = compile_comprehension_generators(genexp.generators, authorized_imports)
+
+    def generate(index, current_state, iterable, static_tools, custom_tools):
+        _, bind, if_clauses = generators[index]
+        new_state = Frame(current_state)
+        for value in iterable:
+            bind(new_state, value)
+            if all(if_clause(new_state, static_tools, custom_tools) for if_clause in if_clauses):
+                if index + 1 == len(generators):
+                    yield elt(new_state, static_tools, custom_tools)
+                else:
+                    next_iterable = generators[index + 1][0](new_state, static_tools, custom_tools)
+                    yield from generate(index + 1, new_state, next_iterable, static_tools, custom_tools)
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        # Like in Python, the outermost iterable is evaluated immediately, and the rest lazily
+        iterable = generators[0][0](state, static_tools, custom_tools)
+        return generate(0, state, iterable, static_tools, custom_tools)
+
+    return run
+
+
+def compile_setcomp(setcomp: ast.SetComp, authorized_imports: List[str]) -> CompiledNode:
+    elt = compile_ast(setcomp.elt, authorized_imports)
+    generators = [
+        (
+            compile_ast(gen.iter, authorized_imports),
+            compile_target(gen.target, authorized_imports),
+            compile_body(gen.ifs, authorized_imports),
+        )
+        for gen in setcomp.generators
+    ]
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = set()
+        for iter_value, setter, if_clauses in generators:
+            new_state = Frame(state)
+            for value in iter_value(state, static_tools, custom_tools):
+                setter(value, new_state, static_tools, custom_tools)
+                if all(if_clause(new_state, static_tools, custom_tools) for if_clause in if_clauses):
+                    result.add(elt(new_state, static_tools, custom_tools))
+        return result
+
+    return run
+
+
+def compile_dictcomp(dictcomp: ast.DictComp, authorized_imports: List[str]) -> CompiledNode:
+    key_value = compile_ast(dictcomp.key, authorized_imports)
+    value_value = compile_ast(dictcomp.value, authorized_imports)
+    generators = [
+        (
+            compile_ast(gen.iter, authorized_imports),
+            compile_target(gen.target, authorized_imports),
+            compile_body(gen.ifs, authorized_imports),
+        )
+        for gen in dictcomp.generators
+    ]
+
+    def run(state, static_tools, custom_tools):
+        count_operation(state)
+        result = {}
+        for iter_value, setter, if_clauses in generators:
+            new_state = Frame(state)
+            for value in iter_value(state, static_tools, custom_tools):
+                setter(value, new_state, static_tools, custom_tools)
+                if all(if_clause(new_state, static_tools, custom_tools) for if_clause in if_clauses):
+                    key = key_value(new_state, static_tools, custom_tools)
+                    result[key] = value_value(new_state, static_tools, custom_tools)
+        return result
+
+    return run
+
+
+AST_COMPILERS: Dict[type, Callable[[Any, List[str]], CompiledNode]] = {
+    ast.Assign: compile_assign,
+    ast.AugAssign: compile_augassign,
+    ast.Call: compile_call,
+    ast.Constant: compile_constant,
+    ast.Tuple: compile_tuple,
+    ast.ListComp: compile_listcomp,
+    ast.GeneratorExp: compile_generatorexp,
+    ast.DictComp: compile_dictcomp,
+    ast.SetComp: compile_setcomp,
+    ast.UnaryOp: compile_unaryop,
+    ast.Starred: compile_passthrough,
+    ast.BoolOp: compile_boolop,
+    ast.Break: compile_break,
+    ast.Continue: compile_continue,
+    ast.BinOp: compile_binop,
+    ast.Compare: compile_compare,
+    ast.Lambda: compile_lambda,
+    ast.FunctionDef: compile_function_def,
+    ast.Dict: compile_dict,
+    ast.Expr: compile_passthrough,
+    ast.For: compile_for,
+    ast.FormattedValue: compile_formatted_value,
+    ast.If: compile_if,
+    ast.JoinedStr: compile_joinedstr,
+    ast.List: compile_list,
+    ast.Name: compile_name,
+    ast.Subscript: compile_subscript,
+    ast.IfExp: compile_ifexp,
+    ast.Attribute: compile_attribute,
+    ast.Slice: compile_slice,
+    ast.While: compile_while,
+    ast.Try: compile_try,
+    ast.With: compile_with,
+    ast.Set: compile_set,
+    ast.Return: compile_return,
+    ast.Pass: compile_pass,
+}
+
+
+def compile_ast(expression: ast.AST, authorized_imports: List[str] = BASE_BUILTIN_MODULES) -> CompiledNode:
+    """
+    Compile an abstract syntax tree into a tree of closures that can be executed repeatedly without re-walking the
+    tree.
+
+    The compiled node is called as `compiled(state, static_tools, custom_tools)` and behaves exactly like
+    `evaluate_ast(expression, state, static_tools, custom_tools, authorized_imports)`: it counts the same operations
+    and raises the same errors, but node dispatch, operator lookup and the checks that only depend on the code or on
+    `authorized_imports` are resolved once, at compile time. Nodes that have no dedicated compiler are delegated to
+    `evaluate_ast`.
+
+    Args:
+        expression (`ast.AST`):
+            The code to compile, as an abstract syntax tree.
+        authorized_imports (`List[str]`):
+            The list of modules that can be imported by the code. By default, only a few safe modules are allowed.
+            If it contains "*", it will authorize any import. Use this at your own risk!
+    """
+    compiler = AST_COMPILERS.get(type(expression))
+    if compiler is None:
+        return compile_fallback(expression, authorized_imports)
+    return compiler(expression, authorized_imports)
+
+
+CompiledCode = List[Tuple[ast.AST, CompiledNode]]
+
+
+class CodeCache:
+    """
+    Bounded LRU cache of parsed and compiled code, keyed by a hash of the source text and by the set of authorized
+    imports. A single instance, `CODE_CACHE`, is shared by all `LocalPythonExecutor` instances of the process, so that
+    code snippets that are re-run across retries, steps or parallel agents are only parsed and compiled once.
+
+    Args:
+        max_size (`int`, default `DEFAULT_CODE_CACHE_SIZE`): Maximum number of compiled code snippets to keep.
+    """
+
+    def __init__(self, max_size: int = DEFAULT_CODE_CACHE_SIZE):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries: OrderedDict[Tuple[str, frozenset], CompiledCode] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, code: str, authorized_imports: List[str]) -> CompiledCode:
+        """
+        Returns the compiled statements of `code`, parsing and compiling it on a cache miss.
+
+        Raises:
+            InterpreterError: If the code cannot be parsed. Parsing failures are not cached.
+        """
+        key = (hashlib.sha256(code.encode("utf-8")).hexdigest(), frozenset(authorized_imports))
+        with self._lock:
+            compiled_code = self._entries.get(key)
+            if compiled_code is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return compiled_code
+            self.misses += 1
+
+        try:
+            expression = ast.parse(code)
+        except SyntaxError as e:
+            raise InterpreterError(
+                f"Code parsing failed on line {e.lineno} due to: {type(e).__name__}\n"
+                f"{e.text}"
+                f"{' ' * (e.offset or 0)}^\n"
+                f"Error: {str(e)}"
+            )
+        compiled_code = [(node, compile_ast(node, authorized_imports)) for node in expression.body]
+
+        with self._lock:
+            self._entries[key] = compiled_code
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+        return compiled_code
+
+    def clear(self) -> None:
+        """Empties the cache and resets the hit/miss counters."""
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"hits": self.hits, "misses": self.misses, "size": len(self._entries), "max_size": self.max_size}
+
+
+CODE_CACHE = CodeCache()
+
+
+class FinalAnswerException(Exception):
+    def __init__(self, value):
+        self.value = value
+
+
+def evaluate_python_code(
+    code: str,
+    static_tools: Optional[Dict[str, Callable]] = None,
+    custom_tools: Optional[Dict[str, Callable]] = None,
+    state: Optional[Dict[str, Any]] = None,
+    authorized_imports: List[str] = BASE_BUILTIN_MODULES,
+    max_print_outputs_length: int = DEFAULT_MAX_LEN_OUTPUT,
+    resource_governor: Optional[ResourceGovernor] = None,
+):
+    """
+    Evaluate a python expression using the content of the variables stored in a state and only evaluating a given set
+    of functions.
+
+    This function will recurse through the nodes of the tree provided.
+
+    Args:
+        code (`str`):
+            The code to evaluate.
+        static_tools (`Dict[str, Callable]`):
+            The functions that may be called during the evaluation. These can also be agents in a multiagent setting.
+            These tools cannot be overwritten in the code: any assignment to their name will raise an error.
+        custom_tools (`Dict[str, Callable]`):
+            The functions that may be called during the evaluation.
+            These tools can be overwritten in the code: any assignment to their name will overwrite them.
+        state (`Dict[str, Any]`):
+            A dictionary mapping variable names to values. The `state` should contain the initial inputs but will be
+            updated by this function to contain all variables as they are evaluated.
+            The print outputs will be stored in the state under the key "_print_outputs".
+        resource_governor (`ResourceGovernor`, *optional*):
+            The budgets of the evaluation, stored in the state under the key "_resource_governor". Defaults to a
+            governor with the default operation and while loop budgets.
+    """
+    compiled_code = CODE_CACHE.get(code, authorized_imports)
+
+    if state is None:
+        state = {}
+    static_tools = static_tools.copy() if static_tools is not None else {}
+    custom_tools = custom_tools if custom_tools is not None else {}
+    result = None
+    state["_print_outputs"] = PrintContainer(max_length=max_print_outputs_length)
+    state["_resource_governor"] = resource_governor if resource_governor is not None else ResourceGovernor()
+
+    if "final_answer" in static_tools:
+        previous_final_answer = static_tools["final_answer"]
+
+        def final_answer(answer):  # Using 'answer' as the argument like in the original function
+            raise FinalAnswerException(previous_final_answer(answer))
+
+        static_tools["final_answer"] = final_answer
+
+    try:
+        for node, compiled_node in compiled_code:
+            result = compiled_node(state, static_tools, custom_tools)
+        is_final_answer = False
+        return result, is_final_answer
+    except FinalAnswerException as e:
+        is_final_answer = True
+        return e.value, is_final_answer
+    except BudgetExceededError as e:
+        raise BudgetExceededError(
+            f"Code execution failed at line '{ast.get_source_segment(code, node)}' due to: {type(e).__name__}: {e}",
+            e.budget,
+            e.limit,
+            e.usage,
+        )
+    except Exception as e:
+        raise InterpreterError(
+            f"Code execution failed at line '{ast.get_source_segment(code, node)}' due to: {type(e).__name__}: {e}"
+        )
+
+
+class PythonExecutor:
+    pass
+
+
+class LocalPythonExecutor(PythonExecutor):
+    """
+    Runs code actions with the Python interpreter of this module, in the current process.
+
+    Each code action gets a new [`ResourceGovernor`] with the budgets below: once one of them is exhausted, the code
+    action fails with a [`BudgetExceededError`].
+
+    Args:
+        additional_authorized_imports (`list[str]`): Modules that the code can import, in addition to the base ones.
+        max_print_outputs_length (`int`, *optional*): Maximum length of the print outputs returned as logs.
+        max_operations (`int`, *optional*): Maximum number of evaluation steps of a code action. Defaults to
+            `MAX_OPERATIONS`.
+        max_while_iterations (`int`, *optional*): Maximum number of iterations of each while loop. Defaults to
+            `MAX_WHILE_ITERATIONS`.
+        timeout (`float`, *optional*): Maximum time of a code action in seconds. By default, the time is not limited.
+        max_memory_mb (`float`, *optional*): Maximum growth of the process memory during a code action in megabytes.
+            By default, the memory is not limited.
+    """
+
+    def __init__(
+        self,
+        additional_authorized_imports: List[str],
+        max_print_outputs_length: Optional[int] = None,
+        max_operations: Optional[int] = None,
+        max_while_iterations: Optional[int] = None,
+        timeout: Optional[float] = None,
+        max_memory_mb: Optional[float] = None,
+    ):
+        self.custom_tools = {}
+        self.state = {}
+        self.max_print_outputs_length = max_print_outputs_length
+        if max_print_outputs_length is None:
+            self.max_print_outputs_length = DEFAULT_MAX_LEN_OUTPUT
+        self.additional_authorized_imports = additional_authorized_imports
+        self.authorized_imports = list(set(BASE_BUILTIN_MODULES) | set(self.additional_authorized_imports))
+        # TODO: assert self.authorized imports are all installed locally
+        self.static_tools = None
+        self.max_operations = max_operations
+        self.max_while_iterations = max_while_iterations
+        self.timeout = timeout
+        self.max_memory_mb = max_memory_mb
+
+    def create_resource_governor(self) -> ResourceGovernor:
+        """Returns a new [`ResourceGovernor`] with the budgets of a code action."""
+        return ResourceGovernor(
+            max_operations=self.max_operations,
+            max_while_iterations=self.max_while_iterations,
+            timeout=self.timeout,
+            max_memory_mb=self.max_memory_mb,
+        )
+
+    def __call__(
+        self, code_action: str, resource_governor: Optional[ResourceGovernor] = None
+    ) -> Tuple[Any, str, bool]:
+        """
+        Runs a code action.
+
+        Args:
+            code_action (`str`): The code to run.
+            resource_governor (`ResourceGovernor`, *optional*): Governor to charge the code to, for instance to share
+                the budgets of a code action run in several parts. By default, a new governor is created.
+        """
+        output, is_final_answer = evaluate_python_code(
+            code_action,
+            static_tools=self.static_tools,
+            custom_tools=self.custom_tools,
+            state=self.state,
+            authorized_imports=self.authorized_imports,
+            max_print_outputs_length=self.max_print_outputs_length,
+            resource_governor=resource_governor if resource_governor is not None else self.create_resource_governor(),
+        )
+        logs = str(self.state["_print_outputs"])
+        return output, logs, is_final_answer
+
+    def send_variables(self, variables: dict):
+        self.state.update(variables)
+
+    def send_tools(self, tools: Dict[str, Tool]):
+        self.static_tools = {**tools, **BASE_PYTHON_TOOLS.copy()}
+
+
+def calls_final_answer(node: ast.AST) -> bool:
+    return any(isinstance(child, ast.Name) and child.id == "final_answer" for child in ast.walk(node))
+
+
+class SpeculativeExecution:
+    """
+    Runs the statements of a code action with a [`LocalPythonExecutor`] while the model is still generating it.
+
+    The model output is fed to `update` as it is streamed: its complete top-level statements are run one after the
+    other in a background thread, up to the first statement that calls `final_answer`. Once the model output is
+    complete, calling this object with the final code action runs the statements that were not run yet. If the final code
+    action does not start with the statements that were run, the variables and functions of the executor are restored to
+    their values before the speculative execution and the whole code action is run instead. Note that the effects of the
+    tools called by the discarded statements, or of mutations of existing objects, cannot be undone.
+
+    All the statements are charged to the same [`ResourceGovernor`], so the budgets of the executor apply to the whole
+    code action. The time spent waiting for the model between statements is not charged.
+
+    Args:
+        executor (`LocalPythonExecutor`): Executor running the code actions of the agent.
+    """
+
+    def __init__(self, executor: LocalPythonExecutor):
+        self.executor = executor
+        self.state_snapshot = dict(executor.state)
+        self.custom_tools_snapshot = dict(executor.custom_tools)
+        self.thread_pool = ThreadPoolExecutor(max_workers=1)
+        self.model_output = ""
+        self.statements = []
+        self.is_stopped = False
+        # Results of the statements run so far, only accessed from the background thread until `finish` is called
+        self.output = None
+        self.logs = ""
+        self.error = None
+        # The statements and the rest of the code action share the budgets of a single code action
+        self.resource_governor = None
+        self.idle_since = None
+
+    def get_resource_governor(self) -> ResourceGovernor:
+        """Returns the governor of the code action, which is not charged the time spent waiting for the model."""
+        if self.resource_governor is None:
+            self.resource_governor = self.executor.create_resource_governor()
+        elif self.idle_since is not None:
+            self.resource_governor.start_time += time.monotonic() - self.idle_since
+        return self.resource_governor
+
+    def update(self, text: str):
+        """Adds text generated by the model, and starts running the statements it completes."""
+        self.model_output += text
+        if self.is_stopped or "\n" not in text:
+            return
+        statements, is_closed = get_complete_code_statements(self.model_output)
+        if statements[: len(self.statements)] != self.statements[: len(statements)]:
+            self.is_stopped = True
+            return
+        for statement in statements[len(self.statements) :]:
+            if calls_final_answer(ast.parse(statement)):
+                self.is_stopped = True
+                return
+            self.statements.append(statement)
+            self.thread_pool.submit(self._run_statement, statement)
+        self.is_stopped = is_closed
+
+    def _run_statement(self, statement: str):
+        if self.error is not None:
+            return
+        try:
+            self.output, logs, _ = self.executor(statement, self.get_resource_governor())
+            self.logs += logs
+        except Exception as e:
+            self.error = e
+            self.logs += str(self.executor.state.get("_print_outputs", ""))
+        finally:
+            self.idle_since = time.monotonic()
+
+    def finish(self):
+        """Waits for the statements that are running."""
+        self.is_stopped = True
+        self.thread_pool.shutdown(wait=True)
+
+    def rollback(self):
+        """Waits for the statements that are running, then restores the variables and functions of the executor."""
+        self.finish()
+        self.executor.state.clear()
+        self.executor.state.update(self.state_snapshot)
+        self.executor.custom_tools.clear()
+        self.executor.custom_tools.update(self.custom_tools_snapshot)
+
+    def get_remaining_code(self, code_action: str) -> Optional[str]:
+        """
+        Returns the part of the code action that follows the statements run speculatively, or None if the code action
+        does not start with them.
+        """
+        try:
+            final_statements = ast.parse(code_action).body
+            speculative_statements = [node for statement in self.statements for node in ast.parse(statement).body]
+        except SyntaxError:
+            return None
+        if [ast.dump(node) for node in final_statements[: len(speculative_statements)]] != [
+            ast.dump(node) for node in speculative_statements
+        ]:
+            return None
+        if len(final_statements) == len(speculative_statements):
+            return ""
+        next_statement = final_statements[len(speculative_statements)]
+        start_line = min(
+            [next_statement.lineno] + [decorator.lineno for decorator in getattr(next_statement, "decorator_list", [])]
+        )
+        return "\n".join(code_action.split("\n")[start_line - 1 :])
+
+    def __call__(self, code_action: str) -> Tuple[Any, str, bool]:
+        self.finish()
+        remaining_code = self.get_remaining_code(code_action)
+        if remaining_code is None:
+            logger.info("The final code action differs from the statements run speculatively: running it again.")
+            self.rollback()
+            return self.executor(code_action)
+        if self.error is None and remaining_code:
+            try:
+                self.output, logs, is_final_answer = self.executor(remaining_code, self.get_resource_governor())
+                return self.output, self.logs + logs, is_final_answer
+            except Exception as e:
+                self.error = e
+                self.logs += str(self.executor.state.get("_print_outputs", ""))
+        if self.error is not None:
+            # Lets the agent report the print outputs of all the statements run before the error
+            self.executor.state["_print_outputs"] = PrintContainer(self.executor.max_print_outputs_length).append(
+                self.logs
+            )
+            raise self.error
+        return self.output, self.logs, False
 
 
-__all__ = ["evaluate_python_code", "LocalPythonExecutor"]
+__all__ = ["BudgetExceededError", "ResourceGovernor", "evaluate_python_code", "LocalPythonExecutor"]
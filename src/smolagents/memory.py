@@ -1,9 +1,10 @@
 from dataclasses import asdict, dataclass
 from logging import getLogger
-from typing import TYPE_CHECKING, Any, Dict, List, TypedDict, Union
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple, TypedDict, Union
 
 from smolagents.models import ChatMessage, MessageRole
 from smolagents.monitoring import AgentLogger, LogLevel
+from smolagents.tool_supervisor import ToolCallRecord
 from smolagents.utils import AgentError, make_json_serializable
 
 
@@ -47,6 +48,18 @@ class MemoryStep:
     def to_messages(self, **kwargs) -> List[Dict[str, Any]]:
         raise NotImplementedError
 
+    def __setattr__(self, name, value):
+        # Any change to the step invalidates its rendered messages
+        self.__dict__.pop("_messages_cache", None)
+        super().__setattr__(name, value)
+
+    def get_messages(self, summary_mode: bool = False) -> List[Dict[str, Any]]:
+        """Returns the messages of `to_messages`, which are rendered once and cached until the step is modified."""
+        messages_cache = self.__dict__.setdefault("_messages_cache", {})
+        if summary_mode not in messages_cache:
+            messages_cache[summary_mode] = self.to_messages(summary_mode=summary_mode)
+        return messages_cache[summary_mode]
+
 
 @dataclass
 class ActionStep(MemoryStep):
@@ -62,6 +75,7 @@ class ActionStep(MemoryStep):
     observations: str | None = None
     observations_images: List["PIL.Image.Image"] | None = None
     action_output: Any = None
+    tool_call_records: List[ToolCallRecord] | None = None
 
     def dict(self):
         # We overwrite the method to parse the tool_calls and action_output manually
@@ -77,6 +91,9 @@ class ActionStep(MemoryStep):
             "model_output": self.model_output,
             "observations": self.observations,
             "action_output": make_json_serializable(self.action_output),
+            "tool_call_records": [record.dict() for record in self.tool_call_records]
+            if self.tool_call_records
+            else [],
         }
 
     def to_messages(self, summary_mode: bool = False, show_model_input_messages: bool = False) -> List[Message]:
@@ -108,7 +125,11 @@ class ActionStep(MemoryStep):
                     content=[
                         {
                             "type": "text",
-                            "text": (f"Call id: {self.tool_calls[0].id}\n" if self.tool_calls else "")
+                            "text": (
+                                f"Call id: {self.tool_calls[0].id}\n"
+                                if self.tool_calls and len(self.tool_calls) == 1
+                                else ""
+                            )
                             + f"Observation:\n{self.observations}",
                         }
                     ],
@@ -120,7 +141,9 @@ class ActionStep(MemoryStep):
                 + str(self.error)
                 + "\nNow let's retry: take care not to repeat previous errors! If you have retried several times, try a completely different approach.\n"
             )
-            message_content = f"Call id: {self.tool_calls[0].id}\n" if self.tool_calls else ""
+            message_content = (
+                f"Call id: {self.tool_calls[0].id}\n" if self.tool_calls and len(self.tool_calls) == 1 else ""
+            )
             message_content += error_message
             messages.append(
                 Message(role=MessageRole.TOOL_RESPONSE, content=[{"type": "text", "text": message_content}])
@@ -188,10 +211,40 @@ class AgentMemory:
     def __init__(self, system_prompt: str):
         self.system_prompt = SystemPromptStep(system_prompt=system_prompt)
         self.steps: List[Union[TaskStep, ActionStep, PlanningStep]] = []
+        # For each summary mode, the steps rendered by the last call to get_messages and the resulting messages
+        self._rendered_steps: Dict[bool, List[Tuple[MemoryStep, List[Message]]]] = {}
+        self._rendered_messages: Dict[bool, List[Message]] = {}
 
     def reset(self):
         self.steps = []
 
+    def get_messages(self, summary_mode: bool = False) -> List[Message]:
+        """
+        Renders the system prompt and the steps into messages for the model.
+
+        The messages are built incrementally: the messages of the steps already rendered by a previous call are
+        reused, and only the steps added or modified since then are rendered.
+
+        Args:
+            summary_mode (`bool`, default `False`): Whether to render the steps in summary mode.
+        """
+        steps = [self.system_prompt] + self.steps
+        rendered_steps = self._rendered_steps.setdefault(summary_mode, [])
+        messages = self._rendered_messages.setdefault(summary_mode, [])
+        num_valid_steps = num_valid_messages = 0
+        for (rendered_step, step_messages), step in zip(rendered_steps, steps):
+            if rendered_step is not step or step.get_messages(summary_mode=summary_mode) is not step_messages:
+                break
+            num_valid_steps += 1
+            num_valid_messages += len(step_messages)
+        del rendered_steps[num_valid_steps:]
+        del messages[num_valid_messages:]
+        for step in steps[num_valid_steps:]:
+            step_messages = step.get_messages(summary_mode=summary_mode)
+            rendered_steps.append((step, step_messages))
+            messages.extend(step_messages)
+        return list(messages)
+
     def get_succinct_steps(self) -> list[dict]:
         return [
             {key: value for key, value in step.dict().items() if key != "model_input_messages"} for step in self.steps
@@ -11,23 +11,30 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import importlib.util
 import json
 import logging
 import os
+import queue
+import time
 import uuid
 import warnings
+from concurrent.futures import Future
 from copy import deepcopy
 from dataclasses import asdict, dataclass
 from enum import Enum
-from typing import TYPE_CHECKING, Any, Dict, List, Optional, Union
+from threading import Lock, Thread
+from typing import TYPE_CHECKING, Any, Callable, Dict, Generator, Iterable, List, Optional, Tuple, Union
 
+from .cache import Cache, MemoryCache, get_cache_key
 from .tools import Tool
 from .utils import _is_package_available, encode_image_base64, make_image_url, parse_json_blob
 
 
 if TYPE_CHECKING:
     from transformers import StoppingCriteriaList
+    from vllm import RequestOutput, SamplingParams
 
 logger = logging.getLogger(__name__)
 
@@ -114,6 +121,164 @@ class ChatMessage:
         return json.dumps(get_dict_from_nested_dataclasses(self))
 
 
+@dataclass
+class ChatMessageToolCallStreamDelta:
+    """Fragment of a tool call streamed by a model: the arguments of a tool call are streamed as pieces of a string."""
+
+    index: int
+    id: Optional[str] = None
+    type: Optional[str] = None
+    name: Optional[str] = None
+    arguments: Optional[str] = None
+
+
+@dataclass
+class ChatMessageStreamDelta:
+    """Piece of a chat message streamed by a model, as yielded by `Model.generate_stream`."""
+
+    content: Optional[str] = None
+    tool_calls: Optional[List[ChatMessageToolCallStreamDelta]] = None
+
+    @classmethod
+    def from_api_chunk(cls, chunk) -> Optional["ChatMessageStreamDelta"]:
+        """Creates a delta from a chunk streamed by an OpenAI-compatible API, or returns None if it has no choices."""
+        if not chunk.choices:
+            return None
+        delta = chunk.choices[0].delta
+        tool_calls = None
+        if getattr(delta, "tool_calls", None):
+            tool_calls = [
+                ChatMessageToolCallStreamDelta(
+                    index=tool_call.index if tool_call.index is not None else 0,
+                    id=tool_call.id,
+                    type=tool_call.type,
+                    name=tool_call.function.name if tool_call.function else None,
+                    arguments=tool_call.function.arguments if tool_call.function else None,
+                )
+                for tool_call in delta.tool_calls
+            ]
+        return cls(content=delta.content, tool_calls=tool_calls)
+
+
+def agglomerate_stream_deltas(deltas: Iterable[ChatMessageStreamDelta]) -> ChatMessage:
+    """
+    Builds the complete chat message from the deltas streamed by a model.
+
+    Args:
+        deltas (`Iterable[ChatMessageStreamDelta]`): Deltas yielded by `Model.generate_stream`.
+    """
+    content = ""
+    tool_calls: Dict[int, Dict[str, Any]] = {}
+    for delta in deltas:
+        if delta.content:
+            content += delta.content
+        for tool_call_delta in delta.tool_calls or []:
+            tool_call = tool_calls.setdefault(
+                tool_call_delta.index, {"id": None, "type": "function", "name": "", "arguments": ""}
+            )
+            if tool_call_delta.id:
+                tool_call["id"] = tool_call_delta.id
+            if tool_call_delta.type:
+                tool_call["type"] = tool_call_delta.type
+            if tool_call_delta.name:
+                tool_call["name"] += tool_call_delta.name
+            if tool_call_delta.arguments:
+                tool_call["arguments"] += tool_call_delta.arguments
+    return ChatMessage(
+        role=MessageRole.ASSISTANT,
+        content=content,
+        tool_calls=[
+            ChatMessageToolCall(
+                function=ChatMessageToolCallDefinition(
+                    name=tool_call["name"], arguments=parse_json_if_needed(tool_call["arguments"])
+                ),
+                id=tool_call["id"] or str(uuid.uuid4()),
+                type=tool_call["type"],
+            )
+            for _, tool_call in sorted(tool_calls.items())
+        ]
+        or None,
+    )
+
+
+class StopSequenceMatcher:
+    """
+    Finds the first stop sequence in a text streamed chunk by chunk.
+
+    Only the end of the streamed text, shorter than the longest stop sequence, is kept between chunks: checking a chunk
+    takes a time proportional to its length, and not to the length of the whole text. The end of the text that could be
+    the start of a stop sequence is held back until the next chunks tell whether it is one.
+
+    Args:
+        stop_sequences (`list[str]`, *optional*): Strings that stop the generation.
+    """
+
+    def __init__(self, stop_sequences: Optional[List[str]]):
+        self.stop_sequences = [stop_sequence for stop_sequence in stop_sequences or [] if stop_sequence]
+        self.tail_length = max((len(stop_sequence) for stop_sequence in self.stop_sequences), default=1) - 1
+        self.tail = ""
+        self.held_back_length = 0
+        self.is_stopped = False
+
+    def update(self, chunk: str) -> Tuple[str, bool]:
+        """
+        Adds a chunk of streamed text.
+
+        Returns:
+            `tuple[str, bool]`: The text released by this chunk, which is not part of a stop sequence, and whether a
+            stop sequence was found. Once a stop sequence is found, the following chunks are ignored.
+        """
+        if self.is_stopped:
+            return "", True
+        text = self.tail + chunk
+        released_start = len(self.tail) - self.held_back_length
+        # A stop sequence contained in the tail would have been found with the previous chunks
+        stop_indices = [text.find(stop_sequence) for stop_sequence in self.stop_sequences]
+        stop_indices = [stop_index for stop_index in stop_indices if stop_index != -1]
+        if stop_indices:
+            self.is_stopped = True
+            return text[released_start : min(stop_indices)], True
+        self.held_back_length = next(
+            (
+                length
+                for length in range(min(self.tail_length, len(text)), 0, -1)
+                if any(stop_sequence.startswith(text[-length:]) for stop_sequence in self.stop_sequences)
+            ),
+            0,
+        )
+        self.tail = text[max(0, len(text) - self.tail_length) :]
+        return text[released_start : len(text) - self.held_back_length], False
+
+    def flush(self) -> str:
+        """Releases the held back text, once the stream is over."""
+        held_back_text = self.tail[max(0, len(self.tail) - self.held_back_length) :] if not self.is_stopped else ""
+        self.held_back_length = 0
+        return held_back_text
+
+
+def stream_until_stop_sequences(
+    text_chunks: Iterable[str], stop_sequences: Optional[List[str]]
+) -> Generator[str, None, None]:
+    """
+    Yields the streamed text chunks up to the first stop sequence, excluded. The end of the text that could be the start
+    of a stop sequence is held back until the next chunks tell whether it is one.
+
+    Args:
+        text_chunks (`Iterable[str]`): Text chunks generated by a model.
+        stop_sequences (`list[str]`, *optional*): Strings that stop the generation.
+    """
+    stop_sequence_matcher = StopSequenceMatcher(stop_sequences)
+    for chunk in text_chunks:
+        text, is_stopped = stop_sequence_matcher.update(chunk)
+        if text:
+            yield text
+        if is_stopped:
+            return
+    text = stop_sequence_matcher.flush()
+    if text:
+        yield text
+
+
 def parse_json_if_needed(arguments: Union[str, dict]) -> Union[str, dict]:
     if isinstance(arguments, dict):
         return arguments
@@ -171,6 +336,16 @@ def remove_stop_sequences(content: str, stop_sequences: List[str]) -> str:
     return content
 
 
+def get_common_prefix_length(first_sequence: List[int], second_sequence: List[int]) -> int:
+    """Returns the length of the longest common prefix of two sequences of token ids."""
+    prefix_length = 0
+    for first_token, second_token in zip(first_sequence, second_sequence):
+        if first_token != second_token:
+            break
+        prefix_length += 1
+    return prefix_length
+
+
 def get_clean_message_list(
     message_list: List[Dict[str, str]],
     role_conversions: Dict[MessageRole, MessageRole] = {},
@@ -188,44 +363,88 @@ def get_clean_message_list(
         flatten_messages_as_text (`bool`, default `False`): Whether to flatten messages as text.
     """
     output_message_list = []
-    message_list = deepcopy(message_list)  # Avoid modifying the original list
+    # The input messages are never modified: new containers are only created for what changes
     for message in message_list:
         role = message["role"]
         if role not in MessageRole.roles():
             raise ValueError(f"Incorrect role {role}, only {MessageRole.roles()} are supported for now.")
 
         if role in role_conversions:
-            message["role"] = role_conversions[role]
+            role = role_conversions[role]
+        content = message["content"]
         # encode images if needed
-        if isinstance(message["content"], list):
-            for element in message["content"]:
-                if element["type"] == "image":
-                    assert not flatten_messages_as_text, f"Cannot use images with {flatten_messages_as_text=}"
-                    if convert_images_to_image_urls:
-                        element.update(
-                            {
-                                "type": "image_url",
-                                "image_url": {"url": make_image_url(encode_image_base64(element.pop("image")))},
-                            }
-                        )
-                    else:
-                        element["image"] = encode_image_base64(element["image"])
-
-        if len(output_message_list) > 0 and message["role"] == output_message_list[-1]["role"]:
-            assert isinstance(message["content"], list), "Error: wrong content:" + str(message["content"])
+        if isinstance(content, list) and any(element["type"] == "image" for element in content):
+            assert not flatten_messages_as_text, f"Cannot use images with {flatten_messages_as_text=}"
+            content = [
+                (clean_image_element(element, convert_images_to_image_urls) if element["type"] == "image" else element)
+                for element in content
+            ]
+
+        if len(output_message_list) > 0 and role == output_message_list[-1]["role"]:
+            assert isinstance(content, list), "Error: wrong content:" + str(content)
             if flatten_messages_as_text:
-                output_message_list[-1]["content"] += message["content"][0]["text"]
+                output_message_list[-1]["content"] += content[0]["text"]
             else:
-                output_message_list[-1]["content"] += message["content"]
+                output_message_list[-1]["content"].extend(content)
         else:
             if flatten_messages_as_text:
-                content = message["content"][0]["text"]
-            else:
-                content = message["content"]
-            output_message_list.append({"role": message["role"], "content": content})
+                content = content[0]["text"]
+            elif isinstance(content, list):
+                # Copied since following messages with the same role are concatenated to it
+                content = list(content)
+            output_message_list.append({"role": role, "content": content})
     return output_message_list
 
 
+def clean_image_element(element: Dict[str, Any], convert_images_to_image_urls: bool) -> Dict[str, Any]:
+    """Returns a copy of an image content element, with its image encoded in base64."""
+    encoded_image = encode_image_base64(element["image"])
+    if convert_images_to_image_urls:
+        element = {key: value for key, value in element.items() if key != "image"}
+        element.update({"type": "image_url", "image_url": {"url": make_image_url(encoded_image)}})
+        return element
+    return {**element, "image": encoded_image}
+
+
+CACHE_CONTROL_MARKER = {"type": "ephemeral"}
+
+
+def add_cache_control_markers(messages: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    Marks the end of the system prompt and the end of the conversation as cache breakpoints, with Anthropic-style
+    `cache_control` markers: the provider can then reuse its cache of the longest marked prefix. As an agent only appends
+    messages to its memory, the conversation marked at one step is the prefix of the next step.
+
+    Args:
+        messages (`list[dict]`): Clean messages, with their content as lists of elements: they are not modified.
+    """
+    if not messages:
+        return messages
+    marked_indices = {len(messages) - 1}
+    if messages[0]["role"] == MessageRole.SYSTEM:
+        marked_indices.add(0)
+    marked_messages = list(messages)
+    for index in marked_indices:
+        content = messages[index]["content"]
+        if not isinstance(content, list) or not content:
+            continue
+        marked_messages[index] = {
+            **messages[index],
+            "content": content[:-1] + [{**content[-1], "cache_control": CACHE_CONTROL_MARKER}],
+        }
+    return marked_messages
+
+
+def get_cached_token_count(usage) -> int:
+    """Returns the number of input tokens read from the provider's prompt cache, as reported in the usage of a response."""
+    prompt_tokens_details = getattr(usage, "prompt_tokens_details", None)
+    cached_token_count = getattr(prompt_tokens_details, "cached_tokens", None)
+    if not isinstance(cached_token_count, int):
+        # Anthropic reports the tokens read from its cache separately
+        cached_token_count = getattr(usage, "cache_read_input_tokens", None)
+    return cached_token_count if isinstance(cached_token_count, int) else 0
+
+
 def get_tool_call_from_text(text: str, tool_name_key: str, tool_arguments_key: str) -> ChatMessageToolCall:
     tool_call_dictionary, _ = parse_json_blob(text)
     try:
@@ -243,20 +462,79 @@ def get_tool_call_from_text(text: str, tool_name_key: str, tool_arguments_key: s
     )
 
 
+class RequestBatcher:
+    """Coalesces the requests submitted concurrently by several threads into batches.
+
+    A worker thread waits for a request, collects the other requests submitted within `max_wait_time` seconds, up to
+    `max_batch_size` requests, then processes them all at once. Each submitting thread gets back its own result.
+
+    Args:
+        process_batch (`Callable[[List[Any]], List[Any]]`): Function processing a list of requests and returning one
+            result per request, in the same order. A result that is an exception is raised in the submitting thread.
+        max_batch_size (`int`, default `8`): Maximum number of requests processed together.
+        max_wait_time (`float`, default `0.01`): Time in seconds to wait for other requests before processing a batch.
+    """
+
+    def __init__(
+        self, process_batch: Callable[[List[Any]], List[Any]], max_batch_size: int = 8, max_wait_time: float = 0.01
+    ):
+        self.process_batch = process_batch
+        self.max_batch_size = max_batch_size
+        self.max_wait_time = max_wait_time
+        self._requests = queue.Queue()
+        self._worker = None
+        self._worker_lock = Lock()
+
+    def submit(self, request: Any) -> Any:
+        """Submits a request and waits for its result."""
+        future = Future()
+        self._requests.put((request, future))
+        with self._worker_lock:
+            if self._worker is None:
+                self._worker = Thread(target=self._process_requests, daemon=True)
+                self._worker.start()
+        return future.result()
+
+    def _process_requests(self):
+        while True:
+            batch = [self._requests.get()]
+            deadline = time.monotonic() + self.max_wait_time
+            while len(batch) < self.max_batch_size:
+                remaining_time = deadline - time.monotonic()
+                if remaining_time <= 0:
+                    break
+                try:
+                    batch.append(self._requests.get(timeout=remaining_time))
+                except queue.Empty:
+                    break
+            try:
+                results = self.process_batch([request for request, _ in batch])
+            except Exception as e:
+                results = [e] * len(batch)
+            for (_, future), result in zip(batch, results):
+                if isinstance(result, BaseException):
+                    future.set_exception(result)
+                else:
+                    future.set_result(result)
+
+
 class Model:
     def __init__(
         self,
         flatten_messages_as_text: bool = False,
         tool_name_key: str = "name",
         tool_arguments_key: str = "arguments",
+        prompt_caching: bool = False,
         **kwargs,
     ):
         self.flatten_messages_as_text = flatten_messages_as_text
         self.tool_name_key = tool_name_key
         self.tool_arguments_key = tool_arguments_key
+        self.prompt_caching = prompt_caching
         self.kwargs = kwargs
         self.last_input_token_count = None
         self.last_output_token_count = None
+        self.last_cached_input_token_count = None
 
     def _prepare_completion_kwargs(
         self,
@@ -283,6 +561,8 @@ class Model:
             convert_images_to_image_urls=convert_images_to_image_urls,
             flatten_messages_as_text=self.flatten_messages_as_text,
         )
+        if self.prompt_caching and not self.flatten_messages_as_text:
+            messages = add_cache_control_markers(messages)
 
         # Use self.kwargs as the base configuration
         completion_kwargs = {
@@ -343,6 +623,94 @@ class Model:
         """
         pass  # To be implemented in child classes!
 
+    async def acall(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        """Asynchronous version of `__call__`, taking the same arguments.
+
+        By default, the model is called in a separate thread so that the event loop is not blocked.
+        API models override this method to use native asynchronous clients instead.
+
+        Returns:
+            `ChatMessage`: A chat message object containing the model's response.
+        """
+        return await asyncio.to_thread(
+            self.__call__,
+            messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            **kwargs,
+        )
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        """Streaming version of `__call__`, taking the same arguments: yields the model's response as it is generated.
+
+        The token counts are updated once the generation is over. By default, the whole response is yielded as a single
+        delta: models that support token streaming override this method. The complete message can be rebuilt from the
+        deltas with `agglomerate_stream_deltas`, then `postprocess_message`.
+
+        Returns:
+            `Generator[ChatMessageStreamDelta]`: The pieces of the model's response.
+        """
+        chat_message = self(
+            messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            **kwargs,
+        )
+        yield ChatMessageStreamDelta(
+            content=chat_message.content,
+            tool_calls=[
+                ChatMessageToolCallStreamDelta(
+                    index=index,
+                    id=tool_call.id,
+                    type=tool_call.type,
+                    name=tool_call.function.name,
+                    arguments=(
+                        tool_call.function.arguments
+                        if isinstance(tool_call.function.arguments, str)
+                        else json.dumps(tool_call.function.arguments)
+                    ),
+                )
+                for index, tool_call in enumerate(chat_message.tool_calls)
+            ]
+            if chat_message.tool_calls
+            else None,
+        )
+
+    def reset(self):
+        """Frees the state that the model keeps across calls, if any.
+
+        Agents call this method when they start a new run with `reset=True`.
+        """
+        pass
+
+    def postprocess_message(self, message: ChatMessage, tools_to_call_from) -> ChatMessage:
+        """Sometimes APIs fail to properly parse a tool call: this function tries to parse."""
+        message.role = MessageRole.ASSISTANT  # Overwrite role if needed
+        if tools_to_call_from:
+            if not message.tool_calls:
+                message.tool_calls = [
+                    get_tool_call_from_text(message.content, self.tool_name_key, self.tool_arguments_key)
+                ]
+            for tool_call in message.tool_calls:
+                tool_call.function.arguments = parse_json_if_needed(tool_call.function.arguments)
+        return message
+
     def to_dict(self) -> Dict:
         """
         Converts the model into a JSON-compatible dictionary.
@@ -365,6 +733,7 @@ class Model:
             "organization",
             "project",
             "azure_endpoint",
+            "prompt_caching",
         ]:
             if hasattr(self, attribute):
                 model_dictionary[attribute] = getattr(self, attribute)
@@ -398,9 +767,14 @@ class VLLMModel(Model):
         model_id (`str`):
             The Hugging Face model ID to be used for inference.
             This can be a path or model identifier from the Hugging Face model hub.
+        max_batch_size (`int`, default `1`):
+            Maximum number of concurrent calls, for instance from agents running in parallel threads, submitted to
+            vLLM as a single batch. The default of 1 submits each call on its own.
+        batch_wait_time (`float`, default `0.01`):
+            Time in seconds to wait for other concurrent calls before submitting a batch.
     """
 
-    def __init__(self, model_id, **kwargs):
+    def __init__(self, model_id, max_batch_size: int = 1, batch_wait_time: float = 0.01, **kwargs):
         if not _is_package_available("vllm"):
             raise ModuleNotFoundError("Please install 'vllm' extra to use VLLMModel: `pip install 'smolagents[vllm]'`")
 
@@ -413,6 +787,18 @@ class VLLMModel(Model):
         self.model = LLM(model=model_id)
         self.tokenizer = get_tokenizer(model_id)
         self._is_vlm = False  # VLLMModel does not support vision models yet.
+        self._request_batcher = (
+            RequestBatcher(self._generate_batch, max_batch_size=max_batch_size, max_wait_time=batch_wait_time)
+            if max_batch_size > 1
+            else None
+        )
+
+    def _generate_batch(self, requests: List[Tuple[str, "SamplingParams"]]) -> List["RequestOutput"]:
+        """Generates the completions of several prompts, each with its own sampling parameters, in one vLLM call."""
+        return self.model.generate(
+            [prompt for prompt, _ in requests],
+            sampling_params=[sampling_params for _, sampling_params in requests],
+        )
 
     def cleanup(self):
         import gc
@@ -472,13 +858,13 @@ class VLLMModel(Model):
             stop=prepared_stop_sequences,
         )
 
-        out = self.model.generate(
-            prompt,
-            sampling_params=sampling_params,
-        )
-        output_text = out[0].outputs[0].text
-        self.last_input_token_count = len(out[0].prompt_token_ids)
-        self.last_output_token_count = len(out[0].outputs[0].token_ids)
+        if self._request_batcher is not None:
+            out = self._request_batcher.submit((prompt, sampling_params))
+        else:
+            out = self._generate_batch([(prompt, sampling_params)])[0]
+        output_text = out.outputs[0].text
+        self.last_input_token_count = len(out.prompt_token_ids)
+        self.last_output_token_count = len(out.outputs[0].token_ids)
         chat_message = ChatMessage(
             role=MessageRole.ASSISTANT,
             content=output_text,
@@ -559,6 +945,39 @@ class MLXModel(Model):
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
     ) -> ChatMessage:
+        prompt_ids, stops, completion_kwargs = self._prepare_generation(
+            messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+        )
+        text = "".join(self._generate_text(prompt_ids, stops, completion_kwargs))
+        chat_message = ChatMessage(
+            role=MessageRole.ASSISTANT, content=text, raw={"out": text, "completion_kwargs": completion_kwargs}
+        )
+        if tools_to_call_from:
+            chat_message.tool_calls = [get_tool_call_from_text(text, self.tool_name_key, self.tool_arguments_key)]
+        return chat_message
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        prompt_ids, stops, completion_kwargs = self._prepare_generation(
+            messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+        )
+        for text in self._generate_text(prompt_ids, stops, completion_kwargs):
+            yield ChatMessageStreamDelta(content=text)
+
+    def _prepare_generation(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Tuple[List[int], List[str], Dict[str, Any]]:
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -576,23 +995,20 @@ class MLXModel(Model):
             tools=tools,
             add_generation_prompt=True,
         )
+        return prompt_ids, stops, completion_kwargs
 
+    def _generate_text(
+        self, prompt_ids: List[int], stops: List[str], completion_kwargs: Dict[str, Any]
+    ) -> Generator[str, None, None]:
         self.last_input_token_count = len(prompt_ids)
         self.last_output_token_count = 0
-        text = ""
-        for response in self.stream_generate(self.model, self.tokenizer, prompt=prompt_ids, **completion_kwargs):
-            self.last_output_token_count += 1
-            text += response.text
-            if any((stop_index := text.rfind(stop)) != -1 for stop in stops):
-                text = text[:stop_index]
-                break
 
-        chat_message = ChatMessage(
-            role=MessageRole.ASSISTANT, content=text, raw={"out": text, "completion_kwargs": completion_kwargs}
-        )
-        if tools_to_call_from:
-            chat_message.tool_calls = [get_tool_call_from_text(text, self.tool_name_key, self.tool_arguments_key)]
-        return chat_message
+        def generate_token_texts():
+            for response in self.stream_generate(self.model, self.tokenizer, prompt=prompt_ids, **completion_kwargs):
+                self.last_output_token_count += 1
+                yield response.text
+
+        yield from stream_until_stop_sequences(generate_token_texts(), stops)
 
 
 class TransformersModel(Model):
@@ -613,6 +1029,19 @@ class TransformersModel(Model):
             The torch_dtype to initialize your model with.
         trust_remote_code (bool, default `False`):
             Some models on the Hub require running remote code: for this model, you would have to set this flag to True.
+        kv_cache_max_entries (`int`, default `1`):
+            Maximum number of key-value caches kept from previous generations. A new prompt reuses the cache sharing
+            its longest token prefix, so that only the new tokens of an agent step need to be processed. Increase it
+            when the model is shared by several agents, or set it to 0 to disable the reuse.
+        kv_cache_max_tokens (`int`, *optional*):
+            Maximum total number of tokens held by the kept key-value caches: the least recently used caches are
+            evicted beyond it.
+        max_batch_size (`int`, default `1`):
+            Maximum number of concurrent calls, for instance from agents running in parallel threads, generated as a
+            single padded batch. Only calls sharing their generation settings and stop sequences are batched together.
+            The default of 1 runs each call on its own.
+        batch_wait_time (`float`, default `0.01`):
+            Time in seconds to wait for other concurrent calls before running a batch.
         kwargs (dict, *optional*):
             Any additional keyword arguments that you want to use in model.generate(), for instance `max_new_tokens` or `device`.
         **kwargs:
@@ -641,6 +1070,10 @@ class TransformersModel(Model):
         device_map: Optional[str] = None,
         torch_dtype: Optional[str] = None,
         trust_remote_code: bool = False,
+        kv_cache_max_entries: int = 1,
+        kv_cache_max_tokens: Optional[int] = None,
+        max_batch_size: int = 1,
+        batch_wait_time: float = 0.01,
         **kwargs,
     ):
         try:
@@ -695,37 +1128,93 @@ class TransformersModel(Model):
                 raise e
         except Exception as e:
             raise ValueError(f"Failed to load tokenizer and model for {model_id=}: {e}") from e
+        self.kv_cache_max_entries = kv_cache_max_entries
+        self.kv_cache_max_tokens = kv_cache_max_tokens
+        # Token ids and key-value cache of previous generations, from least to most recently used
+        self._kv_caches: List[Tuple[List[int], Any]] = []
+        self._kv_caches_lock = Lock()
+        self._request_batcher = (
+            RequestBatcher(self._generate_batch, max_batch_size=max_batch_size, max_wait_time=batch_wait_time)
+            if max_batch_size > 1
+            else None
+        )
         super().__init__(flatten_messages_as_text=not self._is_vlm, **kwargs)
 
+    def reset(self):
+        with self._kv_caches_lock:
+            self._kv_caches = []
+
+    def _get_kv_cache(self, prompt_tensor) -> Tuple[Optional[Any], int]:
+        """Returns a key-value cache for the generation, and the number of prompt tokens it already holds.
+
+        The cache holding the longest prefix of the prompt is taken out of the kept caches and cropped to this prefix.
+        """
+        # Image inputs are not part of the token ids, so prompts with images cannot be compared by their token ids
+        if not self.kv_cache_max_entries or set(prompt_tensor.keys()) - {"input_ids", "attention_mask"}:
+            return None, 0
+        from transformers import DynamicCache
+
+        input_ids = prompt_tensor["input_ids"][0].tolist()
+        with self._kv_caches_lock:
+            prefix_lengths = [get_common_prefix_length(token_ids, input_ids) for token_ids, _ in self._kv_caches]
+            if not prefix_lengths or max(prefix_lengths) == 0:
+                return DynamicCache(), 0
+            best_index = prefix_lengths.index(max(prefix_lengths))
+            _, kv_cache = self._kv_caches.pop(best_index)
+        # At least one token of the prompt must be processed to generate the next one
+        cached_token_count = min(prefix_lengths[best_index], len(input_ids) - 1)
+        kv_cache.crop(cached_token_count)
+        return kv_cache, cached_token_count
+
+    def _store_kv_cache(self, kv_cache, sequence):
+        """Keeps the key-value cache filled by a generation, evicting the least recently used caches if needed."""
+        if kv_cache is None or kv_cache.get_seq_length() == 0:
+            return
+        token_ids = sequence[: kv_cache.get_seq_length()].tolist()
+        with self._kv_caches_lock:
+            self._kv_caches.append((token_ids, kv_cache))
+            while len(self._kv_caches) > self.kv_cache_max_entries or (
+                self.kv_cache_max_tokens is not None
+                and sum(len(token_ids) for token_ids, _ in self._kv_caches) > self.kv_cache_max_tokens
+            ):
+                self._kv_caches.pop(0)
+
     def make_stopping_criteria(self, stop_sequences: List[str], tokenizer) -> "StoppingCriteriaList":
+        import torch
         from transformers import StoppingCriteria, StoppingCriteriaList
 
         class StopOnStrings(StoppingCriteria):
             def __init__(self, stop_strings: List[str], tokenizer):
                 self.stop_strings = stop_strings
                 self.tokenizer = tokenizer
-                self.stream = ""
+                self.stop_sequence_matchers = None
 
             def reset(self):
-                self.stream = ""
+                self.stop_sequence_matchers = None
 
             def __call__(self, input_ids, scores, **kwargs):
-                generated = self.tokenizer.decode(input_ids[0][-1], skip_special_tokens=True)
-                self.stream += generated
-                if any([self.stream.endswith(stop_string) for stop_string in self.stop_strings]):
-                    return True
-                return False
+                # Each row of a batch stops on its own
+                if self.stop_sequence_matchers is None:
+                    self.stop_sequence_matchers = [
+                        StopSequenceMatcher(self.stop_strings) for _ in range(input_ids.shape[0])
+                    ]
+                generated = self.tokenizer.batch_decode(input_ids[:, -1:], skip_special_tokens=True)
+                is_done = [
+                    stop_sequence_matcher.update(token_text)[1]
+                    for stop_sequence_matcher, token_text in zip(self.stop_sequence_matchers, generated)
+                ]
+                return torch.tensor(is_done, dtype=torch.bool, device=input_ids.device)
 
         return StoppingCriteriaList([StopOnStrings(stop_sequences, tokenizer)])
 
-    def __call__(
+    def _prepare_generation(
         self,
         messages: List[Dict[str, str]],
         stop_sequences: Optional[List[str]] = None,
         grammar: Optional[str] = None,
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
-    ) -> ChatMessage:
+    ) -> Tuple[Dict[str, Any], Optional[List[str]], Dict[str, Any]]:
         completion_kwargs = self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
@@ -765,7 +1254,6 @@ class TransformersModel(Model):
             )
 
         prompt_tensor = prompt_tensor.to(self.model.device)
-        count_prompt_tokens = prompt_tensor["input_ids"].shape[1]
 
         if stop_sequences:
             stopping_criteria = self.make_stopping_criteria(
@@ -773,27 +1261,119 @@ class TransformersModel(Model):
             )
         else:
             stopping_criteria = None
+        return prompt_tensor, stop_sequences, {**completion_kwargs, "stopping_criteria": stopping_criteria}
 
-        out = self.model.generate(
-            **prompt_tensor,
-            stopping_criteria=stopping_criteria,
-            **completion_kwargs,
-        )
+    def _generate(
+        self, prompt_tensor, stop_sequences: Optional[List[str]], generation_kwargs: Dict[str, Any]
+    ) -> Tuple[str, int, int, int]:
+        """Runs a generation, returning the output text and the counts of input, output and cached input tokens."""
+        count_prompt_tokens = prompt_tensor["input_ids"].shape[1]
+        kv_cache, cached_token_count = self._get_kv_cache(prompt_tensor)
+        if kv_cache is not None:
+            generation_kwargs["past_key_values"] = kv_cache
+
+        out = self.model.generate(**prompt_tensor, **generation_kwargs)
+        self._store_kv_cache(generation_kwargs.pop("past_key_values", None), out[0])
         generated_tokens = out[0, count_prompt_tokens:]
         if hasattr(self, "processor"):
             output_text = self.processor.decode(generated_tokens, skip_special_tokens=True)
         else:
             output_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
-        self.last_input_token_count = count_prompt_tokens
-        self.last_output_token_count = len(generated_tokens)
+        return output_text, count_prompt_tokens, len(generated_tokens), cached_token_count
+
+    def _generate_padded_batch(
+        self, requests: List[Tuple[Any, Optional[List[str]], Dict[str, Any]]]
+    ) -> List[Tuple[str, int, int, int]]:
+        """Runs the generations of several text prompts sharing their generation settings as one padded batch."""
+        import torch
+
+        # The requests share their settings, and the stopping criteria check each row of the batch on its own
+        _, _, generation_kwargs = requests[0]
+        pad_token_id = (
+            self.tokenizer.pad_token_id if self.tokenizer.pad_token_id is not None else self.tokenizer.eos_token_id
+        )
+        prompt_lengths = [prompt_tensor["input_ids"].shape[1] for prompt_tensor, _, _ in requests]
+        max_prompt_length = max(prompt_lengths)
+        input_ids = torch.full(
+            (len(requests), max_prompt_length), pad_token_id, dtype=torch.long, device=self.model.device
+        )
+        attention_mask = torch.zeros_like(input_ids)
+        # Prompts are padded on the left, so that the generated tokens of all rows start at the same position
+        for row, ((prompt_tensor, _, _), prompt_length) in enumerate(zip(requests, prompt_lengths)):
+            input_ids[row, max_prompt_length - prompt_length :] = prompt_tensor["input_ids"][0]
+            attention_mask[row, max_prompt_length - prompt_length :] = 1
+
+        out = self.model.generate(
+            input_ids=input_ids, attention_mask=attention_mask, pad_token_id=pad_token_id, **generation_kwargs
+        )
+        outputs = []
+        for row, prompt_length in enumerate(prompt_lengths):
+            generated_tokens = out[row, max_prompt_length:]
+            # Rows that finish early are padded until the end of the batch
+            generated_tokens = generated_tokens[generated_tokens != pad_token_id]
+            output_text = self.tokenizer.decode(generated_tokens, skip_special_tokens=True)
+            outputs.append((output_text, prompt_length, len(generated_tokens), 0))
+        return outputs
+
+    def _generate_batch(
+        self, requests: List[Tuple[Any, Optional[List[str]], Dict[str, Any]]]
+    ) -> List[Union[Tuple[str, int, int, int], Exception]]:
+        """Runs the generations of concurrent calls, batching together the text prompts with the same settings."""
+        groups = {}
+        for index, (prompt_tensor, stop_sequences, generation_kwargs) in enumerate(requests):
+            if hasattr(self, "tokenizer") and not set(prompt_tensor.keys()) - {"input_ids", "attention_mask"}:
+                generation_settings = sorted(
+                    (key, value) for key, value in generation_kwargs.items() if key != "stopping_criteria"
+                )
+                group_key = repr((stop_sequences, generation_settings))
+            else:
+                group_key = index
+            groups.setdefault(group_key, []).append(index)
+
+        outputs = [None] * len(requests)
+        for indices in groups.values():
+            try:
+                if len(indices) == 1:
+                    # A single prompt can reuse the key-value cache of previous generations
+                    group_outputs = [self._generate(*requests[indices[0]])]
+                else:
+                    group_outputs = self._generate_padded_batch([requests[index] for index in indices])
+            except Exception as e:
+                group_outputs = [e] * len(indices)
+            for index, output in zip(indices, group_outputs):
+                outputs[index] = output
+        return outputs
+
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        prompt_tensor, stop_sequences, generation_kwargs = self._prepare_generation(
+            messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+        )
+        if self._request_batcher is not None:
+            output = self._request_batcher.submit((prompt_tensor, stop_sequences, generation_kwargs))
+        else:
+            output = self._generate(prompt_tensor, stop_sequences, generation_kwargs)
+        (
+            output_text,
+            self.last_input_token_count,
+            self.last_output_token_count,
+            self.last_cached_input_token_count,
+        ) = output
 
         if stop_sequences is not None:
             output_text = remove_stop_sequences(output_text, stop_sequences)
 
+        generation_kwargs.pop("stopping_criteria")
         chat_message = ChatMessage(
             role=MessageRole.ASSISTANT,
             content=output_text,
-            raw={"out": output_text, "completion_kwargs": completion_kwargs},
+            raw={"out": output_text, "completion_kwargs": generation_kwargs},
         )
         if tools_to_call_from:
             chat_message.tool_calls = [
@@ -801,22 +1381,74 @@ class TransformersModel(Model):
             ]
         return chat_message
 
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        from transformers import TextIteratorStreamer
+
+        prompt_tensor, stop_sequences, generation_kwargs = self._prepare_generation(
+            messages, stop_sequences, grammar, tools_to_call_from, **kwargs
+        )
+        count_prompt_tokens = prompt_tensor["input_ids"].shape[1]
+        kv_cache, cached_token_count = self._get_kv_cache(prompt_tensor)
+        if kv_cache is not None:
+            generation_kwargs["past_key_values"] = kv_cache
+        streamer = TextIteratorStreamer(
+            self.processor if hasattr(self, "processor") else self.tokenizer,
+            skip_prompt=True,
+            skip_special_tokens=True,
+        )
+        outputs = []
+        # The generation runs in a thread, which feeds the streamer with the decoded text as tokens are generated
+        generation_thread = Thread(
+            target=lambda: outputs.append(self.model.generate(**prompt_tensor, **generation_kwargs, streamer=streamer))
+        )
+        generation_thread.start()
+        try:
+            for text in stream_until_stop_sequences(streamer, stop_sequences):
+                yield ChatMessageStreamDelta(content=text)
+        finally:
+            # The stopping criteria end the generation after a stop sequence
+            generation_thread.join()
+        if outputs:
+            self._store_kv_cache(kv_cache, outputs[0][0])
+        self.last_input_token_count = count_prompt_tokens
+        self.last_output_token_count = len(outputs[0][0, count_prompt_tokens:]) if outputs else 0
+        self.last_cached_input_token_count = cached_token_count
+
 
 class ApiModel(Model):
     def __init__(self, **kwargs):
         super().__init__(**kwargs)
 
-    def postprocess_message(self, message: ChatMessage, tools_to_call_from) -> ChatMessage:
-        """Sometimes APIs fail to properly parse a tool call: this function tries to parse."""
-        message.role = MessageRole.ASSISTANT  # Overwrite role if needed
-        if tools_to_call_from:
-            if not message.tool_calls:
-                message.tool_calls = [
-                    get_tool_call_from_text(message.content, self.tool_name_key, self.tool_arguments_key)
-                ]
-            for tool_call in message.tool_calls:
-                tool_call.function.arguments = parse_json_if_needed(tool_call.function.arguments)
-        return message
+    def _parse_api_stream(self, stream) -> Generator[ChatMessageStreamDelta, None, None]:
+        """Converts the chunks streamed by an OpenAI-compatible API into deltas, and records the token counts."""
+        self.last_input_token_count = 0
+        self.last_output_token_count = 0
+        self.last_cached_input_token_count = 0
+        for chunk in stream:
+            if getattr(chunk, "usage", None):
+                self.last_input_token_count = chunk.usage.prompt_tokens
+                self.last_output_token_count = chunk.usage.completion_tokens
+                self.last_cached_input_token_count = get_cached_token_count(chunk.usage)
+            delta = ChatMessageStreamDelta.from_api_chunk(chunk)
+            if delta is not None:
+                yield delta
+
+
+def import_litellm():
+    try:
+        import litellm
+    except ModuleNotFoundError:
+        raise ModuleNotFoundError(
+            "Please install 'litellm' extra to use LiteLLMModel: `pip install 'smolagents[litellm]'`"
+        )
+    return litellm
 
 
 class LiteLLMModel(ApiModel):
@@ -834,6 +1466,10 @@ class LiteLLMModel(ApiModel):
             Useful for specific models that do not support specific message roles like "system".
         flatten_messages_as_text (`bool`, *optional*): Whether to flatten messages as text.
             Defaults to `True` for models that start with "ollama", "groq", "cerebras".
+        prompt_caching (`bool`, *optional*): Whether to mark the system prompt and the conversation with
+            `cache_control` markers, so that the provider caches the prompt prefix shared by successive calls.
+            Defaults to `True` for Anthropic models, which require these markers: other providers like OpenAI cache
+            prompt prefixes automatically.
         **kwargs:
             Additional keyword arguments to pass to the OpenAI API.
     """
@@ -845,6 +1481,7 @@ class LiteLLMModel(ApiModel):
         api_key=None,
         custom_role_conversions: Optional[Dict[str, str]] = None,
         flatten_messages_as_text: bool | None = None,
+        prompt_caching: bool | None = None,
         **kwargs,
     ):
         if not model_id:
@@ -864,24 +1501,22 @@ class LiteLLMModel(ApiModel):
             if flatten_messages_as_text is not None
             else self.model_id.startswith(("ollama", "groq", "cerebras"))
         )
-        super().__init__(flatten_messages_as_text=flatten_messages_as_text, **kwargs)
+        prompt_caching = (
+            prompt_caching
+            if prompt_caching is not None
+            else self.model_id.startswith("anthropic/") or "claude" in self.model_id
+        )
+        super().__init__(flatten_messages_as_text=flatten_messages_as_text, prompt_caching=prompt_caching, **kwargs)
 
-    def __call__(
+    def _prepare_api_call(
         self,
         messages: List[Dict[str, str]],
         stop_sequences: Optional[List[str]] = None,
         grammar: Optional[str] = None,
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
-    ) -> ChatMessage:
-        try:
-            import litellm
-        except ModuleNotFoundError:
-            raise ModuleNotFoundError(
-                "Please install 'litellm' extra to use LiteLLMModel: `pip install 'smolagents[litellm]'`"
-            )
-
-        completion_kwargs = self._prepare_completion_kwargs(
+    ) -> Dict:
+        return self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
             grammar=grammar,
@@ -894,16 +1529,55 @@ class LiteLLMModel(ApiModel):
             **kwargs,
         )
 
-        response = litellm.completion(**completion_kwargs)
-
+    def _parse_api_response(self, response, tools_to_call_from: Optional[List[Tool]]) -> ChatMessage:
         self.last_input_token_count = response.usage.prompt_tokens
         self.last_output_token_count = response.usage.completion_tokens
+        self.last_cached_input_token_count = get_cached_token_count(response.usage)
         first_message = ChatMessage.from_dict(
             response.choices[0].message.model_dump(include={"role", "content", "tool_calls"}),
             raw=response,
         )
         return self.postprocess_message(first_message, tools_to_call_from)
 
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        litellm = import_litellm()
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = litellm.completion(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        litellm = import_litellm()
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        stream = litellm.completion(**completion_kwargs, stream=True, stream_options={"include_usage": True})
+        yield from self._parse_api_stream(stream)
+
+    async def acall(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        litellm = import_litellm()
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = await litellm.acompletion(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
 
 class HfApiModel(ApiModel):
     """A class to interact with Hugging Face's Inference API for language model interaction.
@@ -957,7 +1631,7 @@ class HfApiModel(ApiModel):
         custom_role_conversions: Optional[Dict[str, str]] = None,
         **kwargs,
     ):
-        from huggingface_hub import InferenceClient
+        from huggingface_hub import AsyncInferenceClient, InferenceClient
 
         super().__init__(**kwargs)
         self.model_id = model_id
@@ -965,17 +1639,19 @@ class HfApiModel(ApiModel):
         if token is None:
             token = os.getenv("HF_TOKEN")
         self.client = InferenceClient(self.model_id, provider=provider, token=token, timeout=timeout)
+        # Used by `acall`: sharing one client across calls reuses its connections
+        self.async_client = AsyncInferenceClient(self.model_id, provider=provider, token=token, timeout=timeout)
         self.custom_role_conversions = custom_role_conversions
 
-    def __call__(
+    def _prepare_api_call(
         self,
         messages: List[Dict[str, str]],
         stop_sequences: Optional[List[str]] = None,
         grammar: Optional[str] = None,
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
-    ) -> ChatMessage:
-        completion_kwargs = self._prepare_completion_kwargs(
+    ) -> Dict:
+        return self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
             grammar=grammar,
@@ -984,13 +1660,50 @@ class HfApiModel(ApiModel):
             custom_role_conversions=self.custom_role_conversions,
             **kwargs,
         )
-        response = self.client.chat_completion(**completion_kwargs)
 
+    def _parse_api_response(self, response, tools_to_call_from: Optional[List[Tool]]) -> ChatMessage:
         self.last_input_token_count = response.usage.prompt_tokens
         self.last_output_token_count = response.usage.completion_tokens
+        self.last_cached_input_token_count = get_cached_token_count(response.usage)
         first_message = ChatMessage.from_hf_api(response.choices[0].message, raw=response)
         return self.postprocess_message(first_message, tools_to_call_from)
 
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = self.client.chat_completion(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        stream = self.client.chat_completion(**completion_kwargs, stream=True, stream_options={"include_usage": True})
+        yield from self._parse_api_stream(stream)
+
+    async def acall(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = await self.async_client.chat_completion(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
 
 class OpenAIServerModel(ApiModel):
     """This model connects to an OpenAI-compatible API server.
@@ -1041,21 +1754,28 @@ class OpenAIServerModel(ApiModel):
             {"api_key": api_key, "base_url": api_base, "organization": organization, "project": project}
         )
         self.client = self.create_client()
+        # Created on the first call to `acall`, then shared by all calls to reuse its connections
+        self.async_client = None
 
     def create_client(self):
         import openai
 
         return openai.OpenAI(**self.client_kwargs)
 
-    def __call__(
+    def create_async_client(self):
+        import openai
+
+        return openai.AsyncOpenAI(**self.client_kwargs)
+
+    def _prepare_api_call(
         self,
         messages: List[Dict[str, str]],
         stop_sequences: Optional[List[str]] = None,
         grammar: Optional[str] = None,
         tools_to_call_from: Optional[List[Tool]] = None,
         **kwargs,
-    ) -> ChatMessage:
-        completion_kwargs = self._prepare_completion_kwargs(
+    ) -> Dict:
+        return self._prepare_completion_kwargs(
             messages=messages,
             stop_sequences=stop_sequences,
             grammar=grammar,
@@ -1065,16 +1785,57 @@ class OpenAIServerModel(ApiModel):
             convert_images_to_image_urls=True,
             **kwargs,
         )
-        response = self.client.chat.completions.create(**completion_kwargs)
+
+    def _parse_api_response(self, response, tools_to_call_from: Optional[List[Tool]]) -> ChatMessage:
         self.last_input_token_count = response.usage.prompt_tokens
         self.last_output_token_count = response.usage.completion_tokens
-
+        self.last_cached_input_token_count = get_cached_token_count(response.usage)
         first_message = ChatMessage.from_dict(
             response.choices[0].message.model_dump(include={"role", "content", "tool_calls"}),
             raw=response,
         )
         return self.postprocess_message(first_message, tools_to_call_from)
 
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = self.client.chat.completions.create(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
+    def generate_stream(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> Generator[ChatMessageStreamDelta, None, None]:
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        stream = self.client.chat.completions.create(
+            **completion_kwargs, stream=True, stream_options={"include_usage": True}
+        )
+        yield from self._parse_api_stream(stream)
+
+    async def acall(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        if self.async_client is None:
+            self.async_client = self.create_async_client()
+        completion_kwargs = self._prepare_api_call(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        response = await self.async_client.chat.completions.create(**completion_kwargs)
+        return self._parse_api_response(response, tools_to_call_from)
+
 
 class AzureOpenAIServerModel(OpenAIServerModel):
     """This model connects to an Azure OpenAI deployment.
@@ -1131,6 +1892,134 @@ class AzureOpenAIServerModel(OpenAIServerModel):
 
         return openai.AzureOpenAI(**self.client_kwargs)
 
+    def create_async_client(self):
+        import openai
+
+        return openai.AsyncAzureOpenAI(**self.client_kwargs)
+
+
+class CachedModel(Model):
+    """Wraps a model to cache its responses, so that identical calls are answered without calling the model again.
+
+    Calls are identified by a hash of the model id, the normalized messages, the stop sequences, the grammar, the JSON
+    schemas of the tools and the generation arguments. The responses are cached with the token counts reported by the
+    wrapped model: on cached responses, the input tokens are reported as cached input tokens.
+
+    Parameters:
+        model (`Model`):
+            The model to wrap.
+        cache ([`Cache`], *optional*):
+            Where to store the responses, for instance a [`SQLiteCache`] or a [`DirectoryCache`] to keep them across
+            runs. Defaults to a [`MemoryCache`].
+        mode (`str`, default `"read_write"`):
+            - `"read_write"`: responses are read from the cache, and the model is only called on cache misses.
+            - `"record"`: the model is always called, and its responses overwrite the cached ones.
+            - `"replay"`: responses are only read from the cache, and cache misses raise an error instead of calling
+              the model. Use it to rerun a recorded run deterministically and offline, for instance in tests.
+
+    Example:
+    ```python
+    >>> model = CachedModel(LiteLLMModel(model_id="gpt-4o"), cache=SQLiteCache("model_cache.db"))
+    >>> agent = CodeAgent(tools=[], model=model)
+    ```
+    """
+
+    def __init__(self, model: Model, cache: Optional[Cache] = None, mode: str = "read_write"):
+        if mode not in ("read_write", "record", "replay"):
+            raise ValueError(f"Unknown cache mode {mode!r}: use 'read_write', 'record' or 'replay'.")
+        super().__init__(
+            flatten_messages_as_text=model.flatten_messages_as_text,
+            tool_name_key=model.tool_name_key,
+            tool_arguments_key=model.tool_arguments_key,
+        )
+        self.model = model
+        self.model_id = getattr(model, "model_id", None)
+        self.cache = cache if cache is not None else MemoryCache()
+        self.mode = mode
+        self.cache_hit_count = 0
+        self.cache_miss_count = 0
+
+    def get_cache_key(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> str:
+        """Returns the key identifying a call in the cache."""
+        return get_cache_key(
+            {
+                "model_class": type(self.model).__name__,
+                "model_id": self.model_id,
+                "messages": get_clean_message_list(messages, convert_images_to_image_urls=True),
+                "stop_sequences": stop_sequences,
+                "grammar": grammar,
+                "tools": [get_tool_json_schema(tool) for tool in tools_to_call_from] if tools_to_call_from else None,
+                "kwargs": {**self.model.kwargs, **kwargs},
+            }
+        )
+
+    def __call__(
+        self,
+        messages: List[Dict[str, str]],
+        stop_sequences: Optional[List[str]] = None,
+        grammar: Optional[str] = None,
+        tools_to_call_from: Optional[List[Tool]] = None,
+        **kwargs,
+    ) -> ChatMessage:
+        cache_key = self.get_cache_key(messages, stop_sequences, grammar, tools_to_call_from, **kwargs)
+        if self.mode != "record":
+            cached_response = self.cache.get(cache_key)
+            if cached_response is not None:
+                self.cache_hit_count += 1
+                self.last_input_token_count = cached_response["input_token_count"]
+                self.last_output_token_count = cached_response["output_token_count"]
+                self.last_cached_input_token_count = cached_response["input_token_count"]
+                return ChatMessage.from_dict(cached_response["message"])
+            if self.mode == "replay":
+                raise ValueError(
+                    f"No cached response for this call to {self.model_id or type(self.model).__name__} in replay mode."
+                )
+
+        chat_message = self.model(
+            messages,
+            stop_sequences=stop_sequences,
+            grammar=grammar,
+            tools_to_call_from=tools_to_call_from,
+            **kwargs,
+        )
+        self.cache_miss_count += 1
+        self.last_input_token_count = self.model.last_input_token_count
+        self.last_output_token_count = self.model.last_output_token_count
+        self.last_cached_input_token_count = self.model.last_cached_input_token_count
+        self.cache.set(
+            cache_key,
+            {
+                "message": json.loads(chat_message.model_dump_json()),
+                "input_token_count": self.last_input_token_count,
+                "output_token_count": self.last_output_token_count,
+            },
+        )
+        return chat_message
+
+    def reset(self):
+        self.model.reset()
+
+    def to_dict(self) -> Dict:
+        """
+        Converts the model into a JSON-compatible dictionary. The cache itself is not serialized.
+        """
+        return {
+            "model": {"class": type(self.model).__name__, "data": self.model.to_dict()},
+            "mode": self.mode,
+        }
+
+    @classmethod
+    def from_dict(cls, model_dictionary: Dict[str, Any]) -> "CachedModel":
+        model_class = globals()[model_dictionary["model"]["class"]]
+        return cls(model_class.from_dict(model_dictionary["model"]["data"]), mode=model_dictionary["mode"])
+
 
 __all__ = [
     "MessageRole",
@@ -1146,4 +2035,9 @@ __all__ = [
     "VLLMModel",
     "AzureOpenAIServerModel",
     "ChatMessage",
+    "ChatMessageStreamDelta",
+    "ChatMessageToolCallStreamDelta",
+    "agglomerate_stream_deltas",
+    "add_cache_control_markers",
+    "CachedModel",
 ]
@@ -16,7 +16,7 @@
 # limitations under the License.
 import json
 from enum import IntEnum
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
 
 from rich import box
 from rich.console import Console, Group
@@ -34,24 +34,45 @@ __all__ = ["AgentLogger", "LogLevel", "Monitor"]
 
 
 class Monitor:
-    def __init__(self, tracked_model, logger):
+    def __init__(self, tracked_model, logger, tracked_tools: Optional[Dict[str, Any]] = None):
         self.step_durations = []
         self.tracked_model = tracked_model
         self.logger = logger
+        self.tracked_tools = tracked_tools if tracked_tools is not None else {}
         if getattr(self.tracked_model, "last_input_token_count", "Not found") != "Not found":
             self.total_input_token_count = 0
             self.total_output_token_count = 0
+            self.total_cached_input_token_count = 0
+        self._tool_cache_counts_at_reset = self._get_tool_cache_counts()
 
     def get_total_token_counts(self):
         return {
             "input": self.total_input_token_count,
             "output": self.total_output_token_count,
+            "cached_input": self.total_cached_input_token_count,
         }
 
+    def _get_tool_cache_counts(self) -> Dict[str, Dict[str, int]]:
+        return {
+            name: {"hits": tool.cache_hit_count, "misses": tool.cache_miss_count}
+            for name, tool in self.tracked_tools.items()
+            if getattr(tool, "cacheable", False) is True
+        }
+
+    def get_tool_cache_stats(self) -> Dict[str, Dict[str, int]]:
+        """Returns the numbers of calls of each cacheable tool answered from its cache or not since the last reset."""
+        tool_cache_stats = {}
+        for name, counts in self._get_tool_cache_counts().items():
+            counts_at_reset = self._tool_cache_counts_at_reset.get(name, {"hits": 0, "misses": 0})
+            tool_cache_stats[name] = {key: counts[key] - counts_at_reset[key] for key in counts}
+        return tool_cache_stats
+
     def reset(self):
         self.step_durations = []
         self.total_input_token_count = 0
         self.total_output_token_count = 0
+        self.total_cached_input_token_count = 0
+        self._tool_cache_counts_at_reset = self._get_tool_cache_counts()
 
     def update_metrics(self, step_log):
         """Update the metrics of the monitor.
@@ -66,9 +87,20 @@ class Monitor:
         if getattr(self.tracked_model, "last_input_token_count", None) is not None:
             self.total_input_token_count += self.tracked_model.last_input_token_count
             self.total_output_token_count += self.tracked_model.last_output_token_count
+            # Part of the input tokens read from the provider's prompt cache, if the model reports it
+            cached_input_token_count = getattr(self.tracked_model, "last_cached_input_token_count", None)
+            if isinstance(cached_input_token_count, int):
+                self.total_cached_input_token_count += cached_input_token_count
             console_outputs += (
                 f"| Input tokens: {self.total_input_token_count:,} | Output tokens: {self.total_output_token_count:,}"
             )
+            if self.total_cached_input_token_count:
+                console_outputs += f" | Cached input tokens: {self.total_cached_input_token_count:,}"
+        tool_cache_stats = self.get_tool_cache_stats().values()
+        tool_cache_hit_count = sum(counts["hits"] for counts in tool_cache_stats)
+        tool_cache_call_count = tool_cache_hit_count + sum(counts["misses"] for counts in tool_cache_stats)
+        if tool_cache_call_count:
+            console_outputs += f" | Tool cache hits: {tool_cache_hit_count:,}/{tool_cache_call_count:,}"
         console_outputs += "]"
         self.logger.log(Text(console_outputs, style="dim"), level=1)
 
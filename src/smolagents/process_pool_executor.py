@@ -0,0 +1,392 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import atexit
+import importlib
+import multiprocessing
+import signal
+import threading
+import time
+from multiprocessing.connection import Connection
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from .local_python_executor import InterpreterError, LocalPythonExecutor, PythonExecutor
+from .tools import Tool
+from .utils import BASE_BUILTIN_MODULES
+
+
+try:
+    import resource
+except ImportError:  # Not available on Windows
+    resource = None
+
+
+DEFAULT_NUM_WORKERS = 2
+
+
+def set_memory_limit(memory_limit_mb: Optional[int]) -> None:
+    """Limits the address space of the current process, or lifts the limit if `memory_limit_mb` is None."""
+    if resource is None:
+        return
+    _, hard_limit = resource.getrlimit(resource.RLIMIT_AS)
+    soft_limit = hard_limit if memory_limit_mb is None else memory_limit_mb * 1024 * 1024
+    if hard_limit != resource.RLIM_INFINITY:
+        soft_limit = min(soft_limit, hard_limit)
+    resource.setrlimit(resource.RLIMIT_AS, (soft_limit, hard_limit))
+
+
+def make_tool_proxy(conn: Connection, tool_name: str) -> Callable:
+    """Creates a function that runs the tool `tool_name` in the parent process and returns its result."""
+
+    def call_tool(*args, **kwargs):
+        conn.send(("call_tool", tool_name, args, kwargs))
+        is_error, value = conn.recv()
+        if is_error:
+            raise value
+        return value
+
+    call_tool.__name__ = tool_name
+    return call_tool
+
+
+def worker_main(conn: Connection, preloaded_modules: List[str]) -> None:
+    """
+    Main loop of a worker process: holds a `LocalPythonExecutor` and runs the commands sent by the parent process.
+    Tool calls made by the code are sent back to the parent process, where the tools live.
+    """
+    # Interrupts are handled by the parent process, which kills the worker if needed
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    for module_name in preloaded_modules:
+        try:
+            importlib.import_module(module_name)
+        except ImportError:
+            pass
+
+    executor = None
+    while True:
+        try:
+            command, *args = conn.recv()
+        except (EOFError, OSError):
+            break
+        if command == "init":
+            authorized_imports, max_print_outputs_length, memory_limit_mb = args
+            for module_name in authorized_imports:
+                if module_name != "*":
+                    try:
+                        importlib.import_module(module_name)
+                    except ImportError:
+                        pass
+            set_memory_limit(memory_limit_mb)
+            executor = LocalPythonExecutor(authorized_imports, max_print_outputs_length=max_print_outputs_length)
+            executor.send_tools({})
+            conn.send(("done",))
+        elif command == "send_tools":
+            (tool_names,) = args
+            executor.send_tools({name: make_tool_proxy(conn, name) for name in tool_names})
+            conn.send(("done",))
+        elif command == "send_variables":
+            (variables,) = args
+            executor.send_variables(variables)
+            conn.send(("done",))
+        elif command == "run":
+            (code_action,) = args
+            try:
+                output, logs, is_final_answer = executor(code_action)
+            except Exception as e:
+                logs = str(executor.state.get("_print_outputs", ""))
+                conn.send(("error", str(e), logs))
+                continue
+            try:
+                conn.send(("result", output, logs, is_final_answer))
+            except Exception as e:
+                if is_final_answer:
+                    conn.send(
+                        ("error", f"Could not send the final answer to the agent: {type(e).__name__}: {e}", logs)
+                    )
+                else:
+                    # Only the string representation of intermediate outputs is shown to the model
+                    conn.send(("result", str(output), logs, is_final_answer))
+        elif command == "reset":
+            executor = None
+            set_memory_limit(None)
+            conn.send(("done",))
+        elif command == "shutdown":
+            break
+    conn.close()
+
+
+class PythonWorker:
+    """A worker process holding a `LocalPythonExecutor`, and the pipe to communicate with it."""
+
+    def __init__(self, mp_context, preloaded_modules: List[str]):
+        self.conn, child_conn = mp_context.Pipe()
+        self.process = mp_context.Process(target=worker_main, args=(child_conn, preloaded_modules), daemon=True)
+        self.process.start()
+        child_conn.close()
+
+    def is_alive(self) -> bool:
+        return self.process.is_alive()
+
+    def kill(self) -> None:
+        self.process.kill()
+        self.process.join()
+        self.conn.close()
+
+    def shutdown(self) -> None:
+        try:
+            self.conn.send(("shutdown",))
+        except (BrokenPipeError, OSError):
+            pass
+        self.process.join(timeout=1)
+        if self.process.is_alive():
+            self.process.kill()
+            self.process.join()
+        self.conn.close()
+
+
+class PythonWorkerPool:
+    """
+    Pool of warm worker processes for [`ProcessPoolPythonExecutor`].
+
+    Workers are started ahead of time with the base modules already imported, so that creating an executor only takes
+    an idle worker from the pool. A worker stays leased to a single executor until it is released, after which its
+    state is cleared and it goes back to the pool.
+
+    Args:
+        num_workers (`int`, default `2`): Number of idle workers kept warm in the pool.
+        preloaded_modules (`list[str]`, *optional*): Modules imported by the workers when they start.
+            Defaults to the base builtin modules.
+        mp_context (`str`, *optional*): Multiprocessing start method used to create the workers, like `"fork"` or
+            `"spawn"`. Defaults to `"forkserver"`, or `"spawn"` on platforms without it such as Windows: forking the
+            parent process could copy locks held by its other threads into the workers.
+    """
+
+    def __init__(
+        self,
+        num_workers: int = DEFAULT_NUM_WORKERS,
+        preloaded_modules: Optional[List[str]] = None,
+        mp_context: Optional[str] = None,
+    ):
+        self.num_workers = num_workers
+        self.preloaded_modules = preloaded_modules if preloaded_modules is not None else list(BASE_BUILTIN_MODULES)
+        if mp_context is None:
+            mp_context = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        self.mp_context = multiprocessing.get_context(mp_context)
+        if mp_context == "forkserver":
+            # Workers are forked from a server that already imported them, unless the server was started before
+            self.mp_context.set_forkserver_preload([__name__, *self.preloaded_modules])
+        self._idle_workers: List[PythonWorker] = []
+        self._lock = threading.Lock()
+        self._closed = False
+        self.fill()
+
+    def fill(self) -> None:
+        """Starts workers until `num_workers` idle workers are available."""
+        with self._lock:
+            while not self._closed and len(self._idle_workers) < self.num_workers:
+                self._idle_workers.append(PythonWorker(self.mp_context, self.preloaded_modules))
+
+    def acquire(self) -> PythonWorker:
+        """Takes an idle worker from the pool, or starts a new one if none is available."""
+        with self._lock:
+            if self._closed:
+                raise RuntimeError("Cannot acquire a worker from a closed pool.")
+            while self._idle_workers:
+                worker = self._idle_workers.pop()
+                if worker.is_alive():
+                    return worker
+        return PythonWorker(self.mp_context, self.preloaded_modules)
+
+    def release(self, worker: PythonWorker) -> None:
+        """Clears the state of a worker and puts it back in the pool, or stops it if the pool is already full."""
+        if not worker.is_alive():
+            return
+        with self._lock:
+            keep_worker = not self._closed and len(self._idle_workers) < self.num_workers
+        if keep_worker:
+            try:
+                worker.conn.send(("reset",))
+                worker.conn.recv()
+            except (EOFError, OSError):
+                return
+            with self._lock:
+                if not self._closed:
+                    self._idle_workers.append(worker)
+                    return
+        worker.shutdown()
+
+    def shutdown(self) -> None:
+        """Stops all idle workers. Workers currently leased are stopped when released."""
+        with self._lock:
+            self._closed = True
+            workers, self._idle_workers = self._idle_workers, []
+        for worker in workers:
+            worker.shutdown()
+
+    def __len__(self) -> int:
+        return len(self._idle_workers)
+
+
+_default_pool: Optional[PythonWorkerPool] = None
+_default_pool_lock = threading.Lock()
+
+
+def get_default_worker_pool() -> PythonWorkerPool:
+    """Returns the worker pool shared by all [`ProcessPoolPythonExecutor`]s created without an explicit pool."""
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            _default_pool = PythonWorkerPool()
+            atexit.register(_default_pool.shutdown)
+        return _default_pool
+
+
+class ProcessPoolPythonExecutor(PythonExecutor):
+    """
+    Executes Python code with the local interpreter, in a worker process taken from a pool of warm workers.
+
+    Each executor keeps the same worker for its whole lifetime, so variables persist between code actions. Tools stay
+    in the main process: the code running in the worker calls them through a pipe. Running the code in a separate
+    process allows to interrupt actions that take too long and to limit the memory they can use.
+
+    Args:
+        additional_authorized_imports (`list[str]`): Additional authorized imports.
+        max_print_outputs_length (`int`, *optional*): Maximum length of the print outputs.
+        timeout (`float`, *optional*): Maximum wall-clock time in seconds for running one code action, not counting
+            the time spent in tool calls. When exceeded, the worker is killed and replaced by a fresh one, losing the
+            variables defined by previous actions.
+        memory_limit_mb (`int`, *optional*): Maximum address space of the worker process, in megabytes.
+            Only supported on Unix systems.
+        pool ([`PythonWorkerPool`], *optional*): Pool to take the worker from. Defaults to a pool shared by all
+            executors.
+    """
+
+    def __init__(
+        self,
+        additional_authorized_imports: List[str],
+        max_print_outputs_length: Optional[int] = None,
+        timeout: Optional[float] = None,
+        memory_limit_mb: Optional[int] = None,
+        pool: Optional[PythonWorkerPool] = None,
+    ):
+        self.additional_authorized_imports = additional_authorized_imports
+        self.authorized_imports = list(set(BASE_BUILTIN_MODULES) | set(self.additional_authorized_imports))
+        self.max_print_outputs_length = max_print_outputs_length
+        self.timeout = timeout
+        self.memory_limit_mb = memory_limit_mb
+        self.pool = pool if pool is not None else get_default_worker_pool()
+        self.tools: Dict[str, Tool] = {}
+        self.variables: Dict[str, Any] = {}
+        # Mirrors the print outputs of the last code action, which live in the worker
+        self.state: Dict[str, Any] = {"_print_outputs": ""}
+        self.worker = None
+        self._start_worker()
+
+    def _start_worker(self) -> None:
+        self.worker = self.pool.acquire()
+        self._request("init", self.authorized_imports, self.max_print_outputs_length, self.memory_limit_mb)
+        if self.variables:
+            self._request("send_variables", self.variables)
+        if self.tools:
+            self._request("send_tools", list(self.tools))
+
+    def _restart_worker(self) -> None:
+        self.worker.kill()
+        self._start_worker()
+
+    def _request(self, command: str, *args) -> Tuple:
+        """Sends a command to the worker and waits for its reply, running the tool calls made in the meantime."""
+        self.worker.conn.send((command, *args))
+        # Only code actions are timed: a fresh worker may still be starting when it receives the other commands
+        remaining_time = self.timeout if command == "run" else None
+        while True:
+            start_time = time.time()
+            try:
+                if not self.worker.conn.poll(remaining_time):
+                    self._restart_worker()
+                    raise InterpreterError(
+                        f"Code execution exceeded the time limit of {self.timeout} seconds and was interrupted. "
+                        "The execution environment was restarted: variables defined in previous steps are lost."
+                    )
+                reply = self.worker.conn.recv()
+            except (EOFError, OSError):
+                exitcode = self.worker.process.exitcode
+                if command == "init":
+                    # Restarting a worker that cannot start would start new ones forever
+                    raise RuntimeError(
+                        "The worker process exited while starting. With the 'forkserver' and 'spawn' start methods, "
+                        "the main module of the program must be guarded by `if __name__ == '__main__':`."
+                    )
+                self._restart_worker()
+                raise InterpreterError(
+                    f"The process running the code exited unexpectedly with code {exitcode}, possibly because it "
+                    "exceeded its memory limit. The execution environment was restarted: variables defined in "
+                    "previous steps are lost."
+                )
+            if remaining_time is not None:
+                remaining_time = max(remaining_time - (time.time() - start_time), 0)
+            if reply[0] != "call_tool":
+                return reply
+            _, tool_name, args, kwargs = reply
+            try:
+                value = self.tools[tool_name](*args, **kwargs)
+            except Exception as e:
+                self._send_tool_error(e)
+            else:
+                try:
+                    self.worker.conn.send((False, value))
+                except Exception as e:
+                    self._send_tool_error(e)
+
+    def _send_tool_error(self, error: Exception) -> None:
+        try:
+            self.worker.conn.send((True, error))
+        except Exception:
+            # The exception cannot be pickled: send its message only
+            self.worker.conn.send((True, RuntimeError(f"{type(error).__name__}: {error}")))
+
+    def __call__(self, code_action: str) -> Tuple[Any, str, bool]:
+        reply = self._request("run", code_action)
+        if reply[0] == "error":
+            _, error_message, logs = reply
+            self.state["_print_outputs"] = logs
+            raise InterpreterError(error_message)
+        _, output, logs, is_final_answer = reply
+        self.state["_print_outputs"] = logs
+        return output, logs, is_final_answer
+
+    def send_variables(self, variables: dict):
+        self.variables.update(variables)
+        self._request("send_variables", variables)
+
+    def send_tools(self, tools: Dict[str, Tool]):
+        self.tools = tools
+        self._request("send_tools", list(tools))
+
+    def cleanup(self):
+        """Gives the worker back to the pool. The executor cannot be used afterwards."""
+        if self.worker is not None:
+            worker, self.worker = self.worker, None
+            self.pool.release(worker)
+
+    def __del__(self):
+        try:
+            self.cleanup()
+        except Exception:
+            pass
+
+
+__all__ = ["ProcessPoolPythonExecutor", "PythonWorkerPool"]
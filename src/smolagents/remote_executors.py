@@ -18,7 +18,10 @@ import base64
 import json
 import pickle
 import re
+import shutil
+import tempfile
 import time
+import uuid
 from io import BytesIO
 from pathlib import Path
 from textwrap import dedent
@@ -159,18 +162,31 @@ class E2BExecutor(RemotePythonExecutor):
 class DockerExecutor(RemotePythonExecutor):
     """
     Executes Python code using Jupyter Kernel Gateway in a Docker container.
+
+    Variables are sent to the container through a temporary directory of the host mounted in the container, as pickle
+    files whose large buffers, such as the data of numpy arrays and pandas DataFrames, are stored in separate files.
+    The kernel memory-maps these files, so large variables are neither encoded in the code nor copied until modified.
+
+    Args:
+        additional_imports (`list[str]`): Additional imports to install.
+        logger (`Logger`): Logger to use.
+        host (`str`, default `"127.0.0.1"`): Host on which the port of the container is published.
+        port (`int`, default `8888`): Port of the host on which the Jupyter Kernel Gateway is published.
+        shared_directory (`bool`, default `True`): Whether to send variables through a directory of the host mounted in
+            the container. Disable it if the Docker daemon runs on another machine: variables are then encoded in the
+            code sent to the kernel.
     """
 
+    container_shared_directory = "/mnt/smolagents"
+
     def __init__(
         self,
         additional_imports: List[str],
         logger,
         host: str = "127.0.0.1",
         port: int = 8888,
+        shared_directory: bool = True,
     ):
-        """
-        Initialize the Docker-based Jupyter Kernel Gateway executor.
-        """
         super().__init__(additional_imports, logger)
         try:
             import docker
@@ -187,6 +203,7 @@ class DockerExecutor(RemotePythonExecutor):
             self.client = docker.from_env()
         except docker.errors.DockerException as e:
             raise RuntimeError("Could not connect to Docker daemon: make sure Docker is running.") from e
+        self.shared_directory = Path(tempfile.mkdtemp(prefix="smolagents-")) if shared_directory else None
 
         # Build and start container
         try:
@@ -208,8 +225,11 @@ CMD ["jupyter", "kernelgateway", "--KernelGatewayApp.ip='0.0.0.0'", "--KernelGat
             self.logger.log(build_logs, level=LogLevel.DEBUG)
 
             self.logger.log(f"Starting container on {host}:{port}...", level=LogLevel.INFO)
+            volumes = {}
+            if self.shared_directory is not None:
+                volumes[str(self.shared_directory)] = {"bind": self.container_shared_directory, "mode": "ro"}
             self.container = self.client.containers.run(
-                "jupyter-kernel", ports={"8888/tcp": (host, port)}, detach=True
+                "jupyter-kernel", ports={"8888/tcp": (host, port)}, volumes=volumes, detach=True
             )
 
             retries = 0
@@ -250,6 +270,35 @@ CMD ["jupyter", "kernelgateway", "--KernelGatewayApp.ip='0.0.0.0'", "--KernelGat
             self.cleanup()
             raise RuntimeError(f"Failed to initialize Jupyter kernel: {e}") from e
 
+    def send_variables(self, variables: dict):
+        """
+        Send variables to the kernel namespace through the shared directory, using pickle with out-of-band buffers.
+        """
+        if self.shared_directory is None:
+            return super().send_variables(variables)
+        buffers = []
+        pickled_vars = pickle.dumps(variables, protocol=5, buffer_callback=buffers.append)
+        file_name = f"variables_{uuid.uuid4().hex}"
+        (self.shared_directory / f"{file_name}.pkl").write_bytes(pickled_vars)
+        for index, buffer in enumerate(buffers):
+            with open(self.shared_directory / f"{file_name}_{index}.buffer", "wb") as f:
+                f.write(buffer.raw())
+        path = f"{self.container_shared_directory}/{file_name}"
+        code = f"""
+import mmap, os, pickle
+def _load_shared_buffer(path):
+    # Copy-on-write mapping: the variable is only copied where the code modifies it
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return bytearray()
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+with open('{path}.pkl', "rb") as f:
+    vars_dict = pickle.load(f, buffers=[_load_shared_buffer(f'{path}_{{index}}.buffer') for index in range({len(buffers)})])
+del _load_shared_buffer
+locals().update(vars_dict)
+"""
+        self.run_code_raise_errors(code)
+
     def run_code_raise_errors(self, code_action: str, return_final_answer: bool = False) -> Tuple[Any, str]:
         """
         Execute code and return result based on whether it's a final answer.
@@ -308,8 +357,6 @@ CMD ["jupyter", "kernelgateway", "--KernelGatewayApp.ip='0.0.0.0'", "--KernelGat
 
     def _send_execute_request(self, code: str) -> str:
         """Send code execution request to kernel."""
-        import uuid
-
         # Generate a unique message ID
         msg_id = str(uuid.uuid4())
 
@@ -346,6 +393,8 @@ CMD ["jupyter", "kernelgateway", "--KernelGatewayApp.ip='0.0.0.0'", "--KernelGat
                 self.logger.log("Container cleanup completed", level=LogLevel.INFO)
         except Exception as e:
             self.logger.log_error(f"Error during cleanup: {e}")
+        if getattr(self, "shared_directory", None) is not None:
+            shutil.rmtree(self.shared_directory, ignore_errors=True)
 
     def delete(self):
         """Ensure cleanup on deletion."""
@@ -0,0 +1,343 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+# Copyright 2024 The HuggingFace Inc. team. All rights reserved.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import contextvars
+import inspect
+import threading
+import time
+from dataclasses import asdict, dataclass
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+
+__all__ = [
+    "CircuitBreaker",
+    "CircuitOpenError",
+    "ToolCallRecord",
+    "ToolSupervisor",
+    "ToolTimeoutError",
+    "is_tool_call_cancelled",
+]
+
+
+_cancellation_event: contextvars.ContextVar[Optional[threading.Event]] = contextvars.ContextVar(
+    "tool_call_cancellation_event", default=None
+)
+
+
+def is_tool_call_cancelled() -> bool:
+    """
+    Returns whether the tool call running in the current thread or task was cancelled by its [`ToolSupervisor`]
+    because it timed out. Long-running tools can check it to stop early, since a thread cannot be stopped from outside.
+    """
+    cancellation_event = _cancellation_event.get()
+    return cancellation_event is not None and cancellation_event.is_set()
+
+
+class ToolTimeoutError(TimeoutError):
+    """Raised when a tool call runs longer than its timeout."""
+
+
+class CircuitOpenError(RuntimeError):
+    """Raised when a tool call is rejected because the circuit breaker of the tool is open."""
+
+
+@dataclass
+class ToolCallRecord:
+    """
+    Decision of a [`ToolSupervisor`] on a tool call, recorded on the [`ActionStep`] during which the call was made.
+
+    Args:
+        tool_name (`str`): Name of the tool.
+        outcome (`str`): `"success"`, `"error"` if the tool raised, `"timeout"` if it ran longer than its timeout,
+            `"rejected"` if the call was not run because the circuit breaker of the tool was open, or
+            `"invalid_arguments"` if the call was not run because its arguments do not match the inputs of the tool.
+        duration (`float`): Time in seconds until the call returned, raised or was abandoned.
+        timeout (`float`, *optional*): Timeout of the call in seconds.
+        circuit_state (`str`): State of the circuit breaker of the tool after the call.
+        error (`str`, *optional*): Error raised by the call.
+    """
+
+    tool_name: str
+    outcome: str
+    duration: float
+    timeout: Optional[float]
+    circuit_state: str
+    error: Optional[str] = None
+
+    def dict(self):
+        return asdict(self)
+
+
+class CircuitBreaker:
+    """
+    Circuit breaker of a tool: after `failure_threshold` consecutive failed calls, the circuit opens and calls are
+    rejected without being run. After `recovery_time` seconds, the circuit is half-open: a single trial call is run,
+    which closes the circuit if it succeeds or opens it again if it fails.
+
+    Args:
+        failure_threshold (`int`, default `3`): Number of consecutive failures that open the circuit.
+        recovery_time (`float`, default `60`): Time in seconds during which calls are rejected once the circuit opens.
+    """
+
+    def __init__(self, failure_threshold: int = 3, recovery_time: float = 60):
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.state = "closed"
+        self.failure_count = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    def allow_call(self) -> bool:
+        """Returns whether a call can be run, starting the trial call if the circuit is half-open."""
+        with self._lock:
+            if self.state == "open" and time.time() - self.opened_at >= self.recovery_time:
+                self.state = "half_open"
+                return True
+            return self.state == "closed"
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failure_count = 0
+
+    def record_failure(self):
+        with self._lock:
+            self.failure_count += 1
+            if self.state == "half_open" or self.failure_count >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.time()
+
+
+class ToolSupervisor:
+    """
+    Supervises the tool calls of an agent, so that a slow or failing tool cannot stall it.
+
+    - Each call runs with a timeout: the agent gets a [`ToolTimeoutError`] once it expires, while the call is
+      cancelled. Async tools are cancelled directly. Sync tools keep running in a background thread, so they should
+      check [`is_tool_call_cancelled`] to stop early. The shared [`HttpClient`] does this check before each request.
+    - Each tool has a [`CircuitBreaker`]: a tool whose calls keep failing or timing out gets its calls rejected with a
+      [`CircuitOpenError`] for a while, instead of making the agent wait for them. Calls whose arguments do not match
+      the inputs of the tool are not run and do not count as failures: they are mistakes of the caller, not of the tool.
+
+    Each decision is recorded as a [`ToolCallRecord`] in the `tool_call_records` of the current [`ActionStep`].
+
+    Args:
+        timeout (`float`, *optional*): Timeout of the tool calls in seconds. By default, calls have no timeout.
+        tool_timeouts (`dict[str, float]`, *optional*): Timeouts of specific tools or managed agents by name,
+            overriding `timeout`. Map a name to `None` to run its calls without timeout.
+        failure_threshold (`int`, default `3`): Number of consecutive failed calls that open the circuit of a tool.
+        recovery_time (`float`, default `60`): Time in seconds during which the calls of a tool are rejected once its
+            circuit opens.
+
+    Example:
+    ```python
+    >>> supervisor = ToolSupervisor(timeout=30, tool_timeouts={"visit_webpage": 10})
+    >>> agent = CodeAgent(tools=[VisitWebpageTool()], model=model, tool_supervisor=supervisor)
+    ```
+    """
+
+    def __init__(
+        self,
+        timeout: Optional[float] = None,
+        tool_timeouts: Optional[Dict[str, Optional[float]]] = None,
+        failure_threshold: int = 3,
+        recovery_time: float = 60,
+    ):
+        self.timeout = timeout
+        self.tool_timeouts = tool_timeouts or {}
+        self.failure_threshold = failure_threshold
+        self.recovery_time = recovery_time
+        self.circuit_breakers: Dict[str, CircuitBreaker] = {}
+        self._records: List[ToolCallRecord] = []
+        self._lock = threading.Lock()
+
+    def get_timeout(self, tool_name: str) -> Optional[float]:
+        return self.tool_timeouts.get(tool_name, self.timeout)
+
+    def get_circuit_breaker(self, tool_name: str) -> CircuitBreaker:
+        with self._lock:
+            if tool_name not in self.circuit_breakers:
+                self.circuit_breakers[tool_name] = CircuitBreaker(self.failure_threshold, self.recovery_time)
+            return self.circuit_breakers[tool_name]
+
+    def pop_records(self) -> List[ToolCallRecord]:
+        """Returns the records of the calls made since the last call to this method."""
+        with self._lock:
+            records, self._records = self._records, []
+        return records
+
+    def wrap(self, tool_name: str, tool: Callable) -> Callable:
+        """Returns a function calling `tool` under supervision, for instance to give it to a Python executor."""
+
+        def supervised_tool(*args, **kwargs):
+            self.check_arguments(tool_name, tool, *args, **kwargs)
+            return self.call(tool_name, tool, *args, **kwargs)
+
+        return supervised_tool
+
+    def check_arguments(self, tool_name: str, tool: Callable, *args, **kwargs):
+        """
+        Raises a `TypeError` if the arguments do not match the inputs of `tool`, without counting it as a failure of the
+        tool. Call it before `call` when `function` checks the arguments itself, since its errors count as failures.
+
+        Args:
+            tool_name (`str`): Name of the tool.
+            tool (`Callable`): Tool or managed agent, checked against the signature of its `forward` or `__call__` method.
+        """
+        if hasattr(tool, "forward") and hasattr(tool, "inputs"):
+            function = tool.forward
+            # Like `Tool.__call__`, accept the arguments as a single dictionary
+            if (
+                len(args) == 1
+                and not kwargs
+                and isinstance(args[0], dict)
+                and all(key in tool.inputs for key in args[0])
+            ):
+                args, kwargs = (), args[0]
+        else:
+            function = tool
+        try:
+            signature = inspect.signature(function)
+        except (TypeError, ValueError):
+            # Builtins may have no signature: their arguments are checked when they are called
+            return
+        if not inspect.ismethod(function) and next(iter(signature.parameters), None) == "self":
+            # The `forward` method of the tools created with `@tool` is a static method whose signature shows `self`
+            signature = signature.replace(parameters=list(signature.parameters.values())[1:])
+        try:
+            signature.bind(*args, **kwargs)
+        except TypeError as e:
+            self._add_record(
+                ToolCallRecord(
+                    tool_name,
+                    "invalid_arguments",
+                    0.0,
+                    self.get_timeout(tool_name),
+                    self.get_circuit_breaker(tool_name).state,
+                    f"TypeError: {e}",
+                )
+            )
+            raise
+
+    def call(self, tool_name: str, function: Callable, *args, **kwargs) -> Any:
+        """
+        Calls `function`, which runs the tool named `tool_name`, with the timeout and circuit breaker of this tool.
+
+        Args:
+            tool_name (`str`): Name of the tool.
+            function (`Callable`): Function running the tool, called with the other arguments.
+        """
+        circuit_breaker, timeout = self._start_call(tool_name)
+        start_time = time.time()
+        try:
+            if timeout is None:
+                output = function(*args, **kwargs)
+            else:
+                output = self._call_in_thread(tool_name, timeout, function, args, kwargs)
+        except Exception as e:
+            self._record_failure(tool_name, circuit_breaker, start_time, timeout, e)
+            raise
+        self._record_success(tool_name, circuit_breaker, start_time, timeout)
+        return output
+
+    async def acall(self, tool_name: str, function: Callable[..., Awaitable], *args, **kwargs) -> Any:
+        """Asynchronous version of `call`, for a `function` returning an awaitable: it is cancelled on timeout."""
+        circuit_breaker, timeout = self._start_call(tool_name)
+        start_time = time.time()
+        cancellation_event = threading.Event()
+
+        async def run():
+            _cancellation_event.set(cancellation_event)
+            return await function(*args, **kwargs)
+
+        try:
+            try:
+                output = await asyncio.wait_for(run(), timeout=timeout)
+            except asyncio.TimeoutError:
+                cancellation_event.set()
+                raise ToolTimeoutError(f"Tool '{tool_name}' timed out after {timeout} seconds.") from None
+        except Exception as e:
+            self._record_failure(tool_name, circuit_breaker, start_time, timeout, e)
+            raise
+        self._record_success(tool_name, circuit_breaker, start_time, timeout)
+        return output
+
+    def _start_call(self, tool_name: str) -> tuple[CircuitBreaker, Optional[float]]:
+        circuit_breaker = self.get_circuit_breaker(tool_name)
+        timeout = self.get_timeout(tool_name)
+        if not circuit_breaker.allow_call():
+            error = CircuitOpenError(
+                f"Tool '{tool_name}' failed {circuit_breaker.failure_count} times in a row, so its calls are rejected "
+                f"for up to {circuit_breaker.recovery_time} seconds. Use another tool in the meantime."
+            )
+            self._add_record(
+                ToolCallRecord(
+                    tool_name, "rejected", 0.0, timeout, circuit_breaker.state, f"CircuitOpenError: {error}"
+                )
+            )
+            raise error
+        return circuit_breaker, timeout
+
+    def _call_in_thread(self, tool_name: str, timeout: float, function: Callable, args: tuple, kwargs: dict) -> Any:
+        cancellation_event = threading.Event()
+        result = {}
+        done = threading.Event()
+
+        def run():
+            _cancellation_event.set(cancellation_event)
+            try:
+                result["output"] = function(*args, **kwargs)
+            except BaseException as e:
+                result["error"] = e
+            finally:
+                done.set()
+
+        # The call runs in the context of the caller, and in a daemon thread so that a hung call can be abandoned
+        context = contextvars.copy_context()
+        threading.Thread(target=context.run, args=(run,), name=f"tool-{tool_name}", daemon=True).start()
+        if not done.wait(timeout):
+            cancellation_event.set()
+            raise ToolTimeoutError(f"Tool '{tool_name}' timed out after {timeout} seconds.")
+        if "error" in result:
+            raise result["error"]
+        return result["output"]
+
+    def _record_success(self, tool_name: str, circuit_breaker: CircuitBreaker, start_time: float, timeout):
+        circuit_breaker.record_success()
+        self._add_record(
+            ToolCallRecord(tool_name, "success", time.time() - start_time, timeout, circuit_breaker.state)
+        )
+
+    def _record_failure(
+        self, tool_name: str, circuit_breaker: CircuitBreaker, start_time: float, timeout, error: Exception
+    ):
+        circuit_breaker.record_failure()
+        outcome = "timeout" if isinstance(error, ToolTimeoutError) else "error"
+        self._add_record(
+            ToolCallRecord(
+                tool_name,
+                outcome,
+                time.time() - start_time,
+                timeout,
+                circuit_breaker.state,
+                f"{type(error).__name__}: {error}",
+            )
+        )
+
+    def _add_record(self, record: ToolCallRecord):
+        with self._lock:
+            self._records.append(record)
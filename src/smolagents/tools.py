@@ -15,6 +15,7 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 import ast
+import asyncio
 import inspect
 import json
 import logging
@@ -24,7 +25,7 @@ import tempfile
 import textwrap
 import types
 from contextlib import contextmanager
-from functools import wraps
+from functools import partial, wraps
 from pathlib import Path
 from typing import Callable, Dict, List, Optional, Union
 
@@ -44,6 +45,7 @@ from ._function_type_hints_utils import (
     get_json_schema,
 )
 from .agent_types import handle_agent_input_types, handle_agent_output_types
+from .cache import Cache, MemoryCache, get_cache_key
 from .tool_validation import MethodChecker, validate_tool_attributes
 from .utils import BASE_BUILTIN_MODULES, _is_package_available, get_source, instance_to_source
 
@@ -99,12 +101,23 @@ class Tool:
     You can also override the method [`~Tool.setup`] if your tool has an expensive operation to perform before being
     usable (such as loading a model). [`~Tool.setup`] will be called the first time you use your tool, but not at
     instantiation.
+
+    If the output of your tool only depends on its inputs, set the class attribute **cacheable** to `True`: the outputs
+    of calls with JSON-serializable inputs are then cached, and calls with the same inputs return the cached output
+    without running `forward`. Outputs are cached in the **cache** attribute of the tool, a [`MemoryCache`] by
+    default: set it to another [`Cache`], for instance a [`SQLiteCache`], to bound the time to live of the outputs or to
+    persist them across runs. The numbers of calls answered from the cache or not are counted in the
+    **cache_hit_count** and **cache_miss_count** attributes.
     """
 
     name: str
     description: str
     inputs: Dict[str, Dict[str, Union[str, type, bool]]]
     output_type: str
+    cacheable: bool = False
+    cache: Optional[Cache] = None
+    cache_hit_count: int = 0
+    cache_miss_count: int = 0
 
     def __init__(self, *args, **kwargs):
         self.is_initialized = False
@@ -176,6 +189,82 @@ class Tool:
         if not self.is_initialized:
             self.setup()
 
+        args, kwargs = self._prepare_arguments(args, kwargs, sanitize_inputs_outputs)
+        cache_key = self._get_cache_key(args, kwargs)
+        cached_entry = self._get_cached_entry(cache_key)
+        if cached_entry is not None:
+            outputs = cached_entry["output"]
+        elif inspect.iscoroutinefunction(self.forward):
+            # Tools with an async forward method can still be called from synchronous code
+            outputs = asyncio.run(self.forward(*args, **kwargs))
+            self._set_cached_output(cache_key, outputs)
+        else:
+            outputs = self.forward(*args, **kwargs)
+            self._set_cached_output(cache_key, outputs)
+        if sanitize_inputs_outputs:
+            outputs = handle_agent_output_types(outputs, self.output_type)
+        return outputs
+
+    async def acall(self, *args, sanitize_inputs_outputs: bool = False, **kwargs):
+        """
+        Asynchronous version of `__call__`: if the `forward` method of the tool is a coroutine function, it is awaited
+        directly. Otherwise, the tool is called in the thread pool of the running event loop.
+        """
+        if not inspect.iscoroutinefunction(self.forward):
+            return await asyncio.to_thread(
+                self.__call__, *args, sanitize_inputs_outputs=sanitize_inputs_outputs, **kwargs
+            )
+        if not self.is_initialized:
+            self.setup()
+
+        args, kwargs = self._prepare_arguments(args, kwargs, sanitize_inputs_outputs)
+        cache_key = self._get_cache_key(args, kwargs)
+        cached_entry = self._get_cached_entry(cache_key)
+        if cached_entry is not None:
+            outputs = cached_entry["output"]
+        else:
+            outputs = await self.forward(*args, **kwargs)
+            self._set_cached_output(cache_key, outputs)
+        if sanitize_inputs_outputs:
+            outputs = handle_agent_output_types(outputs, self.output_type)
+        return outputs
+
+    def _get_cache_key(self, args: tuple, kwargs: dict) -> Optional[str]:
+        """Returns the key of a call in the cache of the tool, or `None` if the call cannot be cached."""
+        if not self.cacheable:
+            return None
+        arguments = {**dict(zip(self.inputs, args)), **kwargs}
+        try:
+            # Inputs such as images have no canonical JSON representation, so calls with them are not cached
+            json.dumps(arguments)
+        except (TypeError, ValueError):
+            return None
+        return get_cache_key({"tool": self.name, "arguments": arguments})
+
+    def _get_cached_entry(self, cache_key: Optional[str]) -> Optional[dict]:
+        if cache_key is None:
+            return None
+        if self.cache is None:
+            self.cache = MemoryCache()
+        cached_entry = self.cache.get(cache_key)
+        if cached_entry is None:
+            self.cache_miss_count += 1
+        else:
+            self.cache_hit_count += 1
+        return cached_entry
+
+    def _set_cached_output(self, cache_key: Optional[str], outputs):
+        if cache_key is None:
+            return
+        try:
+            # Only outputs that the JSON serialization of the cache returns unchanged are cached
+            if json.loads(json.dumps(outputs)) != outputs:
+                return
+        except (TypeError, ValueError):
+            return
+        self.cache.set(cache_key, {"output": outputs})
+
+    def _prepare_arguments(self, args: tuple, kwargs: dict, sanitize_inputs_outputs: bool) -> tuple[tuple, dict]:
         # Handle the arguments might be passed as a single dictionary
         if len(args) == 1 and len(kwargs) == 0 and isinstance(args[0], dict):
             potential_kwargs = args[0]
@@ -187,10 +276,7 @@ class Tool:
 
         if sanitize_inputs_outputs:
             args, kwargs = handle_agent_input_types(*args, **kwargs)
-        outputs = self.forward(*args, **kwargs)
-        if sanitize_inputs_outputs:
-            outputs = handle_agent_output_types(outputs, self.output_type)
-        return outputs
+        return args, kwargs
 
     def setup(self):
         """
@@ -226,6 +312,8 @@ class Tool:
                 output_type = "{self.output_type}"
             """
             ).strip()
+            if self.cacheable:
+                tool_code += "\n    cacheable = True"
             import re
 
             def add_self_argument(source_code: str) -> str:
@@ -863,7 +951,7 @@ class ToolCollection:
             yield cls(tools)
 
 
-def tool(tool_function: Callable) -> Tool:
+def tool(tool_function: Optional[Callable] = None, *, cache: Union[bool, Cache] = False) -> Tool:
     """
     Convert a function into an instance of a dynamically created Tool subclass.
 
@@ -872,7 +960,12 @@ def tool(tool_function: Callable) -> Tool:
             Should have type hints for each input and a type hint for the output.
             Should also have a docstring including the description of the function
             and an 'Args:' part where each argument is described.
+        cache (`bool` or [`Cache`], default `False`): Whether to cache the outputs of the tool, which should then only
+            depend on its inputs. Pass a [`Cache`] to choose where outputs are cached, otherwise they are cached in a
+            [`MemoryCache`]. Use the decorator as `@tool(cache=True)` to set this option.
     """
+    if tool_function is None:
+        return partial(tool, cache=cache)
     tool_json_schema = get_json_schema(tool_function)["function"]
     if "return" not in tool_json_schema:
         raise TypeHintParsingException("Tool return type not found: make sure your function has a return type hint!")
@@ -886,6 +979,8 @@ def tool(tool_function: Callable) -> Tool:
     SimpleTool.description = tool_json_schema["description"]
     SimpleTool.inputs = tool_json_schema["parameters"]["properties"]
     SimpleTool.output_type = tool_json_schema["return"]["type"]
+    # Caches may define __len__, so they are not checked by truthiness
+    SimpleTool.cacheable = cache is True or isinstance(cache, Cache)
     # Bind the tool function to the forward method
     SimpleTool.forward = staticmethod(tool_function)
 
@@ -906,15 +1001,18 @@ def tool(tool_function: Callable) -> Tool:
     # - Dedent
     tool_source_body = textwrap.dedent(tool_source_body)
     # - Create the forward method source, including def line and indentation
-    forward_method_source = f"def forward{str(new_sig)}:\n{textwrap.indent(tool_source_body, '    ')}"
+    def_keyword = "async def" if inspect.iscoroutinefunction(tool_function) else "def"
+    forward_method_source = f"{def_keyword} forward{str(new_sig)}:\n{textwrap.indent(tool_source_body, '    ')}"
     # - Create the class source
+    # - Mark cacheable tools with a class attribute, indented as the other class attributes in the template below
+    cacheable_source = "\n            cacheable: bool = True" if SimpleTool.cacheable else ""
     class_source = (
         textwrap.dedent(f'''
         class SimpleTool(Tool):
             name: str = "{tool_json_schema["name"]}"
             description: str = {json.dumps(textwrap.dedent(tool_json_schema["description"]).strip())}
             inputs: dict[str, dict[str, str]] = {tool_json_schema["parameters"]["properties"]}
-            output_type: str = "{tool_json_schema["return"]["type"]}"
+            output_type: str = "{tool_json_schema["return"]["type"]}"{cacheable_source}
 
             def __init__(self):
                 self.is_initialized = True
@@ -927,6 +1025,8 @@ def tool(tool_function: Callable) -> Tool:
     SimpleTool.forward.__source__ = forward_method_source
 
     simple_tool = SimpleTool()
+    if isinstance(cache, Cache):
+        simple_tool.cache = cache
     return simple_tool
 
 
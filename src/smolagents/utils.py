@@ -24,11 +24,12 @@ import keyword
 import os
 import re
 import types
+import weakref
 from functools import lru_cache
 from io import BytesIO
 from pathlib import Path
 from textwrap import dedent
-from typing import TYPE_CHECKING, Any, Dict, Tuple
+from typing import TYPE_CHECKING, Any, Dict, List, Tuple
 
 
 if TYPE_CHECKING:
@@ -229,6 +230,55 @@ def parse_code_blobs(text: str) -> str:
     )
 
 
+CONTINUATION_KEYWORDS = ("else", "elif", "except", "finally")
+
+
+def get_complete_code_statements(text: str) -> Tuple[List[str], bool]:
+    """Extract the top-level statements that are already complete in the first code block of a partial LLM output.
+
+    A statement is complete once the code block is closed, or once a line starting a new top-level statement follows it.
+
+    Args:
+        text (`str`): Partial output of the LLM.
+
+    Returns:
+        `tuple[list[str], bool]`: Source code of the complete statements, and whether the code block is closed.
+    """
+    opening = re.search(r"```(?:py|python)?\n", text)
+    if opening is None:
+        return [], False
+    code = text[opening.end() :]
+    closing = code.find("\n```")
+    is_closed = closing != -1
+    if is_closed:
+        code = code[:closing]
+    lines = code.split("\n")
+    if is_closed:
+        boundaries = [len(lines)]
+    else:
+        # The last line may be incomplete: only the lines that start a new top-level statement before it are boundaries
+        boundaries = [
+            index
+            for index, line in enumerate(lines[:-1])
+            if line[:1].strip()
+            and not line.startswith(("#", ")", "]", "}"))
+            and not re.match(rf"({'|'.join(CONTINUATION_KEYWORDS)})\b", line)
+        ]
+    for boundary in reversed(boundaries):
+        try:
+            tree = ast.parse("\n".join(lines[:boundary]))
+        except SyntaxError:
+            if is_closed:
+                return [], True
+            continue
+        statements = []
+        for node in tree.body:
+            start_line = min([node.lineno] + [decorator.lineno for decorator in getattr(node, "decorator_list", [])])
+            statements.append("\n".join(lines[start_line - 1 : node.end_lineno]))
+        return statements, is_closed
+    return [], is_closed
+
+
 MAX_LENGTH_TRUNCATE_CONTENT = 20000
 
 
@@ -435,10 +485,34 @@ def get_source(obj) -> str:
         raise e from inspect_error
 
 
-def encode_image_base64(image):
+# Maps (id(image), format) to a weak reference to the image and its base64 encoding
+_encoded_images: Dict[Tuple[int, str], Tuple[weakref.ref, str]] = {}
+
+
+def encode_image_base64(image, format: str = "PNG") -> str:
+    """
+    Encodes an image in base64.
+
+    The encoding is cached for as long as the image object is alive, so that an image sent to the model at every step
+    is only encoded once. Images should therefore not be modified in place once they have been encoded.
+    """
+    key = (id(image), format)
+    cached = _encoded_images.get(key)
+    if cached is not None and cached[0]() is image:
+        return cached[1]
     buffered = BytesIO()
-    image.save(buffered, format="PNG")
-    return base64.b64encode(buffered.getvalue()).decode("utf-8")
+    image.save(buffered, format=format)
+    encoded_image = base64.b64encode(buffered.getvalue()).decode("utf-8")
+
+    def remove_from_cache(image_ref):
+        if _encoded_images.get(key, (None,))[0] is image_ref:
+            del _encoded_images[key]
+
+    try:
+        _encoded_images[key] = (weakref.ref(image, remove_from_cache), encoded_image)
+    except TypeError:  # The image does not support weak references
+        pass
+    return encoded_image
 
 
 def make_image_url(base64_image):
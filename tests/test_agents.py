@@ -12,13 +12,15 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
+import json
 import os
 import tempfile
 import unittest
 import uuid
 from contextlib import nullcontext as does_not_raise
 from pathlib import Path
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
 import pytest
 
@@ -32,15 +34,21 @@ from smolagents.agents import (
     populate_template,
 )
 from smolagents.default_tools import DuckDuckGoSearchTool, FinalAnswerTool, PythonInterpreterTool, VisitWebpageTool
-from smolagents.memory import ActionStep, PlanningStep
+from smolagents.memory import ActionStep, FinalAnswerStep, PlanningStep
 from smolagents.models import (
     ChatMessage,
+    ChatMessageStreamDelta,
     ChatMessageToolCall,
     ChatMessageToolCallDefinition,
+    ChatMessageToolCallStreamDelta,
     HfApiModel,
     MessageRole,
+    Model,
     TransformersModel,
+    get_clean_message_list,
 )
+from smolagents.process_pool_executor import ProcessPoolPythonExecutor
+from smolagents.tool_supervisor import ToolSupervisor
 from smolagents.tools import Tool, tool
 from smolagents.utils import BASE_BUILTIN_MODULES, AgentExecutionError, AgentGenerationError, AgentToolCallError
 
@@ -895,6 +903,255 @@ class TestToolCallingAgent(unittest.TestCase):
         assert agent.memory.steps[1].tool_calls[0].arguments == {"location": "Paris", "date": "today"}
         assert agent.memory.steps[1].observations == "The weather in Paris on date:today is sunny."
 
+    @staticmethod
+    def make_parallel_tool_calls_model(tool_calls):
+        def fake_model(messages, tools_to_call_from=None, stop_sequences=None, grammar=None):
+            return ChatMessage(
+                role="assistant",
+                content="",
+                tool_calls=[
+                    ChatMessageToolCall(
+                        id=f"call_{i}",
+                        type="function",
+                        function=ChatMessageToolCallDefinition(name=name, arguments=arguments),
+                    )
+                    for i, (name, arguments) in enumerate(tool_calls)
+                ],
+            )
+
+        return fake_model
+
+    def test_parallel_tool_calls(self):
+        import threading
+        import time
+
+        barrier = threading.Barrier(3, timeout=5)
+
+        @tool
+        def wait_for_others(value: str) -> str:
+            """
+            Returns its value once all the calls are running.
+
+            Args:
+                value: The value to return.
+            """
+            barrier.wait()
+            time.sleep(0.01)
+            return value
+
+        model = self.make_parallel_tool_calls_model(
+            [("wait_for_others", {"value": f"result_{i}"}) for i in range(3)] + [("final_answer", {"answer": "done"})]
+        )
+        agent = ToolCallingAgent(model=model, tools=[wait_for_others], max_steps=1)
+        assert agent.run("Run the tools") == "done"
+        step = agent.memory.steps[1]
+        assert [tool_call.id for tool_call in step.tool_calls] == ["call_0", "call_1", "call_2", "call_3"]
+        assert (
+            step.observations == "Call id: call_0\nresult_0\n\nCall id: call_1\nresult_1\n\nCall id: call_2\nresult_2"
+        )
+        tool_response = step.to_messages()[-1]["content"][0]["text"]
+        assert tool_response.startswith("Observation:\nCall id: call_0")
+
+    def test_parallel_tool_calls_timeout_and_errors(self):
+        import time
+
+        @tool
+        def slow_tool(seconds: float) -> str:
+            """
+            Sleeps for some time.
+
+            Args:
+                seconds: The number of seconds to sleep.
+            """
+            time.sleep(seconds)
+            return "slept"
+
+        model = self.make_parallel_tool_calls_model(
+            [("slow_tool", {"seconds": 0.01}), ("slow_tool", {"seconds": 2}), ("slow_tool", {"wrong": 1})]
+        )
+        agent = ToolCallingAgent(model=model, tools=[slow_tool], max_steps=1, tool_call_timeout=0.5)
+        start_time = time.time()
+        agent.run("Run the tools")
+        assert time.time() - start_time < 2
+        step = agent.memory.steps[1]
+        assert step.observations == "Call id: call_0\nslept"
+        assert "timed out after 0.5 seconds" in str(step.error)
+        assert "Invalid call to tool 'slow_tool'" in str(step.error)
+
+    def test_parallel_calls_to_the_same_managed_agent_run_one_after_the_other(self):
+        import time
+
+        def fake_managed_model(messages, tools_to_call_from=None, stop_sequences=None, grammar=None):
+            task = "alpha" if "alpha" in str(messages) else "beta"
+            assert not ("alpha" in str(messages) and "beta" in str(messages))
+            time.sleep(0.05)
+            return ChatMessage(
+                role="assistant",
+                content="",
+                tool_calls=[
+                    ChatMessageToolCall(
+                        id="call_0",
+                        type="function",
+                        function=ChatMessageToolCallDefinition(name="final_answer", arguments={"answer": task}),
+                    )
+                ],
+            )
+
+        for use_async in [False, True]:
+            managed_agent = ToolCallingAgent(
+                model=fake_managed_model, tools=[], name="sub", description="Does sub tasks", max_steps=1
+            )
+            model = self.make_parallel_tool_calls_model(
+                [("sub", {"task": "alpha"}), ("sub", {"task": "beta"}), ("final_answer", {"answer": "done"})]
+            )
+            agent = ToolCallingAgent(model=model, tools=[], managed_agents=[managed_agent], max_steps=1)
+            if use_async:
+                assert asyncio.run(agent.arun("Delegate the tasks")) == "done"
+            else:
+                assert agent.run("Delegate the tasks") == "done"
+            first_observation, second_observation = agent.memory.steps[1].observations.split("Call id: call_1")
+            assert "alpha" in first_observation and "beta" not in first_observation
+            assert "beta" in second_observation and "alpha" not in second_observation
+            assert [type(step).__name__ for step in managed_agent.memory.steps] == ["TaskStep", "ActionStep"]
+
+    def test_tool_supervisor_records_timeouts_and_opens_circuit(self):
+        import time
+
+        @tool
+        def slow_tool(seconds: float) -> str:
+            """
+            Sleeps for some time.
+
+            Args:
+                seconds: The number of seconds to sleep.
+            """
+            time.sleep(seconds)
+            return "slept"
+
+        model = self.make_parallel_tool_calls_model([("slow_tool", {"seconds": 1})])
+        supervisor = ToolSupervisor(tool_timeouts={"slow_tool": 0.05}, failure_threshold=2)
+        agent = ToolCallingAgent(model=model, tools=[slow_tool], max_steps=3, tool_supervisor=supervisor)
+        agent.run("Run the tool")
+        action_steps = agent.memory.steps[1:4]
+        assert [step.tool_call_records[0].outcome for step in action_steps] == ["timeout", "timeout", "rejected"]
+        assert "timed out after 0.05 seconds" in str(action_steps[0].error)
+        assert "CircuitOpenError" in str(action_steps[2].error)
+        assert action_steps[2].dict()["tool_call_records"][0]["circuit_state"] == "open"
+
+    def test_tool_supervisor_does_not_count_invalid_arguments_as_failures(self):
+        @tool
+        def echo(text: str) -> str:
+            """
+            Returns the text.
+
+            Args:
+                text: The text to return.
+            """
+            return text
+
+        model = self.make_parallel_tool_calls_model([("echo", {"txt": "hello"})] * 3 + [("echo", {"text": "hello"})])
+        for use_async in [False, True]:
+            supervisor = ToolSupervisor(failure_threshold=2)
+            agent = ToolCallingAgent(model=model, tools=[echo], max_steps=1, tool_supervisor=supervisor)
+            if use_async:
+                asyncio.run(agent.arun("Echo hello"))
+            else:
+                agent.run("Echo hello")
+            action_step = agent.memory.steps[1]
+            outcomes = sorted(record.outcome for record in action_step.tool_call_records)
+            assert outcomes == ["invalid_arguments"] * 3 + ["success"]
+            assert "Invalid call to tool 'echo'" in str(action_step.error)
+            assert supervisor.get_circuit_breaker("echo").state == "closed"
+
+
+class FakeStreamingModel(Model):
+    def __init__(self, chunks, tool_call_deltas=None):
+        super().__init__()
+        self.chunks = chunks
+        self.tool_call_deltas = tool_call_deltas or []
+
+    def generate_stream(self, messages, stop_sequences=None, grammar=None, tools_to_call_from=None, **kwargs):
+        self.last_input_token_count, self.last_output_token_count = 10, 0
+        for chunk in self.chunks:
+            self.last_output_token_count += 1
+            yield ChatMessageStreamDelta(content=chunk)
+        for tool_call_delta in self.tool_call_deltas:
+            yield ChatMessageStreamDelta(tool_calls=[tool_call_delta])
+
+
+class TestStreamOutputs:
+    def test_code_agent_streams_model_outputs(self):
+        chunks = ["Thought: I'll answer.\n", "Code:\n```py\n", "final_answer(", "7.2904)\n", "```<end_code>"]
+        agent = CodeAgent(tools=[], model=FakeStreamingModel(chunks), stream_outputs=True)
+        events = list(agent.run("What is 2 multiplied by 3.6452?", stream=True))
+        assert events[: len(chunks)] == [ChatMessageStreamDelta(content=chunk) for chunk in chunks]
+        assert isinstance(events[len(chunks)], ActionStep)
+        assert events[len(chunks)].model_output == "".join(chunks)
+        assert events[-1].final_answer == 7.2904
+        assert agent.monitor.get_total_token_counts() == {"input": 10, "output": 5, "cached_input": 0}
+
+    def test_tool_calling_agent_streams_tool_calls(self):
+        model = FakeStreamingModel(
+            [],
+            tool_call_deltas=[
+                ChatMessageToolCallStreamDelta(index=0, id="call_0", type="function", name="final_answer"),
+                ChatMessageToolCallStreamDelta(index=0, arguments='{"answer": '),
+                ChatMessageToolCallStreamDelta(index=0, arguments='"done"}'),
+            ],
+        )
+        agent = ToolCallingAgent(tools=[], model=model, stream_outputs=True)
+        assert agent.run("Say done") == "done"
+        assert agent.memory.steps[1].tool_calls[0].arguments == {"answer": "done"}
+
+    def test_steps_are_not_streamed_by_default(self):
+        agent = CodeAgent(tools=[], model=fake_code_model)
+        events = list(agent.run("What is 2 multiplied by 3.6452?", stream=True))
+        assert not any(isinstance(event, ChatMessageStreamDelta) for event in events)
+
+    def test_speculative_execution_runs_tools_during_generation(self):
+        import threading
+
+        search_started = threading.Event()
+        search_queries = []
+
+        @tool
+        def search(query: str) -> str:
+            """
+            Searches the web.
+
+            Args:
+                query: The query to search.
+            """
+            search_queries.append(query)
+            search_started.set()
+            return f"Results for {query}"
+
+        class WaitingStreamingModel(FakeStreamingModel):
+            def generate_stream(self, *args, **kwargs):
+                for delta in super().generate_stream(*args, **kwargs):
+                    yield delta
+                    if "final_answer" in delta.content:
+                        # The search started while the model was still generating
+                        assert search_started.wait(timeout=5)
+
+        chunks = ["Code:\n```py\n", "results = search('smolagents')\n", "final_answer(results)\n", "```<end_code>"]
+        agent = CodeAgent(
+            tools=[search],
+            model=WaitingStreamingModel(chunks),
+            stream_outputs=True,
+            speculative_execution=True,
+        )
+        assert agent.run("Search smolagents") == "Results for smolagents"
+        assert search_queries == ["smolagents"]
+
+    def test_speculative_execution_requires_stream_outputs(self):
+        with pytest.raises(ValueError, match="speculative_execution"):
+            CodeAgent(tools=[], model=FakeStreamingModel([]), speculative_execution=True)
+
+    def test_stream_outputs_requires_generate_stream(self):
+        with pytest.raises(ValueError, match="generate_stream"):
+            CodeAgent(tools=[], model=fake_code_model, stream_outputs=True)
+
 
 class TestCodeAgent:
     @pytest.mark.parametrize("provide_run_summary", [False, True])
@@ -915,6 +1172,36 @@ class TestCodeAgent:
             )
         assert result == expected_summary
 
+    def test_run_with_reset_resets_model(self):
+        model = FakeStreamingModel(["Code:\n```py\nfinal_answer(1)\n```"])
+        with patch.object(model, "reset") as mock_reset:
+            agent = CodeAgent(tools=[], model=model, stream_outputs=True)
+            agent.run("Test task")
+            assert mock_reset.call_count == 1
+            agent.run("Follow-up task", reset=False)
+            assert mock_reset.call_count == 1
+
+    def test_rendered_messages_keep_a_stable_prefix_across_steps(self):
+        rendered_inputs = []
+        outputs = iter(
+            [
+                "Code:\n```py\nx = 2\nprint(x)\n```",
+                "Code:\n```py\nundefined_variable\n```",
+                "Code:\n```py\nfinal_answer(x)\n```",
+            ]
+        )
+
+        def fake_model(messages, stop_sequences=None, grammar=None):
+            rendered_inputs.append([json.dumps(message) for message in get_clean_message_list(messages)])
+            return ChatMessage(role="assistant", content=next(outputs))
+
+        agent = CodeAgent(tools=[], model=fake_model)
+        assert agent.run("Test task") == 2
+        assert len(rendered_inputs) == 3
+        # Each step's input must be a byte-identical prefix of the next one, so that providers can cache it
+        for previous_input, next_input in zip(rendered_inputs, rendered_inputs[1:]):
+            assert next_input[: len(previous_input)] == previous_input
+
     def test_errors_logging(self):
         def fake_code_model(messages, stop_sequences=None, grammar=None) -> str:
             return ChatMessage(role="assistant", content="Code:\n```py\nsecret=3;['1', '2'][secret]\n```")
@@ -925,6 +1212,91 @@ class TestCodeAgent:
             agent.run("Test request")
         assert "secret\\\\" in repr(capture.get())
 
+    def test_tool_supervisor_supervises_tools_called_from_code(self):
+        @tool
+        def failing_tool() -> str:
+            """
+            Always fails.
+            """
+            raise ValueError("Tool failure")
+
+        def fake_model(messages, stop_sequences=None, grammar=None):
+            return ChatMessage(
+                role="assistant",
+                content="""
+Code:
+```py
+for _ in range(3):
+    try:
+        failing_tool()
+    except Exception as e:
+        print(e)
+final_answer("done")
+```<end_code>""",
+            )
+
+        supervisor = ToolSupervisor(failure_threshold=2)
+        agent = CodeAgent(tools=[failing_tool], model=fake_model, max_steps=1, tool_supervisor=supervisor)
+        assert agent.run("Call the tool") == "done"
+        records = agent.memory.steps[1].tool_call_records
+        assert [record.outcome for record in records] == ["error", "error", "rejected"]
+        assert "rejected for up to 60 seconds" in agent.memory.steps[1].observations
+        assert supervisor.get_circuit_breaker("failing_tool").failure_count == 2
+
+        def fake_model_with_invalid_arguments(messages, stop_sequences=None, grammar=None):
+            return ChatMessage(
+                role="assistant",
+                content="""
+Code:
+```py
+for _ in range(3):
+    try:
+        echo(txt="hello")
+    except Exception as e:
+        print(e)
+final_answer(echo("hello"))
+```<end_code>""",
+            )
+
+        @tool
+        def echo(text: str) -> str:
+            """
+            Returns the text.
+
+            Args:
+                text: The text to return.
+            """
+            return text
+
+        supervisor = ToolSupervisor(failure_threshold=2)
+        agent = CodeAgent(
+            tools=[echo], model=fake_model_with_invalid_arguments, max_steps=1, tool_supervisor=supervisor
+        )
+        assert agent.run("Echo hello") == "hello"
+        records = agent.memory.steps[1].tool_call_records
+        assert [record.outcome for record in records] == ["invalid_arguments"] * 3 + ["success"]
+        assert "missing a required argument: 'text'" in agent.memory.steps[1].observations
+
+    def test_tool_supervisor_requires_local_executor(self):
+        with pytest.raises(ValueError, match="tool_supervisor"):
+            CodeAgent(tools=[], model=fake_code_model, executor_type="e2b", tool_supervisor=ToolSupervisor())
+
+    def test_local_executor_kwargs(self):
+        agent = CodeAgent(tools=[], model=fake_code_model, executor_kwargs={"max_operations": 100})
+        assert agent.python_executor.max_operations == 100
+        with pytest.warns(UserWarning, match="max_workers"):
+            agent = CodeAgent(tools=[], model=fake_code_model, executor_kwargs={"max_workers": 2, "timeout": 5})
+        assert agent.python_executor.timeout == 5
+        assert agent.executor_kwargs == {"max_workers": 2, "timeout": 5}
+
+    def test_process_pool_executor(self):
+        agent = CodeAgent(tools=[], model=fake_code_model, executor_type="process_pool")
+        assert isinstance(agent.python_executor, ProcessPoolPythonExecutor)
+        output = agent.run("What is 2 multiplied by 3.6452?")
+        assert output == 7.2904
+        assert "result = 2**3.6452" in agent.memory.steps[1].model_output
+        agent.python_executor.cleanup()
+
     def test_missing_import_triggers_advice_in_error_log(self):
         # Set explicit verbosity level to 1 to override the default verbosity level of -1 set in CI fixture
         agent = CodeAgent(tools=[], model=fake_code_model_import, verbosity_level=1)
@@ -1032,6 +1404,85 @@ class TestCodeAgent:
         assert agent.prompt_templates["system_prompt"] == "dummy system prompt"
 
 
+class FakeAsyncToolCallModel:
+    """Model that can only be awaited, which calls the `get_weather` tool and then returns its result."""
+
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, *args, **kwargs):
+        raise AssertionError("The model should be awaited")
+
+    async def acall(self, messages, tools_to_call_from=None, stop_sequences=None, grammar=None):
+        self.calls += 1
+        await asyncio.sleep(0)
+        if len(messages) < 3:
+            tool_call = ChatMessageToolCallDefinition(name="get_weather", arguments={"location": "Paris"})
+        else:
+            tool_call = ChatMessageToolCallDefinition(name="final_answer", arguments={"answer": "Sunny"})
+        return ChatMessage(
+            role="assistant",
+            content="",
+            tool_calls=[ChatMessageToolCall(id="call_0", type="function", function=tool_call)],
+        )
+
+
+class TestAsyncAgents:
+    def test_code_agent_arun(self):
+        agent = CodeAgent(tools=[], model=fake_code_model)
+        output = asyncio.run(agent.arun("What is 2 multiplied by 3.6452?"))
+        assert output == 7.2904
+        assert len(agent.memory.steps) == 3
+
+    def test_tool_calling_agent_arun_awaits_model_and_async_tool(self):
+        @tool
+        async def get_weather(location: str) -> str:
+            """
+            Get the weather at a given location.
+
+            Args:
+                location: The location.
+            """
+            await asyncio.sleep(0)
+            return f"Sunny in {location}"
+
+        model = FakeAsyncToolCallModel()
+        agent = ToolCallingAgent(tools=[get_weather], model=model)
+        output = asyncio.run(agent.arun("What is the weather in Paris?"))
+        assert output == "Sunny"
+        assert model.calls == 2
+        assert agent.memory.steps[1].observations == "Sunny in Paris"
+
+    def test_arun_stream(self):
+        agent = CodeAgent(tools=[], model=fake_code_model)
+
+        async def collect_steps():
+            return [step async for step in agent.arun("What is 2 multiplied by 3.6452?", stream=True)]
+
+        steps = asyncio.run(collect_steps())
+        assert [type(step) for step in steps] == [ActionStep, ActionStep, FinalAnswerStep]
+        assert steps[-1].final_answer == 7.2904
+
+    def test_concurrent_runs(self):
+        agents = [CodeAgent(tools=[], model=fake_code_model) for _ in range(5)]
+
+        async def run_all():
+            return await asyncio.gather(*(agent.arun("What is 2 multiplied by 3.6452?") for agent in agents))
+
+        assert asyncio.run(run_all()) == [7.2904] * 5
+
+    def test_arun_max_steps_reached(self):
+        model = MagicMock()
+        model.acall = AsyncMock(return_value=ChatMessage(role="assistant", content="No code here"))
+        model.last_input_token_count = model.last_output_token_count = 10
+        agent = CodeAgent(tools=[], model=model, max_steps=2)
+        output = asyncio.run(agent.arun("Task"))
+        assert output == "No code here"
+        assert model.acall.await_count == 3
+        model.assert_not_called()
+        assert isinstance(agent.memory.steps[-1].error, AgentMaxStepsError)
+
+
 class TestMultiAgents:
     def test_multiagents_save(self, tmp_path):
         model = HfApiModel(model_id="Qwen/Qwen2.5-Coder-32B-Instruct", max_tokens=2096, temperature=0.5)
@@ -0,0 +1,98 @@
+# coding=utf-8
+# Copyright 2024 HuggingFace Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+from unittest.mock import patch
+
+import pytest
+
+from smolagents.cache import DirectoryCache, MemoryCache, SQLiteCache, get_cache_key
+
+
+@pytest.fixture(params=["memory", "sqlite", "directory"])
+def make_cache(request, tmp_path):
+    def make_cache(**kwargs):
+        if request.param == "memory":
+            return MemoryCache(**kwargs)
+        elif request.param == "sqlite":
+            return SQLiteCache(tmp_path / "cache.db", **kwargs)
+        return DirectoryCache(tmp_path / "cache", **kwargs)
+
+    return make_cache
+
+
+def test_get_cache_key():
+    assert get_cache_key({"a": 1, "b": [1, 2]}) == get_cache_key({"b": [1, 2], "a": 1})
+    assert get_cache_key({"a": 1}) != get_cache_key({"a": 2})
+    assert len(get_cache_key("text")) == 64
+
+
+class TestCache:
+    def test_get_and_set(self, make_cache):
+        cache = make_cache()
+        assert cache.get("key") is None
+        cache.set("key", {"content": "Hello", "count": 3})
+        assert cache.get("key") == {"content": "Hello", "count": 3}
+        cache.set("key", {"content": "Bye"})
+        assert cache.get("key") == {"content": "Bye"}
+        cache.clear()
+        assert cache.get("key") is None
+
+    def test_cached_values_are_copies(self, make_cache):
+        cache = make_cache()
+        value = {"items": [1]}
+        cache.set("key", value)
+        value["items"].append(2)
+        cache.get("key")["items"].append(3)
+        assert cache.get("key") == {"items": [1]}
+
+    def test_ttl(self, make_cache):
+        cache = make_cache(ttl=10)
+        with patch("smolagents.cache.time.time", return_value=1000):
+            cache.set("key", "value")
+        with patch("smolagents.cache.time.time", return_value=1009):
+            assert cache.get("key") == "value"
+        with patch("smolagents.cache.time.time", return_value=1010):
+            assert cache.get("key") is None
+
+    def test_persistent_caches_are_shared(self, tmp_path):
+        SQLiteCache(tmp_path / "cache.db").set("key", "value")
+        assert SQLiteCache(tmp_path / "cache.db").get("key") == "value"
+        DirectoryCache(tmp_path / "cache").set("key", "value")
+        assert DirectoryCache(tmp_path / "cache").get("key") == "value"
+        assert [path.name for path in (tmp_path / "cache").iterdir()] == ["key.json"]
+
+
+def test_memory_cache_evicts_least_recently_used_values():
+    cache = MemoryCache(max_size=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert len(cache) == 2
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_sqlite_cache_evicts_least_recently_used_values_beyond_max_bytes(tmp_path):
+    cache = SQLiteCache(tmp_path / "cache.db", max_bytes=25)
+    with patch("smolagents.cache.time.time", side_effect=range(1, 100)):
+        cache.set("a", "x" * 8)
+        cache.set("b", "y" * 8)
+        assert cache.get("a") == "x" * 8
+        # Each value takes 10 bytes once serialized: the least recently used value is evicted
+        cache.set("c", "z" * 8)
+        assert cache.get("b") is None
+        assert cache.get("a") == "x" * 8
+        assert cache.get("c") == "z" * 8
@@ -0,0 +1,199 @@
+# coding=utf-8
+# Copyright 2024 HuggingFace Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from unittest.mock import patch
+
+import pytest
+
+from smolagents.cache import MemoryCache
+from smolagents.default_tools import VisitWebpageTool
+from smolagents.http_client import HttpClient, WebCache, get_http_client, set_http_client, set_web_cache
+
+
+class RecordingHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # Keeps the connections alive
+
+    def do_GET(self):
+        server = self.server
+        with server.lock:
+            server.request_count += 1
+            server.client_ports.add(self.client_address[1])
+            server.request_headers.append(dict(self.headers))
+            failure_count = server.failures.get(self.path, 0)
+            if failure_count:
+                server.failures[self.path] = failure_count - 1
+        if self.headers.get("If-None-Match") == server.etag:
+            self.send_response(304)
+            self.send_header("Content-Length", "0")
+            self.end_headers()
+            return
+        body = b"<h1>Title</h1><p>Content</p>"
+        self.send_response(503 if failure_count else 200)
+        self.send_header("ETag", server.etag)
+        self.send_header("Content-Type", "text/html")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def server():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), RecordingHandler)
+    server.lock = threading.Lock()
+    server.request_count = 0
+    server.client_ports = set()
+    server.failures = {}
+    server.request_headers = []
+    server.etag = '"v1"'
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def get_url(server, path="/page"):
+    return f"http://127.0.0.1:{server.server_address[1]}{path}"
+
+
+class TestHttpClient:
+    def test_connections_are_kept_alive(self, server):
+        client = HttpClient()
+        for _ in range(3):
+            assert client.get(get_url(server)).status_code == 200
+        assert server.request_count == 3
+        assert len(server.client_ports) == 1
+        client.close()
+
+    def test_transient_errors_are_retried(self, server):
+        server.failures = {"/flaky": 2, "/down": 10}
+        client = HttpClient(max_retries=3, backoff_factor=0)
+        assert client.get(get_url(server, "/flaky")).status_code == 200
+        assert server.request_count == 3
+        # Once the retries are exhausted, the last response is returned
+        assert client.get(get_url(server, "/down")).status_code == 503
+        assert server.request_count == 7
+        client.close()
+
+    def test_concurrent_requests_per_host_are_limited(self):
+        client = HttpClient(max_connections_per_host=2)
+        lock = threading.Lock()
+        concurrent_requests = []
+        active_requests = 0
+
+        def fake_request(method, url, **kwargs):
+            nonlocal active_requests
+            with lock:
+                active_requests += 1
+                concurrent_requests.append(active_requests)
+            time.sleep(0.05)
+            with lock:
+                active_requests -= 1
+
+        with patch.object(client.session, "request", side_effect=fake_request):
+            threads = [
+                threading.Thread(target=client.get, args=(f"https://example.com/{index}",)) for index in range(6)
+            ]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        assert max(concurrent_requests) == 2
+
+    def test_default_timeout(self):
+        client = HttpClient(timeout=5)
+        with patch.object(client.session, "request") as mock_request:
+            client.get("https://example.com")
+            client.get("https://example.com", timeout=1)
+        assert mock_request.call_args_list[0].kwargs["timeout"] == 5
+        assert mock_request.call_args_list[1].kwargs["timeout"] == 1
+
+
+def test_visit_webpage_uses_shared_http_client(server):
+    previous_client = get_http_client()
+    client = HttpClient()
+    set_http_client(client)
+    try:
+        tool = VisitWebpageTool()
+        assert tool(get_url(server)) == "Title\n=====\n\nContent"
+        tool(get_url(server))
+        assert len(server.client_ports) == 1
+    finally:
+        set_http_client(previous_client)
+        client.close()
+
+
+class TestWebCache:
+    def test_webpages_are_revalidated(self, server):
+        web_cache = WebCache(MemoryCache(), max_age=60)
+        converted_pages = []
+
+        def convert(html):
+            converted_pages.append(html)
+            return html.upper()
+
+        with patch("smolagents.http_client.time.time", return_value=1000):
+            assert web_cache.get_webpage(get_url(server), convert) == "<H1>TITLE</H1><P>CONTENT</P>"
+        # Fresh pages are returned without any request
+        with patch("smolagents.http_client.time.time", return_value=1059):
+            assert web_cache.get_webpage(get_url(server), convert) == "<H1>TITLE</H1><P>CONTENT</P>"
+        assert server.request_count == 1
+
+        # Older pages are revalidated: unchanged pages are not converted again
+        with patch("smolagents.http_client.time.time", return_value=1060):
+            assert web_cache.get_webpage(get_url(server), convert) == "<H1>TITLE</H1><P>CONTENT</P>"
+        assert server.request_count == 2
+        assert server.request_headers[-1]["If-None-Match"] == '"v1"'
+        assert len(converted_pages) == 1
+
+        server.etag = '"v2"'
+        with patch("smolagents.http_client.time.time", return_value=2000):
+            web_cache.get_webpage(get_url(server), convert)
+        assert len(converted_pages) == 2
+
+    def test_search_results_are_cached(self):
+        web_cache = WebCache(MemoryCache(), max_age=60)
+        search_results = iter(["First results", "Second results"])
+
+        def search():
+            return next(search_results)
+
+        with patch("smolagents.http_client.time.time", return_value=1000):
+            assert web_cache.get_search_results("engine", {"query": "smolagents"}, search) == "First results"
+            assert web_cache.get_search_results("engine", {"query": "smolagents"}, search) == "First results"
+            assert web_cache.get_search_results("engine", {"query": "agents"}, search) == "Second results"
+
+        def failing_search():
+            raise ValueError("No results found!")
+
+        with pytest.raises(ValueError):
+            web_cache.get_search_results("engine", {"query": "nothing"}, failing_search)
+        with pytest.raises(ValueError):
+            web_cache.get_search_results("engine", {"query": "nothing"}, failing_search)
+
+    def test_visit_webpage_uses_web_cache(self, server):
+        set_web_cache(WebCache(MemoryCache()))
+        try:
+            tool = VisitWebpageTool()
+            assert tool(get_url(server)) == "Title\n=====\n\nContent"
+            assert tool(get_url(server)) == "Title\n=====\n\nContent"
+            assert server.request_count == 1
+        finally:
+            set_web_cache(None)
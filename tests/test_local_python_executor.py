@@ -14,6 +14,7 @@
 # limitations under the License.
 
 import ast
+import time
 import types
 import unittest
 from contextlib import nullcontext as does_not_raise
@@ -26,11 +27,19 @@ import pytest
 
 from smolagents.default_tools import BASE_PYTHON_TOOLS, FinalAnswerTool
 from smolagents.local_python_executor import (
+    CODE_CACHE,
     DANGEROUS_FUNCTIONS,
+    BudgetExceededError,
+    CodeCache,
+    Frame,
     InterpreterError,
     LocalPythonExecutor,
     PrintContainer,
+    ResourceGovernor,
+    SpeculativeExecution,
     check_module_authorized,
+    compile_ast,
+    evaluate_ast,
     evaluate_condition,
     evaluate_delete,
     evaluate_python_code,
@@ -38,6 +47,7 @@ from smolagents.local_python_executor import (
     fix_final_answer_code,
     get_safe_module,
 )
+from smolagents.utils import truncate_content
 
 
 # Non-exhaustive list of dangerous modules that should not be imported
@@ -72,14 +82,14 @@ class PythonInterpreterTester(unittest.TestCase):
         state = {}
         result, _ = evaluate_python_code(code, {}, state=state)
         assert result == 3
-        self.assertDictEqualNoPrint(state, {"x": 3, "_operations_count": {"counter": 2}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "_resource_governor": ResourceGovernor(operations=2)})
 
         code = "x = y"
         state = {"y": 5}
         result, _ = evaluate_python_code(code, {}, state=state)
         # evaluate returns the value of the last assignment.
         assert result == 5
-        self.assertDictEqualNoPrint(state, {"x": 5, "y": 5, "_operations_count": {"counter": 2}})
+        self.assertDictEqualNoPrint(state, {"x": 5, "y": 5, "_resource_governor": ResourceGovernor(operations=2)})
 
         code = "a=1;b=None"
         result, _ = evaluate_python_code(code, {}, state={})
@@ -105,7 +115,7 @@ class PythonInterpreterTester(unittest.TestCase):
         state = {"x": 3}
         result, _ = evaluate_python_code(code, {"add_two": add_two}, state=state)
         assert result == 5
-        self.assertDictEqualNoPrint(state, {"x": 3, "y": 5, "_operations_count": {"counter": 3}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "y": 5, "_resource_governor": ResourceGovernor(operations=3)})
 
         # Should not work without the tool
         with pytest.raises(InterpreterError) as e:
@@ -117,7 +127,7 @@ class PythonInterpreterTester(unittest.TestCase):
         state = {}
         result, _ = evaluate_python_code(code, {}, state=state)
         assert result == 3
-        self.assertDictEqualNoPrint(state, {"x": 3, "_operations_count": {"counter": 2}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "_resource_governor": ResourceGovernor(operations=2)})
 
     def test_evaluate_dict(self):
         code = "test_dict = {'x': x, 'y': add_two(x)}"
@@ -125,7 +135,7 @@ class PythonInterpreterTester(unittest.TestCase):
         result, _ = evaluate_python_code(code, {"add_two": add_two}, state=state)
         self.assertDictEqual(result, {"x": 3, "y": 5})
         self.assertDictEqualNoPrint(
-            state, {"x": 3, "test_dict": {"x": 3, "y": 5}, "_operations_count": {"counter": 7}}
+            state, {"x": 3, "test_dict": {"x": 3, "y": 5}, "_resource_governor": ResourceGovernor(operations=7)}
         )
 
     def test_evaluate_expression(self):
@@ -134,7 +144,7 @@ class PythonInterpreterTester(unittest.TestCase):
         result, _ = evaluate_python_code(code, {}, state=state)
         # evaluate returns the value of the last assignment.
         assert result == 5
-        self.assertDictEqualNoPrint(state, {"x": 3, "y": 5, "_operations_count": {"counter": 4}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "y": 5, "_resource_governor": ResourceGovernor(operations=4)})
 
     def test_evaluate_f_string(self):
         code = "text = f'This is x: {x}.'"
@@ -142,7 +152,9 @@ class PythonInterpreterTester(unittest.TestCase):
         result, _ = evaluate_python_code(code, {}, state=state)
         # evaluate returns the value of the last assignment.
         assert result == "This is x: 3."
-        self.assertDictEqualNoPrint(state, {"x": 3, "text": "This is x: 3.", "_operations_count": {"counter": 6}})
+        self.assertDictEqualNoPrint(
+            state, {"x": 3, "text": "This is x: 3.", "_resource_governor": ResourceGovernor(operations=6)}
+        )
 
     def test_evaluate_f_string_with_format(self):
         code = "text = f'This is x: {x:.2f}.'"
@@ -150,7 +162,7 @@ class PythonInterpreterTester(unittest.TestCase):
         result, _ = evaluate_python_code(code, {}, state=state)
         assert result == "This is x: 3.34."
         self.assertDictEqualNoPrint(
-            state, {"x": 3.336, "text": "This is x: 3.34.", "_operations_count": {"counter": 8}}
+            state, {"x": 3.336, "text": "This is x: 3.34.", "_resource_governor": ResourceGovernor(operations=8)}
         )
 
     def test_evaluate_f_string_with_complex_format(self):
@@ -165,7 +177,7 @@ class PythonInterpreterTester(unittest.TestCase):
                 "width": 10,
                 "precision": 2,
                 "text": "This is x:       3.34.",
-                "_operations_count": {"counter": 14},
+                "_resource_governor": ResourceGovernor(operations=14),
             },
         )
 
@@ -175,41 +187,45 @@ class PythonInterpreterTester(unittest.TestCase):
         result, _ = evaluate_python_code(code, {}, state=state)
         # evaluate returns the value of the last assignment.
         assert result == 2
-        self.assertDictEqualNoPrint(state, {"x": 3, "y": 2, "_operations_count": {"counter": 6}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "y": 2, "_resource_governor": ResourceGovernor(operations=6)})
 
         state = {"x": 8}
         result, _ = evaluate_python_code(code, {}, state=state)
         # evaluate returns the value of the last assignment.
         assert result == 5
-        self.assertDictEqualNoPrint(state, {"x": 8, "y": 5, "_operations_count": {"counter": 6}})
+        self.assertDictEqualNoPrint(state, {"x": 8, "y": 5, "_resource_governor": ResourceGovernor(operations=6)})
 
     def test_evaluate_list(self):
         code = "test_list = [x, add_two(x)]"
         state = {"x": 3}
         result, _ = evaluate_python_code(code, {"add_two": add_two}, state=state)
         self.assertListEqual(result, [3, 5])
-        self.assertDictEqualNoPrint(state, {"x": 3, "test_list": [3, 5], "_operations_count": {"counter": 5}})
+        self.assertDictEqualNoPrint(
+            state, {"x": 3, "test_list": [3, 5], "_resource_governor": ResourceGovernor(operations=5)}
+        )
 
     def test_evaluate_name(self):
         code = "y = x"
         state = {"x": 3}
         result, _ = evaluate_python_code(code, {}, state=state)
         assert result == 3
-        self.assertDictEqualNoPrint(state, {"x": 3, "y": 3, "_operations_count": {"counter": 2}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "y": 3, "_resource_governor": ResourceGovernor(operations=2)})
 
     def test_evaluate_subscript(self):
         code = "test_list = [x, add_two(x)]\ntest_list[1]"
         state = {"x": 3}
         result, _ = evaluate_python_code(code, {"add_two": add_two}, state=state)
         assert result == 5
-        self.assertDictEqualNoPrint(state, {"x": 3, "test_list": [3, 5], "_operations_count": {"counter": 9}})
+        self.assertDictEqualNoPrint(
+            state, {"x": 3, "test_list": [3, 5], "_resource_governor": ResourceGovernor(operations=9)}
+        )
 
         code = "test_dict = {'x': x, 'y': add_two(x)}\ntest_dict['y']"
         state = {"x": 3}
         result, _ = evaluate_python_code(code, {"add_two": add_two}, state=state)
         assert result == 5
         self.assertDictEqualNoPrint(
-            state, {"x": 3, "test_dict": {"x": 3, "y": 5}, "_operations_count": {"counter": 11}}
+            state, {"x": 3, "test_dict": {"x": 3, "y": 5}, "_resource_governor": ResourceGovernor(operations=11)}
         )
 
         code = "vendor = {'revenue': 31000, 'rent': 50312}; vendor['ratio'] = round(vendor['revenue'] / vendor['rent'], 2)"
@@ -234,14 +250,14 @@ for result in search_results:
         state = {}
         result, _ = evaluate_python_code(code, {"range": range}, state=state)
         assert result == 2
-        self.assertDictEqualNoPrint(state, {"x": 2, "i": 2, "_operations_count": {"counter": 11}})
+        self.assertDictEqualNoPrint(state, {"x": 2, "i": 2, "_resource_governor": ResourceGovernor(operations=11)})
 
     def test_evaluate_binop(self):
         code = "y + x"
         state = {"x": 3, "y": 6}
         result, _ = evaluate_python_code(code, {}, state=state)
         assert result == 9
-        self.assertDictEqualNoPrint(state, {"x": 3, "y": 6, "_operations_count": {"counter": 4}})
+        self.assertDictEqualNoPrint(state, {"x": 3, "y": 6, "_resource_governor": ResourceGovernor(operations=4)})
 
     def test_recursive_function(self):
         code = """
@@ -284,7 +300,7 @@ recur_fibo(6)"""
         )
         state = {}
         evaluate_python_code(code, {"range": range}, state=state)
-        assert state["_operations_count"]["counter"] == 5
+        assert state["_resource_governor"].operations == 5
 
     def test_evaluate_string_methods(self):
         code = "'hello'.replace('h', 'o').split('e')"
@@ -1258,7 +1274,7 @@ def test_evaluate_delete(code, state, expectation):
         assert str(expectation) in str(exception_info.value)
     else:
         evaluate_delete(delete_node, state, {}, {}, [])
-        _ = state.pop("_operations_count", None)
+        _ = state.pop("_resource_governor", None)
         assert state == expectation
 
 
@@ -1504,6 +1520,224 @@ def test_evaluate_subscript_with_custom_class(subscriptable_class, expectation):
         assert result == expectation
 
 
+@pytest.mark.parametrize(
+    "code",
+    [
+        "x = [i * 2 for i in range(5) if i % 2]",
+        "d = {'a': 1, 'b': 2}\nx = sorted(k + str(v) for k, v in d.items())",
+        "x = 0\nfor i in range(10):\n    if i > 5:\n        break\n    x += i",
+        "x = 0\nwhile x < 10:\n    x += 3",
+        "def f(a, b=2, *args, **kwargs):\n    return a + b + len(args) + len(kwargs)\nx = f(1, 2, 3, c=4)",
+        "x = (lambda y: y ** 2)(3)",
+        "s = 'abc'\nx = f'{s.upper()!r:>6}' + s[::-1]",
+        "x = 1 < 2 <= 2 != 3 and not (4 in [1, 2])",
+        "try:\n    x = 1 / 0\nexcept ZeroDivisionError as e:\n    x = str(e)\nfinally:\n    y = 2",
+        "x = {i: i ** 2 for i in range(3)}\ny = {i % 2 for i in range(5)}",
+        "a, (b, c) = 1, (2, 3)\nx = [a, b, c]\nx[0] += 10",
+    ],
+)
+def test_compile_ast_matches_evaluate_ast(code):
+    expression = ast.parse(code)
+    static_tools = {"range": range, "len": len, "sorted": sorted, "str": str}
+
+    evaluated_state, evaluated_custom_tools = {"_resource_governor": ResourceGovernor()}, {}
+    for node in expression.body:
+        evaluated_result = evaluate_ast(node, evaluated_state, static_tools, evaluated_custom_tools, [])
+
+    compiled_nodes = [compile_ast(node, []) for node in expression.body]
+    # A compiled tree can be run several times
+    for _ in range(2):
+        compiled_state, compiled_custom_tools = {"_resource_governor": ResourceGovernor()}, {}
+        for compiled_node in compiled_nodes:
+            compiled_result = compiled_node(compiled_state, static_tools, compiled_custom_tools)
+        assert compiled_result == evaluated_result
+        assert compiled_custom_tools.keys() == evaluated_custom_tools.keys()
+        assert compiled_state.keys() == evaluated_state.keys()
+        for key, value in evaluated_state.items():
+            assert repr(compiled_state[key]) == repr(value)
+
+
+class TestFrame:
+    def test_lookup_and_assignment(self):
+        global_state = {"x": 1, "y": 2}
+        frame = Frame(Frame(global_state))
+        frame["y"] = 3
+        assert frame["x"] == 1 and frame["y"] == 3
+        assert "x" in frame and "z" not in frame
+        assert frame.get("z", 0) == 0
+        assert frame.keys() == {"x", "y"}
+        assert global_state == {"x": 1, "y": 2}
+        with pytest.raises(KeyError):
+            frame["z"]
+
+    @pytest.mark.parametrize(
+        "code",
+        [
+            "def f(a):\n    b = a + x\n    return b\nresult = f(1)",
+            "result = (lambda a: a + x)(1)",
+            "result = [a + x for a in [1]][0]",
+            "result = {a + x for a in [1]}.pop()",
+            "result = {a: a + x for a in [1]}[1]",
+        ],
+    )
+    def test_local_scopes_do_not_copy_nor_leak_into_state(self, code):
+        class UncopyableState(dict):
+            def copy(self):
+                raise AssertionError("The state should not be copied")
+
+        state = UncopyableState({f"var_{i}": i for i in range(1000)})
+        state["x"] = 1
+        evaluate_python_code(code, {}, state=state)
+        assert state["result"] == 2
+        assert "a" not in state and "b" not in state
+
+    def test_recursive_function_frames(self):
+        code = dedent(
+            """
+            def fib(n):
+                if n < 2:
+                    return n
+                return fib(n - 1) + fib(n - 2)
+
+            n = 10
+            result = fib(n)
+            """
+        )
+        state = {}
+        evaluate_python_code(code, {}, state=state)
+        assert state["result"] == 55
+        assert state["n"] == 10
+
+
+class TestGenerators:
+    def test_generator_expression_is_lazy(self):
+        code = dedent(
+            """
+            values = (1 / x for x in [1, 0])
+            first = next(values)
+            """
+        )
+        state = {}
+        evaluate_python_code(code, BASE_PYTHON_TOOLS, state=state)
+        assert state["first"] == 1.0
+        with pytest.raises(InterpreterError, match="ZeroDivisionError"):
+            evaluate_python_code("next(values)", BASE_PYTHON_TOOLS, state=state)
+
+    def test_generator_expression_with_nested_loops(self):
+        code = "list((x, y) for x in range(3) if x != 1 for y in range(x))"
+        result, _ = evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+        assert result == [(2, 0), (2, 1)]
+
+    def test_generator_functions(self):
+        code = dedent(
+            """
+            def countdown(n):
+                while n > 0:
+                    yield n
+                    n -= 1
+
+            def chain(*iterables):
+                for iterable in iterables:
+                    yield from iterable
+                return "unused"
+
+            def doubler():
+                received = yield "ready"
+                while received is not None:
+                    received = yield received * 2
+
+            gen = doubler()
+            result = (list(countdown(3)), list(chain([1], countdown(2))), next(gen), gen.send(21))
+            """
+        )
+        result, _ = evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+        assert result == ([3, 2, 1], [1, 2, 1], "ready", 42)
+
+    def test_generator_methods(self):
+        code = dedent(
+            """
+            class Squares:
+                def __init__(self, n):
+                    self.n = n
+
+                def __iter__(self):
+                    for i in range(self.n):
+                        yield i * i
+
+            sum(Squares(4))
+            """
+        )
+        result, _ = evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+        assert result == 14
+
+    def test_unsupported_yield(self):
+        code = "def f():\n    print((yield 1))\nlist(f())"
+        with pytest.raises(InterpreterError, match="Yield expressions are only supported as statements"):
+            evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+
+    def test_generator_frame_is_not_accessible(self):
+        code = "values = (x for x in [1])\nvalues.gi_frame.f_locals"
+        with pytest.raises(InterpreterError, match="Forbidden access to attribute: gi_frame"):
+            evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+
+    @pytest.mark.parametrize(
+        "code, error_message",
+        [
+            ("values = (x for x in [1])\ngetattr(values, 'gi_frame')", "Forbidden access to attribute: gi_frame"),
+            ("values = (x for x in [1])\nhasattr(values, 'gi_frame')", "Forbidden access to attribute: gi_frame"),
+            ("getattr((), '__class__')", "Forbidden access to dunder attribute: __class__"),
+            ("class A:\n    x = 1\nsetattr(A(), '__class__', int)", "Forbidden access to dunder attribute: __class__"),
+        ],
+    )
+    def test_forbidden_attributes_are_checked_by_getattr(self, code, error_message):
+        with pytest.raises(InterpreterError, match=error_message):
+            evaluate_python_code(code, BASE_PYTHON_TOOLS, state={})
+        assert evaluate_python_code("getattr((x for x in [1]), 'missing', 2)", BASE_PYTHON_TOOLS, state={})[0] == 2
+
+
+class TestCodeCache:
+    def test_hits_and_misses(self):
+        cache = CodeCache()
+        compiled_code = cache.get("x = 1\ny = x + 1", ["math"])
+        assert cache.get("x = 1\ny = x + 1", ["math"]) is compiled_code
+        assert cache.get_stats() == {"hits": 1, "misses": 1, "size": 1, "max_size": cache.max_size}
+
+        # The authorized imports are part of the key, regardless of their order
+        cache.get("x = 1\ny = x + 1", ["math", "random"])
+        cache.get("x = 1\ny = x + 1", ["random", "math"])
+        assert (cache.hits, cache.misses) == (2, 2)
+
+    def test_lru_eviction(self):
+        cache = CodeCache(max_size=2)
+        cache.get("a = 1", [])
+        cache.get("b = 1", [])
+        cache.get("a = 1", [])
+        cache.get("c = 1", [])
+        assert len(cache) == 2
+        cache.get("a = 1", [])
+        assert cache.hits == 2
+        cache.get("b = 1", [])
+        assert cache.misses == 4
+
+    def test_syntax_error_is_not_cached(self):
+        cache = CodeCache()
+        for _ in range(2):
+            with pytest.raises(InterpreterError, match="Code parsing failed on line 1"):
+                cache.get("x = (", [])
+        assert len(cache) == 0
+
+    def test_compiled_code_is_shared_across_executors(self):
+        code = "def double(x):\n    return x * 2\nresult = double(21)"
+        hits = CODE_CACHE.hits
+        executors = [LocalPythonExecutor([]) for _ in range(2)]
+        for executor in executors:
+            executor.send_tools({})
+            output, _, _ = executor(code)
+            assert output == 42
+        assert CODE_CACHE.hits == hits + 1
+        assert executors[0].custom_tools["double"] is not executors[1].custom_tools["double"]
+
+
 def test_get_safe_module_handle_lazy_imports():
     class FakeModule(types.ModuleType):
         def __init__(self, name):
@@ -1524,6 +1758,52 @@ def test_get_safe_module_handle_lazy_imports():
     assert getattr(safe_module, "non_lazy_attribute") == "ok"
 
 
+def test_get_safe_module_returns_cached_lazy_proxies():
+    accessed_attributes = []
+
+    class FakeModule(types.ModuleType):
+        def __getattribute__(self, name):
+            accessed_attributes.append(name)
+            return super().__getattribute__(name)
+
+    fake_module = FakeModule("fake_module")
+    fake_module.value = 1
+    fake_module.submodule = types.ModuleType("fake_module.submodule")
+    accessed_attributes.clear()
+
+    safe_module = get_safe_module(fake_module, authorized_imports=["fake_module"])
+    # Attributes are only looked up when the code accesses them
+    assert "value" not in accessed_attributes and "submodule" not in accessed_attributes
+    assert get_safe_module(fake_module, authorized_imports=["other_module"]) is safe_module
+    assert safe_module.value == 1
+    assert safe_module.submodule is get_safe_module(fake_module.submodule, authorized_imports=[])
+    assert {"value", "submodule"} <= set(dir(safe_module))
+    with pytest.raises(InterpreterError, match="read-only"):
+        safe_module.value = 2
+    assert fake_module.value == 1
+
+
+@pytest.mark.parametrize(
+    "code",
+    [
+        "getattr(random, '__dict__')['_raw_module'].choice = lambda x: 'hijacked'",
+        "random._raw_module.choice = lambda x: 'hijacked'",
+        "getattr(random, '__dict__')['choice'] = lambda x: 'hijacked'",
+    ],
+)
+def test_safe_module_does_not_expose_the_wrapped_module(code):
+    import random
+
+    executor = LocalPythonExecutor([])
+    executor.send_tools({})
+    with pytest.raises(InterpreterError):
+        executor("import random\n" + code)
+    assert random.choice([1]) == 1
+    other_executor = LocalPythonExecutor([])
+    other_executor.send_tools({})
+    assert other_executor("import random\nrandom.choice([1])")[0] == 1
+
+
 def test_non_standard_comparisons():
     code = dedent("""\
         class NonStdEqualsResult:
@@ -1579,6 +1859,25 @@ class TestPrintContainer:
         pc.append("Hello")
         assert len(pc) == 5
 
+    def test_max_length_keeps_head_and_tail(self):
+        pc = PrintContainer(max_length=10)
+        printed = ""
+        for i in range(100):
+            pc += f"{i}\n"
+            printed += f"{i}\n"
+            assert pc.value == truncate_content(printed, max_length=10)
+        assert pc.dropped_length == len(printed) - 10
+        # A single long output only keeps its last characters in the tail
+        pc.append("x" * 1000)
+        assert pc.value.endswith("\n" + "x" * 5)
+        assert pc.dropped_length == len(printed) + 1000 - 10
+
+    def test_set_value(self):
+        pc = PrintContainer(max_length=4)
+        pc.append("Hello world")
+        pc.value = "Hi"
+        assert (pc.value, pc.dropped_length) == ("Hi", 0)
+
 
 @pytest.mark.parametrize(
     "module,authorized_imports,expected",
@@ -1648,6 +1947,146 @@ class TestLocalPythonExecutor:
         with pytest.raises(InterpreterError, match=".*Cannot unpack tuple of wrong size"):
             executor(code)
 
+    @pytest.mark.parametrize(
+        "executor_kwargs, code, budget, limit",
+        [
+            ({"max_operations": 100}, "for i in range(1000):\n    x = i", "operations", 100),
+            ({"max_while_iterations": 10}, "i = 0\nwhile True:\n    i += 1", "while_iterations", 10),
+            ({"timeout": 0.05}, "while True:\n    pass", "time", 0.05),
+            ({"max_memory_mb": 50}, "x = []\nwhile True:\n    x.append('a' * 100_000)", "memory", 50),
+        ],
+    )
+    def test_budgets(self, executor_kwargs, code, budget, limit):
+        executor = LocalPythonExecutor([], **executor_kwargs)
+        executor.send_tools({})
+        with pytest.raises(BudgetExceededError) as exception_info:
+            executor(code)
+        assert exception_info.value.budget == budget
+        assert exception_info.value.limit == limit
+        assert exception_info.value.usage >= limit
+        assert "Code execution failed at line" in str(exception_info.value)
+
+    def test_budgets_are_reset_for_each_code_action(self):
+        executor = LocalPythonExecutor([], max_operations=100)
+        executor.send_tools({})
+        for _ in range(3):
+            executor("for i in range(10):\n    x = i")
+        assert executor.state["_resource_governor"].operations < 100
+
+    @pytest.mark.parametrize(
+        "definition, use",
+        [
+            ("def f():\n    for i in range(3000):\n        yield i\ng = f()", "sum(g)"),
+            (
+                "def mk():\n    def sq(n):\n        return sum(i * i for i in range(n))\n    return sq\nsq = mk()",
+                "sq(3000)",
+            ),
+        ],
+    )
+    def test_generators_and_closures_use_the_governor_of_the_current_code_action(self, definition, use):
+        executor = LocalPythonExecutor([], max_operations=20000, timeout=0.2)
+        executor.send_tools({"sum": sum, "range": range})
+        executor(definition)
+        time.sleep(0.3)
+        executor(use)
+        executor(use if "sq" in use else "g = f()\n" + use)
+        assert executor.state["_resource_governor"].operations < 20000
+
+    def test_budget_errors_cannot_be_caught(self):
+        code = dedent(
+            """
+            count = 0
+            while True:
+                try:
+                    count += 1
+                except Exception:
+                    pass
+            """
+        )
+        executor = LocalPythonExecutor([], max_operations=1000)
+        executor.send_tools({})
+        with pytest.raises(BudgetExceededError, match="Reached the max number of operations of 1000"):
+            executor(code)
+
+
+class TestSpeculativeExecution:
+    def make_executor(self, calls):
+        executor = LocalPythonExecutor([])
+        executor.send_tools({"final_answer": FinalAnswerTool(), "record": lambda x: calls.append(x) or x})
+        executor.send_variables({"a": 0})
+        return executor
+
+    def test_statements_run_while_streaming(self):
+        calls = []
+        speculative_execution = SpeculativeExecution(self.make_executor(calls))
+        for chunk in ["Code:\n```py\n", "a = record(1)\n", "print(a)\n", "b = record(a + 1)\n", "final_answer(b)\n"]:
+            speculative_execution.update(chunk)
+        speculative_execution.finish()
+        # final_answer is never run speculatively
+        assert calls == [1, 2]
+        assert speculative_execution.statements == ["a = record(1)", "print(a)", "b = record(a + 1)"]
+
+        output, logs, is_final_answer = speculative_execution(
+            "a = record(1)\nprint(a)\nb = record(a + 1)\nfinal_answer(b)"
+        )
+        assert calls == [1, 2]
+        assert output == 2
+        assert logs == "1\n"
+        assert is_final_answer is True
+
+    def test_different_final_code_is_rerun_after_rollback(self):
+        calls = []
+        executor = self.make_executor(calls)
+        speculative_execution = SpeculativeExecution(executor)
+        speculative_execution.update("Code:\n```py\na = record(1)\nb = 2\n")
+        output, _, _ = speculative_execution("a = a + 10\na")
+        assert output == 10
+        assert calls == [1]
+        assert "b" not in executor.state
+
+    def test_budgets_apply_to_the_whole_code_action(self):
+        loop = "for i in range(1000):\n    a = i"
+        # A loop is only run once the next statement is generated: the second loop runs with the rest of the code
+        statements = [loop, "b = 1", loop, "c = 2"]
+        executor = LocalPythonExecutor([])
+        executor.send_tools({"range": range})
+        executor("\n".join(statements))
+        operations = executor.state["_resource_governor"].operations
+
+        executor = LocalPythonExecutor([], max_operations=operations * 2 // 3, timeout=0.2)
+        executor.send_tools({"range": range})
+        speculative_execution = SpeculativeExecution(executor)
+        speculative_execution.update("Code:\n```py\n")
+        for statement in statements[:-1]:
+            speculative_execution.update(statement + "\n")
+            # Waiting for the model is not charged to the time budget
+            time.sleep(0.15)
+        with pytest.raises(BudgetExceededError, match="Reached the max number of operations"):
+            speculative_execution("\n".join(statements))
+
+    def test_rollback_removes_speculative_functions_and_classes(self):
+        executor = self.make_executor([])
+        executor("def kept():\n    return 1")
+        speculative_execution = SpeculativeExecution(executor)
+        speculative_execution.update("Code:\n```py\ndef f():\n    return 1\nclass A:\n    x = 1\nb = 2\n")
+        speculative_execution.finish()
+        assert {"f", "A"} <= set(executor.custom_tools) | set(executor.state)
+        output, _, _ = speculative_execution("kept()")
+        assert output == 1
+        assert "f" not in executor.custom_tools and "A" not in executor.custom_tools
+        assert "f" not in executor.state and "A" not in executor.state
+        with pytest.raises(InterpreterError):
+            executor("f()")
+
+    def test_error_in_speculative_statement(self):
+        calls = []
+        speculative_execution = SpeculativeExecution(self.make_executor(calls))
+        speculative_execution.update("Code:\n```py\nprint('before')\nx = 1 / 0\nrecord(2)\n")
+        with pytest.raises(InterpreterError, match="ZeroDivisionError"):
+            speculative_execution("print('before')\nx = 1 / 0\nrecord(2)\nfinal_answer(x)")
+        assert calls == []
+        assert str(speculative_execution.executor.state["_print_outputs"]) == "before\n"
+
 
 class TestLocalPythonExecutorSecurity:
     @pytest.mark.parametrize(
@@ -21,6 +21,42 @@ class TestAgentMemory:
         assert memory.system_prompt.system_prompt == system_prompt
         assert memory.steps == []
 
+    def test_get_messages(self):
+        memory = AgentMemory(system_prompt="This is a system prompt.")
+        memory.steps.append(TaskStep(task="Task"))
+        memory.steps.append(ActionStep(step_number=1, model_output="Output", observations="Observation"))
+        messages = memory.get_messages()
+        assert [message["role"] for message in messages] == [
+            MessageRole.SYSTEM,
+            MessageRole.USER,
+            MessageRole.ASSISTANT,
+            MessageRole.TOOL_RESPONSE,
+        ]
+        assert memory.get_messages(summary_mode=True) == messages[1:2] + messages[3:]
+
+    def test_get_messages_renders_only_new_and_modified_steps(self):
+        memory = AgentMemory(system_prompt="This is a system prompt.")
+        task_step = TaskStep(task="Task")
+        action_step = ActionStep(step_number=1, model_output="Output")
+        memory.steps.extend([task_step, action_step])
+        messages = memory.get_messages()
+
+        memory.steps.append(ActionStep(step_number=2, model_output="Second output"))
+        new_messages = memory.get_messages()
+        assert new_messages is not messages
+        assert new_messages[:3] == messages
+        assert all(new is old for new, old in zip(new_messages, messages))
+        assert new_messages[3]["content"][0]["text"] == "Second output"
+
+        action_step.observations = "Observation"
+        new_messages = memory.get_messages()
+        assert new_messages[1] is messages[1]
+        assert new_messages[3]["content"][0]["text"] == "Observation:\nObservation"
+        assert new_messages[4]["content"][0]["text"] == "Second output"
+
+        memory.reset()
+        assert len(memory.get_messages()) == 1
+
 
 class TestMemoryStep:
     def test_initialization(self):
@@ -36,6 +72,17 @@ class TestMemoryStep:
         with pytest.raises(NotImplementedError):
             step.to_messages()
 
+    def test_get_messages_is_cached_until_step_changes(self):
+        step = TaskStep(task="Task")
+        messages = step.get_messages()
+        assert messages == step.to_messages()
+        assert step.get_messages() is messages
+        step.task = "New task"
+        new_messages = step.get_messages()
+        assert new_messages is not messages
+        assert new_messages[0]["content"][0]["text"] == "New task:\nNew task"
+        assert step.dict() == {"task": "New task", "task_images": None}
+
 
 def test_action_step_to_messages():
     action_step = ActionStep(
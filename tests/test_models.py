@@ -12,35 +12,76 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import json
+import random
 import sys
+import threading
 import unittest
 from contextlib import ExitStack
+from types import SimpleNamespace
 from typing import Optional
-from unittest.mock import MagicMock, patch
+from unittest.mock import AsyncMock, MagicMock, patch
 
+import PIL.Image
 import pytest
 
+from smolagents.cache import DirectoryCache
+from smolagents.default_tools import FinalAnswerTool
 from smolagents.models import (
     AzureOpenAIServerModel,
+    CachedModel,
     ChatMessage,
+    ChatMessageStreamDelta,
     ChatMessageToolCall,
+    ChatMessageToolCallDefinition,
+    ChatMessageToolCallStreamDelta,
     HfApiModel,
     LiteLLMModel,
     MessageRole,
     MLXModel,
+    Model,
     OpenAIServerModel,
+    RequestBatcher,
+    StopSequenceMatcher,
     TransformersModel,
+    add_cache_control_markers,
+    agglomerate_stream_deltas,
+    get_cached_token_count,
     get_clean_message_list,
+    get_common_prefix_length,
     get_tool_call_from_text,
     get_tool_json_schema,
     parse_json_if_needed,
+    stream_until_stop_sequences,
 )
 from smolagents.tools import tool
 
 from .utils.markers import require_run_all
 
 
+def make_completion_response(content: str) -> MagicMock:
+    response = MagicMock()
+    response.usage.prompt_tokens = 10
+    response.usage.completion_tokens = 5
+    response.choices[0].message.role = "assistant"
+    response.choices[0].message.content = content
+    response.choices[0].message.tool_calls = None
+    response.choices[0].message.model_dump.return_value = {"role": "assistant", "content": content}
+    return response
+
+
+def make_stream_chunk(content=None, tool_calls=None, usage=None) -> MagicMock:
+    chunk = MagicMock()
+    chunk.usage = usage
+    if content is None and tool_calls is None:
+        chunk.choices = []
+    else:
+        chunk.choices[0].delta.content = content
+        chunk.choices[0].delta.tool_calls = tool_calls
+    return chunk
+
+
 class TestModel:
     def test_get_json_schema_has_nullable_args(self):
         @tool
@@ -107,6 +148,22 @@ class TestModel:
         output = model(messages, stop_sequences=["great"]).content
         assert output == "Hello! How can"
 
+    def test_acall_runs_call_in_thread(self):
+        class DummyModel(Model):
+            def __call__(self, messages, stop_sequences=None, **kwargs):
+                return ChatMessage(role="assistant", content=f"{len(messages)} messages, stop at {stop_sequences}")
+
+        message = asyncio.run(DummyModel().acall([{"role": "user", "content": "Hi"}], stop_sequences=["END"]))
+        assert message.content == "1 messages, stop at ['END']"
+
+    def test_generate_stream_yields_call_output(self):
+        class DummyModel(Model):
+            def __call__(self, messages, stop_sequences=None, **kwargs):
+                return ChatMessage(role="assistant", content="Hello")
+
+        deltas = list(DummyModel().generate_stream([{"role": "user", "content": "Hi"}]))
+        assert deltas == [ChatMessageStreamDelta(content="Hello")]
+
     def test_parse_json_if_needed(self):
         args = "abc"
         parsed_args = parse_json_if_needed(args)
@@ -137,6 +194,18 @@ class TestHfApiModel:
             "role conversion should be applied"
         )
 
+    def test_acall_uses_async_client(self):
+        model = HfApiModel(model_id="test-model")
+        model.client = MagicMock()
+        model.async_client = MagicMock()
+        model.async_client.chat_completion = AsyncMock(return_value=make_completion_response("Hello"))
+        message = asyncio.run(model.acall([{"role": "user", "content": [{"type": "text", "text": "Hi"}]}]))
+        assert message.content == "Hello"
+        assert model.last_input_token_count == 10
+        assert model.last_output_token_count == 5
+        model.async_client.chat_completion.assert_awaited_once()
+        model.client.chat_completion.assert_not_called()
+
     @require_run_all
     def test_get_hfapi_message_no_tool(self):
         model = HfApiModel(model_id="Qwen/Qwen2.5-Coder-32B-Instruct", max_tokens=10)
@@ -167,6 +236,41 @@ class TestLiteLLMModel:
             model(messages)
         assert error_flag in str(e)
 
+    def test_acall_uses_acompletion(self):
+        model = LiteLLMModel(model_id="openai/gpt-4o")
+        messages = [{"role": "user", "content": [{"type": "text", "text": "Hi"}]}]
+        with patch("smolagents.models.import_litellm") as mock_import_litellm:
+            acompletion = mock_import_litellm.return_value.acompletion = AsyncMock(
+                return_value=make_completion_response("Hello")
+            )
+            message = asyncio.run(model.acall(messages, stop_sequences=["END"]))
+        assert message.content == "Hello"
+        assert acompletion.await_args.kwargs["model"] == "openai/gpt-4o"
+        assert acompletion.await_args.kwargs["stop"] == ["END"]
+        mock_import_litellm.return_value.completion.assert_not_called()
+
+    def test_prompt_caching_defaults_to_anthropic_models(self):
+        assert LiteLLMModel(model_id="anthropic/claude-3-5-sonnet-latest").prompt_caching
+        assert not LiteLLMModel(model_id="openai/gpt-4o").prompt_caching
+        assert not LiteLLMModel(model_id="anthropic/claude-3-5-sonnet-latest", prompt_caching=False).prompt_caching
+
+    def test_prompt_caching_marks_messages(self):
+        model = LiteLLMModel(model_id="anthropic/claude-3-5-sonnet-latest")
+        messages = [
+            {"role": "system", "content": [{"type": "text", "text": "System prompt"}]},
+            {"role": "user", "content": [{"type": "text", "text": "Task"}]},
+        ]
+        with patch("smolagents.models.import_litellm") as mock_import_litellm:
+            response = make_completion_response("Hello")
+            response.usage.prompt_tokens_details.cached_tokens = 7
+            completion = mock_import_litellm.return_value.completion
+            completion.return_value = response
+            model(messages)
+        sent_messages = completion.call_args.kwargs["messages"]
+        assert sent_messages[0]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+        assert sent_messages[-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+        assert model.last_cached_input_token_count == 7
+
     def test_passing_flatten_messages(self):
         model = LiteLLMModel(model_id="groq/llama-3.3-70b", flatten_messages_as_text=False)
         assert not model.flatten_messages_as_text
@@ -198,6 +302,38 @@ class TestOpenAIServerModel:
         )
         assert model.client == MockOpenAI.return_value
 
+    def test_acall_shares_async_client(self):
+        model = OpenAIServerModel(model_id="gpt-4o", api_key="test_api_key", client_kwargs={"max_retries": 5})
+        messages = [{"role": "user", "content": [{"type": "text", "text": "Hi"}]}]
+
+        async def run_concurrent_calls():
+            return await asyncio.gather(*(model.acall(messages) for _ in range(3)))
+
+        with patch("openai.AsyncOpenAI") as MockAsyncOpenAI:
+            create = MockAsyncOpenAI.return_value.chat.completions.create
+            create.side_effect = AsyncMock(return_value=make_completion_response("Hello"))
+            results = asyncio.run(run_concurrent_calls())
+        assert [message.content for message in results] == ["Hello"] * 3
+        MockAsyncOpenAI.assert_called_once_with(
+            base_url=None, api_key="test_api_key", organization=None, project=None, max_retries=5
+        )
+        assert create.call_count == 3
+        assert create.call_args.kwargs["model"] == "gpt-4o"
+
+    def test_generate_stream(self):
+        model = OpenAIServerModel(model_id="gpt-4o", api_key="test_api_key")
+        messages = [{"role": "user", "content": [{"type": "text", "text": "Hi"}]}]
+        usage = MagicMock(prompt_tokens=10, completion_tokens=2)
+        with patch.object(model.client.chat.completions, "create") as create:
+            create.return_value = iter(
+                [make_stream_chunk("Hel"), make_stream_chunk("lo"), make_stream_chunk(usage=usage)]
+            )
+            deltas = list(model.generate_stream(messages, stop_sequences=["END"]))
+        assert [delta.content for delta in deltas] == ["Hel", "lo"]
+        assert create.call_args.kwargs["stream"] is True
+        assert create.call_args.kwargs["stop"] == ["END"]
+        assert model.get_token_counts() == {"input_token_count": 10, "output_token_count": 2}
+
 
 class TestAzureOpenAIServerModel:
     def test_client_kwargs_passed_correctly(self):
@@ -278,6 +414,228 @@ class TestTransformersModel:
             assert mocks["transformers.AutoProcessor.from_pretrained"].call_args.args == ("test-model",)
             assert mocks["transformers.AutoProcessor.from_pretrained"].call_args.kwargs == {"trust_remote_code": True}
 
+    def test_kv_cache_reuse(self):
+        import torch
+        from transformers import BatchEncoding
+
+        class FakeCache:
+            def __init__(self):
+                self.length = 0
+
+            def get_seq_length(self):
+                return self.length
+
+            def crop(self, max_length):
+                self.length = max_length
+
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch(
+                    "transformers.AutoModelForImageTextToText.from_pretrained",
+                    side_effect=ValueError("Unrecognized configuration class"),
+                )
+            )
+            stack.enter_context(patch("transformers.AutoModelForCausalLM.from_pretrained"))
+            stack.enter_context(patch("transformers.AutoTokenizer.from_pretrained"))
+            model = TransformersModel(model_id="test-model", max_new_tokens=2, kv_cache_max_entries=2)
+
+        prompts = iter([[1, 2, 3, 4], [1, 2, 3, 4, 7, 5, 6], [9, 9], [1, 2, 3]])
+        model.tokenizer.apply_chat_template.side_effect = lambda *args, **kwargs: BatchEncoding(
+            {"input_ids": torch.tensor([next(prompts)])}
+        )
+        model.tokenizer.decode.return_value = "output"
+        used_caches = []
+
+        def generate(input_ids, past_key_values=None, **kwargs):
+            used_caches.append((past_key_values, past_key_values.length))
+            # The cache holds every token but the last generated one
+            past_key_values.length = input_ids.shape[1] + 1
+            return torch.cat([input_ids, torch.tensor([[7, 8]])], dim=1)
+
+        model.model.generate.side_effect = generate
+        messages = [{"role": "user", "content": [{"type": "text", "text": "Hello!"}]}]
+        with patch("transformers.DynamicCache", FakeCache):
+            model(messages)
+            assert model.last_cached_input_token_count == 0
+            model(messages)
+            assert used_caches[1] == (used_caches[0][0], 5)
+            assert model.last_cached_input_token_count == 5
+            model(messages)
+            assert used_caches[2][1] == 0
+            assert len(model._kv_caches) == 2
+            # The prompt is entirely cached: its last token is processed again to generate the next one
+            model(messages)
+            assert used_caches[3] == (used_caches[1][0], 2)
+            model.reset()
+            assert model._kv_caches == []
+
+    def test_generate_batch_groups_calls_with_same_settings(self):
+        with ExitStack() as stack:
+            stack.enter_context(
+                patch(
+                    "transformers.AutoModelForImageTextToText.from_pretrained",
+                    side_effect=ValueError("Unrecognized configuration class"),
+                )
+            )
+            stack.enter_context(patch("transformers.AutoModelForCausalLM.from_pretrained"))
+            stack.enter_context(patch("transformers.AutoTokenizer.from_pretrained"))
+            model = TransformersModel(model_id="test-model", max_new_tokens=2, max_batch_size=4)
+        requests = [
+            ({"input_ids": MagicMock()}, ["END"], {"max_new_tokens": 2, "stopping_criteria": MagicMock()}),
+            ({"input_ids": MagicMock()}, ["STOP"], {"max_new_tokens": 2, "stopping_criteria": MagicMock()}),
+            ({"input_ids": MagicMock()}, ["END"], {"max_new_tokens": 2, "stopping_criteria": MagicMock()}),
+        ]
+        with (
+            patch.object(model, "_generate", return_value=("single", 1, 1, 0)) as mock_generate,
+            patch.object(
+                model, "_generate_padded_batch", return_value=[("first", 1, 1, 0), ("third", 1, 1, 0)]
+            ) as mock_generate_padded_batch,
+        ):
+            outputs = model._generate_batch(requests)
+        assert [output[0] for output in outputs] == ["first", "single", "third"]
+        assert mock_generate.call_args.args == requests[1]
+        assert mock_generate_padded_batch.call_args.args == ([requests[0], requests[2]],)
+
+
+class TestCachedModel:
+    class CountingModel(Model):
+        def __init__(self):
+            super().__init__(temperature=0.5)
+            self.model_id = "counting-model"
+            self.call_count = 0
+
+        def __call__(self, messages, stop_sequences=None, tools_to_call_from=None, **kwargs):
+            self.call_count += 1
+            self.last_input_token_count, self.last_output_token_count = 10, 5
+            if tools_to_call_from:
+                return ChatMessage(
+                    role="assistant",
+                    content="",
+                    tool_calls=[
+                        ChatMessageToolCall(
+                            id="call_0",
+                            type="function",
+                            function=ChatMessageToolCallDefinition(name="final_answer", arguments={"answer": "4"}),
+                        )
+                    ],
+                    raw="not serializable",
+                )
+            return ChatMessage(role="assistant", content=f"Answer {self.call_count}")
+
+    messages = [{"role": "user", "content": [{"type": "text", "text": "What is 2 + 2?"}]}]
+
+    def test_identical_calls_are_cached(self):
+        wrapped_model = self.CountingModel()
+        model = CachedModel(wrapped_model)
+        assert model(self.messages, stop_sequences=["END"]).content == "Answer 1"
+        assert model(self.messages, stop_sequences=["END"]).content == "Answer 1"
+        assert wrapped_model.call_count == 1
+        assert (model.cache_hit_count, model.cache_miss_count) == (1, 1)
+        assert (model.last_input_token_count, model.last_output_token_count) == (10, 5)
+        assert model.last_cached_input_token_count == 10
+
+        # Any difference in the call makes a different key
+        assert model(self.messages, stop_sequences=["STOP"]).content == "Answer 2"
+        assert model(self.messages, stop_sequences=["END"], temperature=0).content == "Answer 3"
+        assert model(self.messages + self.messages, stop_sequences=["END"]).content == "Answer 4"
+
+    def test_tool_calls_are_cached(self):
+        wrapped_model = self.CountingModel()
+        model = CachedModel(wrapped_model)
+        model(self.messages, tools_to_call_from=[FinalAnswerTool()])
+        message = model(self.messages, tools_to_call_from=[FinalAnswerTool()])
+        assert wrapped_model.call_count == 1
+        assert message.tool_calls[0].function.name == "final_answer"
+        assert message.tool_calls[0].function.arguments == {"answer": "4"}
+
+    def test_record_and_replay(self, tmp_path):
+        wrapped_model = self.CountingModel()
+        recording_model = CachedModel(wrapped_model, cache=DirectoryCache(tmp_path), mode="record")
+        recording_model(self.messages)
+        assert recording_model(self.messages).content == "Answer 2"
+
+        replaying_model = CachedModel(self.CountingModel(), cache=DirectoryCache(tmp_path), mode="replay")
+        assert replaying_model(self.messages).content == "Answer 2"
+        assert replaying_model.model.call_count == 0
+        with pytest.raises(ValueError, match="No cached response"):
+            replaying_model(self.messages, stop_sequences=["END"])
+
+    def test_invalid_mode(self):
+        with pytest.raises(ValueError, match="Unknown cache mode"):
+            CachedModel(self.CountingModel(), mode="write_only")
+
+    def test_to_dict_and_from_dict(self):
+        model = CachedModel(HfApiModel(model_id="Qwen/Qwen2.5-Coder-32B-Instruct"), mode="replay")
+        model_dictionary = model.to_dict()
+        assert model_dictionary["model"]["class"] == "HfApiModel"
+        new_model = CachedModel.from_dict(model_dictionary)
+        assert isinstance(new_model.model, HfApiModel)
+        assert new_model.model_id == "Qwen/Qwen2.5-Coder-32B-Instruct"
+        assert new_model.mode == "replay"
+
+
+class TestRequestBatcher:
+    def test_concurrent_requests_are_batched(self):
+        batches = []
+
+        def process_batch(requests):
+            batches.append(requests)
+            return [request * 2 for request in requests]
+
+        batcher = RequestBatcher(process_batch, max_batch_size=4, max_wait_time=0.5)
+        barrier = threading.Barrier(4)
+        results = [None] * 4
+
+        def submit(index):
+            barrier.wait()
+            results[index] = batcher.submit(index)
+
+        threads = [threading.Thread(target=submit, args=(index,)) for index in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert results == [0, 2, 4, 6]
+        assert len(batches) == 1
+        assert sorted(batches[0]) == [0, 1, 2, 3]
+
+    def test_batches_are_limited_in_size(self):
+        batches = []
+
+        def process_batch(requests):
+            batches.append(requests)
+            return requests
+
+        batcher = RequestBatcher(process_batch, max_batch_size=2, max_wait_time=0.2)
+        threads = [threading.Thread(target=batcher.submit, args=(index,)) for index in range(5)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        assert sorted(request for batch in batches for request in batch) == [0, 1, 2, 3, 4]
+        assert all(len(batch) <= 2 for batch in batches)
+
+    def test_errors_are_raised_to_submitters(self):
+        def process_batch(requests):
+            return [ValueError("Bad request") if request == "bad" else request for request in requests]
+
+        batcher = RequestBatcher(process_batch, max_wait_time=0)
+        assert batcher.submit("good") == "good"
+        with pytest.raises(ValueError, match="Bad request"):
+            batcher.submit("bad")
+
+        batcher = RequestBatcher(MagicMock(side_effect=RuntimeError("Generation failed")), max_wait_time=0)
+        with pytest.raises(RuntimeError, match="Generation failed"):
+            batcher.submit("request")
+
+
+@pytest.mark.parametrize(
+    "first_sequence, second_sequence, expected_length",
+    [([], [1, 2], 0), ([1, 2, 3], [1, 2, 4], 2), ([1, 2], [1, 2, 3], 2), ([2, 1], [1, 2], 0)],
+)
+def test_get_common_prefix_length(first_sequence, second_sequence, expected_length):
+    assert get_common_prefix_length(first_sequence, second_sequence) == expected_length
+
 
 def test_get_clean_message_list_basic():
     messages = [
@@ -346,6 +704,54 @@ def test_get_clean_message_list_image_encoding(convert_images_to_image_urls, exp
         assert result[0] == expected_clean_message
 
 
+def test_get_clean_message_list_does_not_modify_input_messages():
+    image = PIL.Image.new("RGB", (8, 8))
+    messages = [
+        {"role": "user", "content": [{"type": "text", "text": "Hello!"}, {"type": "image", "image": image}]},
+        {"role": "tool-response", "content": [{"type": "text", "text": "Observation"}]},
+    ]
+    original_messages = [{**message, "content": list(message["content"])} for message in messages]
+    result = get_clean_message_list(
+        messages, role_conversions={"tool-response": "user"}, convert_images_to_image_urls=True
+    )
+    assert messages == original_messages
+    assert messages[0]["content"][1]["image"] is image
+    assert len(result) == 1
+    assert [element["type"] for element in result[0]["content"]] == ["text", "image_url", "text"]
+    # Unchanged elements are shared with the input messages instead of being copied
+    assert result[0]["content"][0] is messages[0]["content"][0]
+
+
+def test_add_cache_control_markers():
+    messages = [
+        {"role": "system", "content": [{"type": "text", "text": "System prompt"}]},
+        {"role": "user", "content": [{"type": "text", "text": "Task"}]},
+        {"role": "assistant", "content": [{"type": "text", "text": "Thought"}]},
+        {"role": "user", "content": [{"type": "text", "text": "Observation"}, {"type": "text", "text": "Next"}]},
+    ]
+    original_messages = json.loads(json.dumps(messages))
+    result = add_cache_control_markers(messages)
+    assert messages == original_messages
+    assert result[0]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert result[-1]["content"][-1]["cache_control"] == {"type": "ephemeral"}
+    assert "cache_control" not in result[-1]["content"][0]
+    assert result[1:3] == messages[1:3]
+    assert add_cache_control_markers([]) == []
+
+
+@pytest.mark.parametrize(
+    "usage, expected_count",
+    [
+        (None, 0),
+        (SimpleNamespace(prompt_tokens=10), 0),
+        (SimpleNamespace(prompt_tokens=10, prompt_tokens_details=SimpleNamespace(cached_tokens=8)), 8),
+        (SimpleNamespace(prompt_tokens=10, prompt_tokens_details=None, cache_read_input_tokens=6), 6),
+    ],
+)
+def test_get_cached_token_count(usage, expected_count):
+    assert get_cached_token_count(usage) == expected_count
+
+
 def test_get_clean_message_list_flatten_messages_as_text():
     messages = [
         {"role": "user", "content": [{"type": "text", "text": "Hello!"}]},
@@ -408,6 +814,90 @@ def test_flatten_messages_as_text_for_all_models(
     assert model.flatten_messages_as_text is expected_flatten_messages_as_text, f"{model_class.__name__} failed"
 
 
+class TestStreamDeltas:
+    def test_agglomerate_stream_deltas(self):
+        message = agglomerate_stream_deltas(
+            [
+                ChatMessageStreamDelta(content="Calling"),
+                ChatMessageStreamDelta(
+                    content=" tools",
+                    tool_calls=[ChatMessageToolCallStreamDelta(index=0, id="call_0", type="function", name="search")],
+                ),
+                ChatMessageStreamDelta(tool_calls=[ChatMessageToolCallStreamDelta(index=0, arguments='{"query": ')]),
+                ChatMessageStreamDelta(
+                    tool_calls=[
+                        ChatMessageToolCallStreamDelta(index=0, arguments='"smolagents"}'),
+                        ChatMessageToolCallStreamDelta(index=1, id="call_1", name="final_answer", arguments="{}"),
+                    ]
+                ),
+            ]
+        )
+        assert message.role == MessageRole.ASSISTANT
+        assert message.content == "Calling tools"
+        assert [tool_call.id for tool_call in message.tool_calls] == ["call_0", "call_1"]
+        assert message.tool_calls[0].function.name == "search"
+        assert message.tool_calls[0].function.arguments == {"query": "smolagents"}
+        assert message.tool_calls[1].type == "function"
+
+    def test_agglomerate_stream_deltas_without_tool_calls(self):
+        message = agglomerate_stream_deltas([ChatMessageStreamDelta(content="Hello"), ChatMessageStreamDelta()])
+        assert message.content == "Hello"
+        assert message.tool_calls is None
+
+    @pytest.mark.parametrize(
+        "chunks, stop_sequences, expected_chunks",
+        [
+            (["Hello", " world"], None, ["Hello", " world"]),
+            (["Hello", " world"], ["END"], ["Hello", " world"]),
+            (["Hello E", "N", "ding"], ["END"], ["Hello ", "ENding"]),
+            (["Code", "<end_", "code>", "ignored"], ["<end_code>"], ["Code"]),
+            (["Cod", "e<end_code> ignored"], ["<end_code>", "Observation:"], ["Cod", "e"]),
+            (["Obs", "erve", "Obs", "ervation:"], ["Observation:"], ["Observe"]),
+            (["x = 1<end_c", "ode>", "garbage"], ["<end_code>", "Observation:", "Calling tools:"], ["x = 1"]),
+            (["Hi<end_c"], ["<end_code>", "Observation:", "Calling tools:"], ["Hi", "<end_c"]),
+        ],
+    )
+    def test_stream_until_stop_sequences(self, chunks, stop_sequences, expected_chunks):
+        assert list(stream_until_stop_sequences(chunks, stop_sequences)) == expected_chunks
+
+    def test_stop_sequence_matcher_keeps_a_bounded_tail(self):
+        stop_sequence_matcher = StopSequenceMatcher(["<end_code>", "Observation:"])
+        released_text = ""
+        for _ in range(1000):
+            text, is_stopped = stop_sequence_matcher.update("print(1)\n")
+            released_text += text
+            assert not is_stopped
+            assert len(stop_sequence_matcher.tail) <= len("Observation:") - 1
+        text, is_stopped = stop_sequence_matcher.update("<end")
+        assert (text, is_stopped) == ("", False)
+        text, is_stopped = stop_sequence_matcher.update("_code> ignored")
+        assert (text, is_stopped) == ("", True)
+        assert released_text == "print(1)\n" * 1000
+        assert stop_sequence_matcher.update("more") == ("", True)
+        assert stop_sequence_matcher.flush() == ""
+
+    def test_stop_sequence_matcher_matches_naive_search(self):
+        stop_sequences = ["<end_code>", "Observation:", "Calling tools:", "ab"]
+        alphabet = ["a", "b", "x", "<end_", "code>", "<end_c", "Obs", "ervation:", "Calling", " tools:", "\n"]
+        random_generator = random.Random(0)
+        for _ in range(2000):
+            text = "".join(random_generator.choices(alphabet, k=random_generator.randint(0, 12)))
+            cuts = sorted(random_generator.sample(range(len(text) + 1), k=min(len(text) + 1, 4)))
+            chunks = [text[start:end] for start, end in zip([0] + cuts, cuts + [len(text)])]
+            stop_indices = [text.find(stop_sequence) for stop_sequence in stop_sequences]
+            stop_indices = [stop_index for stop_index in stop_indices if stop_index != -1]
+            expected_text = text[: min(stop_indices)] if stop_indices else text
+
+            stop_sequence_matcher = StopSequenceMatcher(stop_sequences)
+            released_text = ""
+            for chunk in chunks:
+                released_chunk, is_stopped = stop_sequence_matcher.update(chunk)
+                released_text += released_chunk
+            released_text += stop_sequence_matcher.flush()
+            assert released_text == expected_text, chunks
+            assert is_stopped == bool(stop_indices), chunks
+
+
 class TestGetToolCallFromText:
     @pytest.fixture(autouse=True)
     def mock_uuid4(self):
@@ -22,11 +22,13 @@ from smolagents import (
     CodeAgent,
     ToolCallingAgent,
     stream_to_gradio,
+    tool,
 )
 from smolagents.models import (
     ChatMessage,
     ChatMessageToolCall,
     ChatMessageToolCallDefinition,
+    Model,
 )
 
 
@@ -59,6 +61,14 @@ final_answer('This is the final answer.')
             )
 
 
+class FakeStreamingLLMModel(FakeLLMModel, Model):
+    """`FakeLLMModel` with the `generate_stream` method of `Model`, which yields its answers as single deltas."""
+
+    def __init__(self):
+        Model.__init__(self)
+        FakeLLMModel.__init__(self)
+
+
 class MonitoringTester(unittest.TestCase):
     def test_code_agent_metrics(self):
         agent = CodeAgent(
@@ -83,6 +93,49 @@ class MonitoringTester(unittest.TestCase):
         self.assertEqual(agent.monitor.total_input_token_count, 10)
         self.assertEqual(agent.monitor.total_output_token_count, 20)
 
+    def test_cached_input_token_metrics(self):
+        model = FakeLLMModel()
+        model.last_cached_input_token_count = 8
+        agent = CodeAgent(tools=[], model=model, max_steps=1)
+
+        agent.run("Fake task")
+
+        self.assertEqual(agent.monitor.total_cached_input_token_count, 8)
+        self.assertEqual(agent.monitor.get_total_token_counts()["cached_input"], 8)
+
+    def test_tool_cache_metrics(self):
+        class CachedFinalAnswerModel(Model):
+            def __call__(self, prompt, tools_to_call_from=None, **kwargs):
+                return ChatMessage(
+                    role="assistant",
+                    content="""
+Code:
+```py
+lookup(key="a")
+lookup(key="a")
+lookup(key="b")
+final_answer("done")
+```""",
+                )
+
+        @tool(cache=True)
+        def lookup(key: str) -> str:
+            """
+            Looks up a key.
+
+            Args:
+                key: The key.
+            """
+            return key.upper()
+
+        agent = CodeAgent(tools=[lookup], model=CachedFinalAnswerModel(), max_steps=1)
+        agent.run("Fake task")
+        self.assertEqual(agent.monitor.get_tool_cache_stats(), {"lookup": {"hits": 1, "misses": 2}})
+
+        # Statistics are counted from the start of each run
+        agent.run("Fake task")
+        self.assertEqual(agent.monitor.get_tool_cache_stats(), {"lookup": {"hits": 3, "misses": 0}})
+
     def test_code_agent_metrics_max_steps(self):
         class FakeLLMModelMalformedAnswer:
             def __init__(self):
@@ -167,6 +220,16 @@ class MonitoringTester(unittest.TestCase):
         self.assertEqual(final_message.content["path"], "path.png")
         self.assertEqual(final_message.content["mime_type"], "image/png")
 
+    def test_streaming_agent_model_outputs(self):
+        agent = CodeAgent(tools=[], model=FakeStreamingLLMModel(), max_steps=1, stream_outputs=True)
+
+        outputs = list(stream_to_gradio(agent, task="Test task"))
+
+        streamed_outputs = [output for output in outputs if output.metadata.get("id") == "streamed_model_output"]
+        self.assertEqual(len(streamed_outputs), 1)
+        self.assertIn("final_answer('This is the final answer.')", streamed_outputs[0].content)
+        self.assertIn("This is the final answer.", outputs[-1].content)
+
     def test_streaming_with_agent_error(self):
         def dummy_model(prompt, **kwargs):
             return ChatMessage(role="assistant", content="Malformed call")
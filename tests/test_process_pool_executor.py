@@ -0,0 +1,150 @@
+import multiprocessing
+from textwrap import dedent
+
+import pytest
+
+from smolagents.default_tools import FinalAnswerTool
+from smolagents.local_python_executor import InterpreterError
+from smolagents.process_pool_executor import ProcessPoolPythonExecutor, PythonWorkerPool
+from smolagents.tools import tool
+
+
+@tool
+def add_numbers(a: int, b: int) -> int:
+    """
+    Adds two numbers.
+
+    Args:
+        a: The first number.
+        b: The second number.
+    """
+    return a + b
+
+
+@tool
+def failing_tool(message: str) -> str:
+    """
+    Always fails.
+
+    Args:
+        message: The error message.
+    """
+    raise ValueError(message)
+
+
+@pytest.fixture(scope="module")
+def pool():
+    pool = PythonWorkerPool(num_workers=1)
+    yield pool
+    pool.shutdown()
+
+
+@pytest.fixture
+def executor(pool):
+    executor = ProcessPoolPythonExecutor([], pool=pool)
+    executor.send_tools({"add_numbers": add_numbers, "failing_tool": failing_tool, "final_answer": FinalAnswerTool()})
+    yield executor
+    executor.cleanup()
+
+
+class TestProcessPoolPythonExecutor:
+    def test_state_persistence(self, executor):
+        executor("import math\na = 2")
+        output, logs, is_final_answer = executor("print(math.sqrt(4))\na + 1")
+        assert output == 3
+        assert logs == "2.0\n"
+        assert is_final_answer is False
+
+    def test_send_variables(self, executor):
+        executor.send_variables({"x": 5})
+        output, _, _ = executor("x * 2")
+        assert output == 10
+
+    def test_tools_run_in_main_process(self, executor):
+        code = dedent("""
+            result = add_numbers(2, 3)
+            """)
+        output, _, _ = executor(code)
+        assert output == 5
+
+    def test_tool_error_can_be_caught(self, executor):
+        code = dedent("""
+            try:
+                failing_tool("boom")
+            except ValueError as e:
+                message = str(e)
+            message
+            """)
+        output, _, _ = executor(code)
+        assert output == "boom"
+
+    def test_final_answer(self, executor):
+        output, _, is_final_answer = executor("final_answer(add_numbers(1, 1))")
+        assert output == 2
+        assert is_final_answer is True
+
+    def test_error_keeps_print_outputs(self, executor):
+        with pytest.raises(InterpreterError, match="ZeroDivisionError"):
+            executor("print('before')\n1 / 0")
+        assert executor.state["_print_outputs"] == "before\n"
+
+    def test_timeout_restarts_worker(self, pool):
+        executor = ProcessPoolPythonExecutor([], timeout=0.5, pool=pool)
+        executor.send_variables({"x": 1})
+        executor("y = 2")
+        worker = executor.worker
+        with pytest.raises(InterpreterError, match="time limit of 0.5 seconds"):
+            executor("for i in range(100):\n    sum(range(10**7))")
+        assert executor.worker is not worker
+        assert not worker.is_alive()
+        # Variables sent by the agent are restored, variables defined by the code are lost
+        output, _, _ = executor("x")
+        assert output == 1
+        with pytest.raises(InterpreterError, match="The variable `y` is not defined"):
+            executor("y")
+        executor.cleanup()
+
+    def test_memory_limit(self, pool):
+        executor = ProcessPoolPythonExecutor([], memory_limit_mb=512, pool=pool)
+        with pytest.raises(InterpreterError):
+            executor("data = 'a' * (1024 * 1024 * 1024)")
+        output, _, _ = executor("len('a' * 1024)")
+        assert output == 1024
+        executor.cleanup()
+
+    def test_worker_is_reused_after_cleanup(self, pool):
+        executor = ProcessPoolPythonExecutor([], pool=pool)
+        executor("a = 1")
+        worker = executor.worker
+        executor.cleanup()
+        assert len(pool) == 1
+
+        new_executor = ProcessPoolPythonExecutor([], pool=pool)
+        assert new_executor.worker is worker
+        with pytest.raises(InterpreterError, match="The variable `a` is not defined"):
+            new_executor("a")
+        new_executor.cleanup()
+
+    def test_executors_use_separate_workers(self, pool):
+        executor_1 = ProcessPoolPythonExecutor([], pool=pool)
+        executor_2 = ProcessPoolPythonExecutor([], pool=pool)
+        assert executor_1.worker is not executor_2.worker
+        executor_1("a = 1")
+        executor_2("a = 2")
+        assert executor_1("a")[0] == 1
+        assert executor_2("a")[0] == 2
+        executor_1.cleanup()
+        executor_2.cleanup()
+
+    def test_start_method(self, pool):
+        expected_start_method = "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+        assert pool.mp_context.get_start_method() == expected_start_method
+
+        spawn_pool = PythonWorkerPool(num_workers=1, mp_context="spawn")
+        try:
+            assert spawn_pool.mp_context.get_start_method() == "spawn"
+            executor = ProcessPoolPythonExecutor([], pool=spawn_pool)
+            assert executor("1 + 1")[0] == 2
+            executor.cleanup()
+        finally:
+            spawn_pool.shutdown()
@@ -2,6 +2,7 @@ from textwrap import dedent
 from unittest.mock import MagicMock, patch
 
 import docker
+import numpy as np
 import PIL.Image
 import pytest
 
@@ -59,6 +60,14 @@ class TestDockerExecutor:
         result, logs, final_answer = self.executor(code_action)
         assert "1.41421" in logs
 
+    def test_send_variables(self):
+        """Test that variables, including large buffers, are sent through the shared directory"""
+        array = np.arange(1_000_000)
+        self.executor.send_variables({"array": array, "name": "test"})
+        assert len(list(self.executor.shared_directory.iterdir())) == 2
+        result, logs, final_answer = self.executor("final_answer((int(array.sum()), name))")
+        assert result == (int(array.sum()), "test")
+
     def test_execute_output(self):
         """Test execution that returns a string"""
         code_action = 'final_answer("This is the final answer")'
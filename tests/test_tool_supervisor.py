@@ -0,0 +1,151 @@
+# coding=utf-8
+# Copyright 2024 HuggingFace Inc.
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+import asyncio
+import threading
+import time
+
+import pytest
+
+from smolagents.tool_supervisor import (
+    CircuitBreaker,
+    CircuitOpenError,
+    ToolSupervisor,
+    ToolTimeoutError,
+    is_tool_call_cancelled,
+)
+
+
+def fail():
+    raise ValueError("Tool failure")
+
+
+class TestCircuitBreaker:
+    def test_opens_after_consecutive_failures_and_recovers(self):
+        circuit_breaker = CircuitBreaker(failure_threshold=2, recovery_time=0.05)
+        circuit_breaker.record_failure()
+        circuit_breaker.record_success()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == "closed"
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == "open"
+        assert not circuit_breaker.allow_call()
+
+        time.sleep(0.05)
+        # A single trial call is allowed once the recovery time has elapsed
+        assert circuit_breaker.allow_call()
+        assert circuit_breaker.state == "half_open"
+        assert not circuit_breaker.allow_call()
+        circuit_breaker.record_failure()
+        assert circuit_breaker.state == "open"
+
+        time.sleep(0.05)
+        assert circuit_breaker.allow_call()
+        circuit_breaker.record_success()
+        assert circuit_breaker.state == "closed"
+        assert circuit_breaker.allow_call()
+
+
+class TestToolSupervisor:
+    def test_call_records_outcomes(self):
+        supervisor = ToolSupervisor(failure_threshold=2)
+        assert supervisor.call("add", lambda a, b: a + b, 1, b=2) == 3
+        for _ in range(2):
+            with pytest.raises(ValueError):
+                supervisor.call("fail", fail)
+        with pytest.raises(CircuitOpenError):
+            supervisor.call("fail", fail)
+
+        records = supervisor.pop_records()
+        assert [(record.tool_name, record.outcome, record.circuit_state) for record in records] == [
+            ("add", "success", "closed"),
+            ("fail", "error", "closed"),
+            ("fail", "error", "open"),
+            ("fail", "rejected", "open"),
+        ]
+        assert records[1].error == "ValueError: Tool failure"
+        assert supervisor.pop_records() == []
+
+    def test_invalid_arguments_do_not_open_the_circuit(self):
+        def add(a, b):
+            return a + b
+
+        supervisor = ToolSupervisor(failure_threshold=2)
+        supervised_add = supervisor.wrap("add", add)
+        for _ in range(3):
+            with pytest.raises(TypeError):
+                supervised_add(1, c=2)
+        assert supervised_add(1, b=2) == 3
+        assert [(record.outcome, record.circuit_state) for record in supervisor.pop_records()] == [
+            ("invalid_arguments", "closed"),
+            ("invalid_arguments", "closed"),
+            ("invalid_arguments", "closed"),
+            ("success", "closed"),
+        ]
+
+        # Errors raised by the tool itself still count as failures, even if they are `TypeError`s
+        def broken_tool(a):
+            raise TypeError("Tool failure")
+
+        supervised_broken_tool = supervisor.wrap("broken_tool", broken_tool)
+        for _ in range(2):
+            with pytest.raises(TypeError, match="Tool failure"):
+                supervised_broken_tool(1)
+        with pytest.raises(CircuitOpenError):
+            supervised_broken_tool(1)
+
+    def test_call_timeout_cancels_the_call(self):
+        cancelled = threading.Event()
+
+        def slow_tool():
+            while not is_tool_call_cancelled():
+                time.sleep(0.01)
+            cancelled.set()
+
+        supervisor = ToolSupervisor(timeout=5, tool_timeouts={"slow_tool": 0.05})
+        start_time = time.time()
+        with pytest.raises(ToolTimeoutError, match="timed out after 0.05 seconds"):
+            supervisor.call("slow_tool", slow_tool)
+        assert time.time() - start_time < 1
+        assert cancelled.wait(1)
+        assert not is_tool_call_cancelled()
+        [record] = supervisor.pop_records()
+        assert (record.outcome, record.timeout) == ("timeout", 0.05)
+
+    def test_call_with_timeout_returns_output_and_raises_errors(self):
+        supervisor = ToolSupervisor(timeout=1)
+        assert supervisor.call("add", lambda a, b: a + b, 1, 2) == 3
+        with pytest.raises(ValueError, match="Tool failure"):
+            supervisor.call("fail", fail)
+
+    def test_acall_cancels_async_tools(self):
+        cancelled = []
+
+        async def slow_tool():
+            try:
+                await asyncio.sleep(5)
+            except asyncio.CancelledError:
+                cancelled.append(True)
+                raise
+
+        supervisor = ToolSupervisor(timeout=0.05)
+        with pytest.raises(ToolTimeoutError):
+            asyncio.run(supervisor.acall("slow_tool", slow_tool))
+        assert cancelled == [True]
+
+        async def add(a, b):
+            return a + b
+
+        assert asyncio.run(supervisor.acall("add", add, 1, b=2)) == 3
+        assert [record.outcome for record in supervisor.pop_records()] == ["timeout", "success"]
@@ -12,7 +12,9 @@
 # WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
 # See the License for the specific language governing permissions and
 # limitations under the License.
+import asyncio
 import os
+import threading
 from textwrap import dedent
 from typing import Any, Dict, List, Optional, Tuple
 from unittest.mock import MagicMock, patch
@@ -477,6 +479,120 @@ class TestTool:
         # Check that the input is marked as nullable in the code
         assert "'nullable': True" in result["code"]
 
+    def test_async_tool(self):
+        @tool
+        async def get_weather(location: str) -> str:
+            """
+            Get the weather at a given location.
+
+            Args:
+                location: The location.
+            """
+            import asyncio
+
+            await asyncio.sleep(0)
+            return f"Sunny in {location}"
+
+        assert asyncio.run(get_weather.acall(location="Paris")) == "Sunny in Paris"
+        assert asyncio.run(get_weather.acall({"location": "Paris"}, sanitize_inputs_outputs=True)) == "Sunny in Paris"
+        # Async tools can also be called from synchronous code
+        assert get_weather(location="Paris") == "Sunny in Paris"
+        assert "async def forward(self, location: str) -> str:" in get_weather.to_dict()["code"]
+
+    def test_sync_tool_acall_runs_in_thread(self):
+        class GetThreadTool(Tool):
+            name = "get_thread"
+            description = "Returns the identifier of the thread running the tool."
+            inputs = {}
+            output_type = "integer"
+
+            def forward(self):
+                return threading.get_ident()
+
+        assert asyncio.run(GetThreadTool().acall()) != threading.get_ident()
+
+    def test_cacheable_tool_caches_outputs(self):
+        class RandomNumberTool(Tool):
+            name = "random_number"
+            description = "Returns a random number, to check whether forward is run again."
+            inputs = {"seed": {"type": "integer", "description": "A seed."}}
+            output_type = "number"
+            cacheable = True
+
+            def forward(self, seed: int):
+                import random
+
+                return random.random()
+
+        random_number = RandomNumberTool()
+        output = random_number(seed=1)
+        assert random_number(seed=1) == output
+        assert random_number(1) == output
+        assert random_number({"seed": 1}, sanitize_inputs_outputs=True) == output
+        assert random_number(seed=2) != output
+        assert (random_number.cache_hit_count, random_number.cache_miss_count) == (3, 2)
+        assert "cacheable = True" in random_number.to_dict()["code"]
+
+    @pytest.mark.parametrize("cache_type", ["directory", "memory"])
+    def test_tool_decorator_with_cache(self, tmp_path, cache_type):
+        from smolagents.cache import DirectoryCache, MemoryCache
+
+        forward_calls = []
+        cache = DirectoryCache(tmp_path) if cache_type == "directory" else MemoryCache()
+
+        @tool(cache=cache)
+        def double(number: int) -> int:
+            """
+            Doubles a number.
+
+            Args:
+                number: The number.
+            """
+            forward_calls.append(number)
+            return 2 * number
+
+        assert double.cacheable is True
+        assert double(number=2) == double(number=2) == 4
+        assert forward_calls == [2]
+        assert double.cache is cache
+        assert double.cache_hit_count == 1
+        if cache_type == "directory":
+            assert len(list(tmp_path.glob("*.json"))) == 1
+        else:
+            assert len(cache) == 1
+        assert "cacheable: bool = True" in double.__source__
+
+    def test_cacheable_tool_does_not_cache_calls_without_json_inputs_or_outputs(self):
+        class ImageSizeTool(Tool):
+            name = "image_size"
+            description = "Returns the size of an image."
+            inputs = {"image": {"type": "image", "description": "An image."}}
+            output_type = "array"
+            cacheable = True
+
+            def forward(self, image):
+                return image.size
+
+        image_size = ImageSizeTool()
+        image = PIL.Image.new("RGB", (4, 2))
+        assert image_size(image) == image_size(image) == (4, 2)
+        assert (image_size.cache_hit_count, image_size.cache_miss_count) == (0, 0)
+
+        class PairTool(Tool):
+            name = "pair"
+            description = "Returns a pair."
+            inputs = {"number": {"type": "integer", "description": "A number."}}
+            output_type = "array"
+            cacheable = True
+
+            def forward(self, number: int):
+                return (number, number)
+
+        pair = PairTool()
+        # A tuple would be returned as a list from the cache, so it is not cached
+        assert pair(1) == pair(1) == (1, 1)
+        assert (pair.cache_hit_count, pair.cache_miss_count) == (0, 2)
+
 
 @pytest.fixture
 def mock_server_parameters():
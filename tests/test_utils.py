@@ -16,13 +16,23 @@ import inspect
 import os
 import textwrap
 import unittest
+from unittest.mock import patch
 
+import PIL.Image
 import pytest
 from IPython.core.interactiveshell import InteractiveShell
 
 from smolagents import Tool
 from smolagents.tools import tool
-from smolagents.utils import get_source, instance_to_source, is_valid_name, parse_code_blobs, parse_json_blob
+from smolagents.utils import (
+    encode_image_base64,
+    get_complete_code_statements,
+    get_source,
+    instance_to_source,
+    is_valid_name,
+    parse_code_blobs,
+    parse_json_blob,
+)
 
 
 class ValidTool(Tool):
@@ -462,6 +472,31 @@ def test_parse_json_blob_with_valid_json(raw_json, expected_data, expected_blob)
     assert blob == expected_blob
 
 
+@pytest.mark.parametrize(
+    "text, expected_statements, expected_is_closed",
+    [
+        ("Thought: I will search", [], False),
+        ("Code:\n```py\nimport math\nresult = web_sea", [], False),
+        ("Code:\n```py\nimport math\nresult = web_search(\n", ["import math"], False),
+        (
+            "Code:\n```py\nimport math\nresult = web_search(\n    'query'\n)\nprint(result)\n",
+            ["import math", "result = web_search(\n    'query'\n)"],
+            False,
+        ),
+        ("Code:\n```py\nif a:\n    b = 1\nelse:\n    b = 2\n", [], False),
+        ("Code:\n```py\nif a:\n    b = 1\nelse:\n    b = 2\nc = b\n", ["if a:\n    b = 1\nelse:\n    b = 2"], False),
+        ("Code:\n```py\n@cache\ndef f():\n    pass\n", [], False),
+        ("Code:\n```py\n@cache\ndef f():\n    pass\nf()\n", ["@cache\ndef f():\n    pass"], False),
+        ("Code:\n```py\na = 1\nfinal_answer(a)\n```<end_code>", ["a = 1", "final_answer(a)"], True),
+        ("Code:\n```py\na = (1\n```<end_code>", [], True),
+    ],
+)
+def test_get_complete_code_statements(text, expected_statements, expected_is_closed):
+    statements, is_closed = get_complete_code_statements(text)
+    assert statements == expected_statements
+    assert is_closed == expected_is_closed
+
+
 @pytest.mark.parametrize(
     "raw_json",
     [
@@ -506,3 +541,15 @@ def test_parse_json_blob_with_invalid_json(raw_json):
 def test_is_valid_name(name, expected):
     """Test the is_valid_name function with various inputs."""
     assert is_valid_name(name) is expected
+
+
+def test_encode_image_base64_is_cached_per_image():
+    image = PIL.Image.new("RGB", (8, 8), color="blue")
+    encoded_image = encode_image_base64(image)
+    with patch.object(PIL.Image.Image, "save") as mock_save:
+        assert encode_image_base64(image) == encoded_image
+        mock_save.assert_not_called()
+        encode_image_base64(image, format="JPEG")
+        mock_save.assert_called_once()
+    # Another image with the same content is encoded to the same value
+    assert encode_image_base64(image.copy()) == encoded_image